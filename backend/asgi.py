@@ -13,4 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# بعد get_asgi_application حتى تكون إعدادات Django جاهزة
+from face.streaming import STREAM_PATH, face_stream_app  # noqa: E402
+from face.warmup import preload  # noqa: E402
+
+# FACE_ANALYSIS['PRELOAD']: تحميل المكتبات الثقيلة الآن بدل أول طلب (face/warmup.py)
+preload()
+
+
+async def application(scope, receive, send):
+    # WebSocket البث المباشر لتحليل الوجه؛ باقي الطلبات لـ Django
+    if scope["type"] == "websocket" and scope["path"] == STREAM_PATH:
+        return await face_stream_app(scope, receive, send)
+    return await django_application(scope, receive, send)
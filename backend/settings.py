@@ -195,4 +195,67 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# ------------------------------
+# Cache
+# LocMemCache يحذف الأقدم استخدامًا (LRU) عند تجاوز MAX_ENTRIES؛
+# في الإنتاج مع عدة عمليات يفضّل Redis/Memcached لمشاركة الكاش
+# ------------------------------
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "face-analysis": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "face-analysis",
+        "TIMEOUT": 60 * 60,            # ثواني
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
+
+
+# ------------------------------
+# Face analysis pipeline (face/conf.py يحتوي القيم الافتراضية)
+# ------------------------------
+FACE_ANALYSIS = {
+    "POOL_MODE": "queue",      # "queue" أو "process"
+    "POOL_SIZE": os.cpu_count() or 1,
+    "POOL_TIMEOUT": 30.0,
+    "LANDMARK_BACKEND": "mediapipe",   # أو "onnx" مع ONNX_MODEL_PATH
+    "ONNX_MODEL_PATH": None,
+    "ONNX_DETECTOR_MODEL_PATH": None,
+    "ONNX_IRIS_MODEL_PATH": None,
+    "ONNX_INTRA_OP_THREADS": None,
+    "ONNX_INTER_OP_THREADS": 1,
+    "MAX_IMAGE_SIDE": 1280,
+    "QUALITY_CHECKS": False,   # True لرفض الصور الضبابية/المظلمة/الوضعيات الجانبية مبكرًا
+    "CACHE_ALIAS": "face-analysis",    # من CACHES أعلاه؛ None = بدون كاش
+    "SERVER_TIMING": False,    # True لإضافة ترويسة Server-Timing (تكشف أزمنة المراحل الداخلية)
+    "METRICS_TOKEN": os.environ.get("FACE_METRICS_TOKEN"),
+    "STREAM_MAX_SESSIONS": os.cpu_count() or 1,
+    "STREAM_SMOOTHING": 0.3,
+    "STREAM_WIDTH_STEP_CM": 0.1,
+    "STREAM_SKIN_TONE_EVERY": 10,
+    "STREAM_MAX_FRAME_BYTES": 1024 * 1024,
+    "MAX_FACES": 5,
+    "BATCH_MAX_IMAGES": 16,
+    "BATCH_WORKERS": os.cpu_count() or 1,
+    "PRELOAD": None,           # "imports" مع gunicorn --preload، أو "full" بدون fork
+    "CLIENT_PATCH_MAX_BYTES": 32 * 1024,
+    "CLIENT_PATCH_MAX_SIDE": 128,
+}
+
+
+# ------------------------------
+# التوصيات وفهرس الكتالوج (glasses/conf.py يحتوي القيم الافتراضية)
+# ------------------------------
+GLASSES_RECOMMENDER = {
+    "CATALOG_INDEX": True,
+    "CATALOG_VERSION_CACHE_ALIAS": "default",   # LocMem لا يُشارك بين العمليات
+    "RANKING_CACHE_ALIAS": "default",
+    "RANKING_SNAPSHOT_TTL": 5 * 60,             # ثواني
+    "RESULT_CACHE_ALIAS": "default",            # None = بدون كاش للنتائج
+    "RESULT_CACHE_TTL": 10 * 60,                # ثواني
+    "RECOMMENDATION_BUCKETS": True,
+}
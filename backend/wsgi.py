@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# FACE_ANALYSIS['PRELOAD']: تحميل المكتبات الثقيلة الآن بدل أول طلب (face/warmup.py)
+from face.warmup import preload  # noqa: E402
+
+preload()
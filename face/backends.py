@@ -0,0 +1,271 @@
+# face/backends.py
+"""
+Backends استخراج الملامح. كل backend يأخذ صورة RGB ويعيد قائمة مصفوفات
+(478, 3) بإحداثيات x, y معيارية (0..1) و z بوحدة عرض الصورة، بنفس ترتيب نقاط
+MediaPipe FaceMesh مع refine_landmarks (468 للوجه + 5 لكل قزحية).
+"""
+import os
+
+import cv2
+import numpy as np
+from django.core.exceptions import ImproperlyConfigured
+
+from .conf import face_setting
+
+
+FACE_MESH_OPTIONS = {
+    "static_image_mode": True,
+    "max_num_faces": 1,
+    "refine_landmarks": True,
+    "min_detection_confidence": 0.5,
+}
+
+
+def landmarks_to_array(results):
+    """
+    يحوّل نتيجة FaceMesh إلى قائمة مصفوفات (478, 3) بإحداثيات x, y, z المعيارية،
+    وجه لكل عنصر. المصفوفات قابلة للـ pickle فتعبر حدود العمليات بسهولة.
+    """
+    if not results.multi_face_landmarks:
+        return []
+    return [
+        np.array([(p.x, p.y, p.z) for p in face.landmark], dtype=np.float64)
+        for face in results.multi_face_landmarks
+    ]
+
+
+class LandmarkBackend:
+    """الواجهة المشتركة: process(rgb) → قائمة مصفوفات (478, 3)؛ close() يحرر الموارد."""
+
+    name = None
+
+    def process(self, rgb):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MediaPipeBackend(LandmarkBackend):
+    name = "mediapipe"
+
+    def __init__(self, **options):
+        # mediapipe يسحب matplotlib وغيرها (~1 ثانية): تُستورد مع أول نسخة فقط
+        import mediapipe as mp
+
+        self.options = {**FACE_MESH_OPTIONS, **options}
+        self._mesh = mp.solutions.face_mesh.FaceMesh(**self.options)
+
+    def process(self, rgb):
+        return landmarks_to_array(self._mesh.process(rgb))
+
+    def close(self):
+        self._mesh.close()
+
+
+# ------------------------------
+# ONNX Runtime
+# ------------------------------
+# زوايا كل عين لقص رقعة القزحية: الثانية تُقلب أفقيًا لأن النموذج مدرّب على عين واحدة
+IRIS_EYES = ((33, 133), (362, 263))
+
+FACE_ROI_SCALE = 1.5
+IRIS_ROI_SCALE = 2.3
+DETECTION_NMS_THRESHOLD = 0.3
+
+
+def _blazeface_anchors(input_size=128):
+    """مراكز مراسي BlazeFace short-range (896، بترتيب مخرجات النموذج) بإحداثيات 0..1."""
+    anchors = []
+    for stride, per_cell in ((8, 2), (16, 6)):
+        n = input_size // stride
+        ys, xs = np.mgrid[0:n, 0:n]
+        centers = np.stack([(xs + 0.5) / n, (ys + 0.5) / n], axis=-1).reshape(-1, 2)
+        anchors.append(np.repeat(centers, per_cell, axis=0))
+    return np.concatenate(anchors)
+
+
+def _roi_transform(center, size, angle, out_size, flip=False):
+    """مصفوفة affine (2, 3): من الصورة إلى رقعة مربعة out_size × out_size مدوّرة بـ angle درجة."""
+    cx, cy = center
+    m = cv2.getRotationMatrix2D((float(cx), float(cy)), float(angle), out_size / size)
+    m[:, 2] += (out_size / 2 - cx, out_size / 2 - cy)
+    if flip:
+        m = np.array([[-1.0, 0.0, out_size], [0.0, 1.0, 0.0]]) @ np.vstack([m, (0.0, 0.0, 1.0)])
+    return m
+
+
+def _eye_angle(px, a, b):
+    dx, dy = px[b, :2] - px[a, :2]
+    return np.degrees(np.arctan2(dy, dx))
+
+
+class OnnxLandmarkBackend(LandmarkBackend):
+    """
+    نفس مراحل MediaPipe FaceMesh لكن بنماذج ONNX عبر onnxruntime (مثل
+    face_detection_short_range و face_landmark و iris_landmark بعد تحويلها، أو نسخ
+    مكمّمة منها):
+      كشف BlazeFace → ملامح على ROI الكشف (مدوّر حسب العينين) → قزحيتان على رقعتي
+      العينين إذا أخرج نموذج الوجه 468 نقطة فقط.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path=None, detector_model_path=None, iris_model_path=None, max_num_faces=1,
+                 min_detection_confidence=0.5, intra_op_threads=None, inter_op_threads=None):
+        model_path = model_path or face_setting("ONNX_MODEL_PATH")
+        detector_model_path = detector_model_path or face_setting("ONNX_DETECTOR_MODEL_PATH")
+        iris_model_path = iris_model_path or face_setting("ONNX_IRIS_MODEL_PATH")
+        if not (model_path and detector_model_path):
+            raise ImproperlyConfigured(
+                "FACE_ANALYSIS['ONNX_MODEL_PATH'] and ['ONNX_DETECTOR_MODEL_PATH'] are required for the onnx backend"
+            )
+        for path in filter(None, (model_path, detector_model_path, iris_model_path)):
+            if not os.path.isfile(path):
+                raise ImproperlyConfigured(f"ONNX model not found: {path}")
+
+        # بعد التحقق من الإعدادات: خطأ الإعداد لا يحتاج onnxruntime مثبتًا
+        import onnxruntime as ort
+
+        if intra_op_threads is None:
+            intra_op_threads = face_setting("ONNX_INTRA_OP_THREADS")
+        if intra_op_threads is None:
+            # عدة جلسات تعمل معًا في الـ pool: نوزع الأنوية عليها بدل أن تتنافس
+            intra_op_threads = max(1, (os.cpu_count() or 1) // face_setting("POOL_SIZE"))
+        if inter_op_threads is None:
+            inter_op_threads = face_setting("ONNX_INTER_OP_THREADS")
+
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = intra_op_threads
+        so.inter_op_num_threads = inter_op_threads
+        # النماذج سلاسل طبقات: لا فائدة من التوازي بين العقد
+        so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # بدون انتظار نشط للخيوط بين الطلبات (الجلسات كثيرة والطلبات متقطعة)
+        so.add_session_config_entry("session.intra_op.allow_spinning", "0")
+
+        self.max_num_faces = max_num_faces
+        self.min_detection_confidence = min_detection_confidence
+        self._detector = self._load(ort, so, detector_model_path)
+        self._face = self._load(ort, so, model_path)
+        self._iris = self._load(ort, so, iris_model_path) if iris_model_path else None
+        self._anchors = _blazeface_anchors(self._detector.input_size)
+
+        points = int(np.prod(self._face.get_outputs()[0].shape[1:])) // 3
+        if points < 478 and self._iris is None:
+            raise ImproperlyConfigured(
+                f"ONNX face model gives {points} landmarks; set FACE_ANALYSIS['ONNX_IRIS_MODEL_PATH'] "
+                "to add the iris points"
+            )
+        self._face_points = min(points, 478)
+
+    @staticmethod
+    def _load(ort, so, path):
+        session = ort.InferenceSession(path, so, providers=["CPUExecutionProvider"])
+        # مدخل NHWC مربع كما في نماذج MediaPipe
+        _, height, width, channels = session.get_inputs()[0].shape
+        if channels != 3 or height != width:
+            raise ImproperlyConfigured(f"{path}: expected a square NHWC RGB input, got {session.get_inputs()[0].shape}")
+        session.input_size = int(width)
+        session.input_name = session.get_inputs()[0].name
+        return session
+
+    def _run(self, session, rgb, m, value_range=(0.0, 1.0)):
+        n = session.input_size
+        crop = cv2.warpAffine(rgb, m, (n, n), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        low, high = value_range
+        tensor = crop.astype(np.float32)[None]
+        tensor *= (high - low) / 255.0
+        tensor += low
+        return session.run(None, {session.input_name: tensor})
+
+    @staticmethod
+    def _to_image(m, points, crop_scale):
+        """نقاط الرقعة (N, 2|3) → بكسلات الصورة؛ z بنفس مقياس x."""
+        inv = cv2.invertAffineTransform(m)
+        xy = points[:, :2] @ inv[:, :2].T + inv[:, 2]
+        if points.shape[1] == 2:
+            return xy
+        return np.column_stack([xy, points[:, 2] * crop_scale])
+
+    # ---------- مراحل ----------
+    def _detect(self, rgb):
+        """ROI لكل وجه [(center, size, angle)] ببكسلات الصورة، الأعلى ثقة أولًا."""
+        h, w = rgb.shape[:2]
+        n = self._detector.input_size
+        # letterbox: الصورة كاملة داخل مربع n×n بدون تشويه النسبة
+        m = _roi_transform((w / 2, h / 2), max(w, h), 0.0, n)
+        regressors, scores = self._run(self._detector, rgb, m, value_range=(-1.0, 1.0))
+
+        scores = 1.0 / (1.0 + np.exp(-np.clip(scores.reshape(-1).astype(np.float64), -100.0, 100.0)))
+        keep = np.flatnonzero(scores >= self.min_detection_confidence)
+        if not len(keep):
+            return []
+        raw = regressors.reshape(len(scores), -1)[keep] / n
+        anchors = self._anchors[keep]
+        centers = raw[:, 0:2] + anchors
+        sizes = raw[:, 2:4]
+        # النقاط 0 و 1: العين اليمنى ثم اليسرى (للشخص)
+        eyes = raw[:, 4:8].reshape(-1, 2, 2) + anchors[:, None, :]
+
+        boxes = np.column_stack([centers - sizes / 2, sizes]) * n
+        order = cv2.dnn.NMSBoxes(boxes.tolist(), scores[keep].tolist(),
+                                 self.min_detection_confidence, DETECTION_NMS_THRESHOLD)
+        rois = []
+        for i in np.asarray(order).reshape(-1)[:self.max_num_faces]:
+            center = self._to_image(m, centers[i:i + 1] * n, 1.0)[0]
+            eye_px = self._to_image(m, eyes[i] * n, 1.0)
+            size = sizes[i].max() * max(w, h) * FACE_ROI_SCALE
+            rois.append((center, size, _eye_angle(eye_px, 0, 1)))
+        return rois
+
+    def _face_pass(self, rgb, center, size, angle):
+        n = self._face.input_size
+        m = _roi_transform(center, size, angle, n)
+        outputs = self._run(self._face, rgb, m)
+        points = outputs[0].reshape(-1, 3)[:self._face_points].astype(np.float64)
+        presence = 1.0 / (1.0 + np.exp(-float(outputs[1].ravel()[0]))) if len(outputs) > 1 else 1.0
+        return self._to_image(m, points, size / n), presence
+
+    def _iris_points(self, rgb, px):
+        n = self._iris.input_size
+        irises = []
+        for k, (a, b) in enumerate(IRIS_EYES):
+            size = np.linalg.norm(px[b, :2] - px[a, :2]) * IRIS_ROI_SCALE
+            flip = k == 1
+            m = _roi_transform((px[a, :2] + px[b, :2]) / 2, size, _eye_angle(px, a, b), n, flip=flip)
+            iris = self._run(self._iris, rgb, m)[-1].reshape(5, 3).astype(np.float64)
+            if flip:
+                # القلب الأفقي يعكس ترتيب النقطتين الجانبيتين
+                iris = iris[[0, 3, 2, 1, 4]]
+            irises.append(self._to_image(m, iris, size / n))
+        return np.vstack(irises)
+
+    def process(self, rgb):
+        h, w = rgb.shape[:2]
+        faces = []
+        for center, size, angle in self._detect(rgb):
+            px, presence = self._face_pass(rgb, center, size, angle)
+            if presence < self.min_detection_confidence:
+                continue
+            if len(px) < 478:
+                px = np.vstack([px, self._iris_points(rgb, px)])
+            faces.append(px / (w, h, w))
+        return faces
+
+
+BACKENDS = {
+    MediaPipeBackend.name: MediaPipeBackend,
+    OnnxLandmarkBackend.name: OnnxLandmarkBackend,
+}
+
+
+def create_backend(name=None, **options):
+    name = name or face_setting("LANDMARK_BACKEND")
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"FACE_ANALYSIS['LANDMARK_BACKEND'] must be one of {sorted(BACKENDS)}, got {name!r}"
+        )
+    return backend_class(**options)
@@ -0,0 +1,61 @@
+# face/cache.py
+import hashlib
+import json
+
+from django.core.cache import caches
+
+from .conf import face_setting
+from .pipeline import PIPELINE_VERSION
+from .timing import stage
+
+
+CACHE_HEADER = "X-Face-Cache"
+
+# إعدادات FACE_ANALYSIS التي تغيّر النتيجة: تغيير أي منها لا يعيد نتائج محسوبة قبله
+OUTPUT_SETTINGS = (
+    "QUALITY_CHECKS", "QUALITY_MIN_SHARPNESS", "QUALITY_MAX_DARK_FRACTION", "QUALITY_MAX_CLIPPED_FRACTION",
+    "QUALITY_MAX_YAW", "QUALITY_MAX_PITCH",
+    "MAX_IMAGE_SIDE",
+    "LANDMARK_BACKEND", "ONNX_MODEL_PATH", "ONNX_DETECTOR_MODEL_PATH", "ONNX_IRIS_MODEL_PATH",
+)
+
+
+def settings_digest():
+    """بصمة قصيرة لقيم OUTPUT_SETTINGS الحالية."""
+    values = json.dumps([face_setting(name) for name in OUTPUT_SETTINGS], default=str)
+    return hashlib.sha256(values.encode()).hexdigest()[:12]
+
+
+def content_key(data, variant=None):
+    """
+    مفتاح الكاش: بصمة SHA-256 لبايتات الصورة + نسخة خط التحليل + بصمة الإعدادات المؤثرة
+    في النتيجة (+ نوع التحليل إن وُجد).
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    key = f"face-analysis:v{PIPELINE_VERSION}:{settings_digest()}:{digest}"
+    return f"{key}:{variant}" if variant else key
+
+
+def get_result_cache():
+    alias = face_setting("CACHE_ALIAS")
+    return caches[alias] if alias else None
+
+
+def cached_analysis(data, analyze, variant=None):
+    """
+    يعيد (payload, hit). عند عدم وجود النتيجة تُحسب بـ analyze(data) وتُخزن
+    (الأخطاء لا تُخزن، فصورة فشلت بسبب الضغط يمكن إعادة محاولتها).
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return analyze(data), False
+
+    with stage("cache"):
+        key = content_key(data, variant)
+        payload = cache.get(key)
+    if payload is not None:
+        return payload, True
+
+    payload = analyze(data)
+    cache.set(key, payload)
+    return payload, False
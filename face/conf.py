@@ -0,0 +1,68 @@
+# face/conf.py
+import os
+
+from django.conf import settings
+
+
+# ------------------------------
+# الإعدادات الافتراضية لخط تحليل الوجه
+# تُدمج مع settings.FACE_ANALYSIS (بنفس أسلوب SIMPLE_JWT)
+# ------------------------------
+DEFAULTS = {
+    # "queue": نسخ FaceMesh داخل نفس العملية تُستعار من طابور محدود
+    # "process": كل نسخة تعيش في عملية مستقلة (ProcessPoolExecutor)
+    "POOL_MODE": "queue",
+    "POOL_SIZE": os.cpu_count() or 1,
+    # أقصى مدة انتظار (ثواني) لاستعارة نسخة قبل رفض الطلب
+    "POOL_TIMEOUT": 30.0,
+    # backend الملامح: "mediapipe" أو "onnx" (face/backends.py)
+    "LANDMARK_BACKEND": "mediapipe",
+    # نماذج ONNX (NHWC): الملامح (468 أو 478 نقطة)، كاشف BlazeFace، والقزحية إن لزم
+    "ONNX_MODEL_PATH": None,
+    "ONNX_DETECTOR_MODEL_PATH": None,
+    "ONNX_IRIS_MODEL_PATH": None,
+    # None = أنوية الجهاز ÷ POOL_SIZE (كل نسخة في الـ pool لها جلسة)
+    "ONNX_INTRA_OP_THREADS": None,
+    "ONNX_INTER_OP_THREADS": 1,
+    # أقصى ضلع (بكسل) للصورة قبل FaceMesh؛ None = بدون تصغير
+    "MAX_IMAGE_SIDE": 1280,
+    # فحص الجودة قبل FaceMesh (face/quality.py) ووضعية الرأس بعده. اختياري: العتبات أدناه
+    # لم تُعاير على صور مستخدمين حقيقية، فتُفعّل بعد قياس نسبة الرفض على عينة من الإنتاج
+    "QUALITY_CHECKS": False,
+    "QUALITY_MIN_SHARPNESS": 60.0,          # تباين Laplacian على نسخة 256px
+    "QUALITY_MAX_DARK_FRACTION": 0.85,      # نسبة البكسلات الأغمق من 40
+    "QUALITY_MAX_CLIPPED_FRACTION": 0.4,    # نسبة البكسلات المشبعة (>= 246)
+    "QUALITY_MAX_YAW": 20.0,                # درجات؛ أكثر من ذلك يغيّر عرض الوجه المقاس
+    "QUALITY_MAX_PITCH": 25.0,
+    # كاش النتائج حسب بصمة الصورة (اسم من settings.CACHES؛ None = معطل)
+    # المدة (TIMEOUT) وحد الحجم (MAX_ENTRIES) يُضبطان في CACHES نفسها
+    "CACHE_ALIAS": "face-analysis",
+    # ترويسة Server-Timing بأزمنة المراحل (اختيارية؛ تكشف تفاصيل داخلية)
+    "SERVER_TIMING": False,
+    # /api/face/metrics/: للمدير، أو لمن يرسل X-Metrics-Token بهذه القيمة (None = للمدير فقط)
+    "METRICS_TOKEN": None,
+    # البث المباشر /ws/face/stream/ (face/streaming.py)
+    "STREAM_MAX_SESSIONS": os.cpu_count() or 1,
+    "STREAM_SMOOTHING": 0.3,          # معامل التنعيم الأسي (1 = بدون تنعيم)
+    "STREAM_WIDTH_STEP_CM": 0.1,      # أقل تغير في العرض يستحق رسالة جديدة
+    "STREAM_SKIN_TONE_EVERY": 10,     # إعادة حساب لون البشرة كل N إطار
+    "STREAM_MAX_FRAME_BYTES": 1024 * 1024,    # أكبر رسالة إطار؛ الأكبر يغلق الاتصال قبل فك الترميز
+    # وضع الوجوه المتعددة في analyze-face (max_faces > 1): السقف الأعلى لكل صورة.
+    # له pool مستقل بهذا السقف (يُنشأ عند أول طلب متعدد)؛ التحليل العادي يبقى على max_num_faces=1
+    "MAX_FACES": 5,
+    # نقطة /api/face/analyze-batch/
+    "BATCH_MAX_IMAGES": 16,
+    "BATCH_WORKERS": os.cpu_count() or 1,
+    # تحميل مسبق من wsgi/asgi: None، "imports" (آمن قبل fork)، أو "full" (+ نسخ الـ pool)
+    "PRELOAD": None,
+    # وضع الملامح من العميل: حدود رقع الجلد المرفقة (بعد فك base64)
+    "CLIENT_PATCH_MAX_BYTES": 32 * 1024,
+    "CLIENT_PATCH_MAX_SIDE": 128,
+}
+
+
+def face_setting(name):
+    user_settings = getattr(settings, "FACE_ANALYSIS", {})
+    if name in user_settings:
+        return user_settings[name]
+    return DEFAULTS[name]
@@ -0,0 +1,116 @@
+# face/fuzzy.py
+import numpy as np
+
+
+EPS = 1e-6
+
+FACE_SHAPES = ('Square', 'Round', 'Oval', 'Oblong', 'Heart', 'Triangle', 'Diamond')
+
+# النِسَب التي يعتمد عليها التصنيف (أعمدة مصفوفة features)
+FEATURES = ('ar', 'jw_fw', 'cb_fw', 'cb_jw')
+
+# ------------------------------
+# دوال الانتماء: (الاسم، النسبة، النوع، المعاملات)
+# trap: (a, b, c, d) شبه منحرف، gauss: (mu, sigma)
+# ------------------------------
+MEMBERSHIPS = (
+    ('ar_short',        'ar',    'trap',  (0.80, 0.90, 1.05, 1.15)),
+    ('ar_medium',       'ar',    'trap',  (1.05, 1.20, 1.35, 1.50)),
+    ('ar_tall',         'ar',    'trap',  (1.35, 1.55, 1.80, 2.10)),
+    ('ar_round',        'ar',    'gauss', (1.0, 0.06)),
+    ('jw_eq_fw',        'jw_fw', 'gauss', (1.0, 0.08)),
+    ('jw_gt_fw',        'jw_fw', 'trap',  (1.05, 1.12, 1.40, 1.80)),
+    ('jw_lt_fw',        'jw_fw', 'trap',  (0.55, 0.70, 0.92, 0.98)),
+    ('cb_prom_over_fw', 'cb_fw', 'trap',  (1.05, 1.12, 1.40, 1.80)),
+    ('cb_prom_over_jw', 'cb_jw', 'trap',  (1.05, 1.12, 1.40, 1.80)),
+)
+
+# ------------------------------
+# أوزان القواعد لكل شكل؛ "not_x" تعني (1 - x)
+# ------------------------------
+RULES = {
+    'Square':   {'ar_short': 0.45, 'jw_eq_fw': 0.35, 'not_cb_prom_over_fw': 0.20},
+    'Round':    {'ar_round': 0.50, 'jw_eq_fw': 0.25, 'cb_prom_over_fw': 0.25},
+    'Oval':     {'ar_medium': 0.55, 'jw_eq_fw': 0.25, 'cb_prom_over_fw': 0.20},
+    'Oblong':   {'ar_tall': 0.70, 'jw_eq_fw': 0.15, 'not_cb_prom_over_fw': 0.15},
+    'Heart':    {'ar_medium': 0.45, 'jw_lt_fw': 0.40, 'cb_prom_over_fw': 0.15},
+    'Triangle': {'ar_medium': 0.45, 'jw_gt_fw': 0.40, 'not_cb_prom_over_fw': 0.15},
+    'Diamond':  {'ar_medium': 0.40, 'cb_prom_over_fw': 0.30, 'cb_prom_over_jw': 0.20, 'jw_eq_fw': 0.10},
+}
+
+
+def trapmf(x, a, b, c, d):
+    rise = (x - a) / np.maximum(b - a, EPS)
+    fall = (d - x) / np.maximum(d - c, EPS)
+    return np.clip(np.minimum(rise, fall), 0.0, 1.0)
+
+
+def gaussmf(x, mu, sigma):
+    return np.exp(-0.5 * ((x - mu) / (sigma + EPS)) ** 2)
+
+
+def shape_features(face_height_cm, face_width_cm, jaw_w, forehead_w):
+    """النِسَب الأربع بترتيب FEATURES، مصفوفة (B, 4)."""
+    face_height_cm, face_width_cm, jaw_w, forehead_w = (
+        np.asarray(v, dtype=np.float64) for v in (face_height_cm, face_width_cm, jaw_w, forehead_w)
+    )
+    ar    = face_height_cm / np.maximum(face_width_cm, EPS)
+    jw_fw = jaw_w          / np.maximum(forehead_w, EPS)
+    cb_fw = face_width_cm  / np.maximum(forehead_w, EPS)
+    cb_jw = face_width_cm  / np.maximum(jaw_w, EPS)
+    return np.stack([ar, jw_fw, cb_fw, cb_jw], axis=-1).reshape(-1, len(FEATURES))
+
+
+class FuzzyShapeClassifier:
+    """
+    مصنّف شكل الوجه الضبابي: الجداول تُحوَّل مرة واحدة إلى مصفوفات معاملات
+    ومصفوفة أوزان، والتصنيف لوجه أو دفعة = دوال انتماء متجهة × الأوزان ثم تطبيع و argmax.
+    """
+
+    def __init__(self, memberships=MEMBERSHIPS, rules=RULES, shapes=FACE_SHAPES):
+        self.shapes = tuple(shapes)
+
+        trap = [(FEATURES.index(f), p) for _, f, kind, p in memberships if kind == 'trap']
+        gauss = [(FEATURES.index(f), p) for _, f, kind, p in memberships if kind == 'gauss']
+        self._trap_feature = np.array([i for i, _ in trap], dtype=np.intp)
+        self._trap_params = np.array([p for _, p in trap], dtype=np.float64).reshape(-1, 4).T
+        self._gauss_feature = np.array([i for i, _ in gauss], dtype=np.intp)
+        self._gauss_params = np.array([p for _, p in gauss], dtype=np.float64).reshape(-1, 2).T
+        # ترتيب الأعمدة بعد الحساب: كل trap ثم كل gauss، ثم المتممات (1 - x)
+        self.membership_names = (
+            [name for name, _, kind, _ in memberships if kind == 'trap']
+            + [name for name, _, kind, _ in memberships if kind == 'gauss']
+        )
+        self.membership_names += [f"not_{name}" for name in self.membership_names]
+
+        self.weights = np.zeros((len(self.membership_names), len(self.shapes)))
+        for col, shape in enumerate(self.shapes):
+            for term, weight in rules[shape].items():
+                if term not in self.membership_names:
+                    raise ValueError(f"Unknown membership {term!r} in rule for {shape}")
+                self.weights[self.membership_names.index(term), col] = weight
+
+    def memberships(self, features):
+        """(B, 4) → (B, 2K) درجات الانتماء ومتمماتها."""
+        features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURES))
+        m = np.concatenate([
+            trapmf(features[:, self._trap_feature], *self._trap_params),
+            gaussmf(features[:, self._gauss_feature], *self._gauss_params),
+        ], axis=1)
+        return np.concatenate([m, 1.0 - m], axis=1)
+
+    def scores(self, features):
+        """(B, 4) → (B, 7) درجات مُطبّعة بترتيب self.shapes."""
+        raw = self.memberships(features) @ self.weights
+        return raw / (raw.sum(axis=1, keepdims=True) + EPS)
+
+    def classify(self, features):
+        """(أسماء الأشكال، مصفوفة الدرجات الكاملة)."""
+        scores = self.scores(features)
+        return [self.shapes[i] for i in scores.argmax(axis=1)], scores
+
+    def score_dict(self, row):
+        return {shape: round(float(v), 4) for shape, v in zip(self.shapes, row)}
+
+
+classifier = FuzzyShapeClassifier()
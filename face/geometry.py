@@ -0,0 +1,107 @@
+# face/geometry.py
+import numpy as np
+
+
+EPS = 1e-6
+
+# ------------------------------
+# أرقام لاند ماركات FaceMesh (refine_landmarks=True → 478 نقطة)
+# ------------------------------
+LEFT_EYE_OUTER = 33
+RIGHT_EYE_OUTER = 263
+FACE_LEFT_EDGE, FACE_RIGHT_EDGE = 234, 454
+FOREHEAD_TOP, CHIN = 10, 152
+NEUTRAL_PITCH_DEG = -10.0  # الجبهة أبعد عن الكاميرا من الذقن في الوجه الأمامي
+
+# أزواج النقاط التي نقيس المسافة بينها، بترتيب أعمدة DISTANCE_PAIRS
+DISTANCE_PAIRS = np.array([
+    (469, 471),   # قطر الحدقة اليمنى
+    (474, 476),   # قطر الحدقة اليسرى
+    (135, 364),   # الفك
+    (10, 152),    # الجبهة → الذقن
+    (54, 284),    # عرض الجبهة
+    (123, 352),   # عظام الخد (عرض الوجه)
+])
+IRIS_RIGHT, IRIS_LEFT, JAW, FACE_HEIGHT, FOREHEAD, CHEEKS = range(len(DISTANCE_PAIRS))
+
+IRIS_DIAMETER_CM = 1.3     # مرجع قطر الحدقة
+FACE_HEIGHT_RATIO = 0.88   # نقطة 10 أسفل منبت الشعر؛ نعوّض الجزء الناقص
+
+
+def to_pixels(landmarks, sizes):
+    """
+    landmarks: (478, 3) أو (B, 478, 3) معيارية، sizes: (w, h) أو (B, 2)
+    → (B, 478, 2) ببكسلات الصورة الأصلية.
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    if landmarks.ndim == 2:
+        landmarks = landmarks[None]
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 1, 2)
+    return landmarks[..., :2] * sizes
+
+
+def bounding_boxes(px, sizes):
+    """(B, 478, 2) بكسلات → (B, 4) صناديق [x, y, width, height] صحيحة داخل حدود الصورة."""
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 1, 2)
+    lo = np.clip(px.min(axis=1), 0, sizes[:, 0] - 1)
+    hi = np.clip(px.max(axis=1), 0, sizes[:, 0] - 1)
+    lo, hi = np.floor(lo).astype(int), np.ceil(hi).astype(int)
+    return np.concatenate([lo, hi - lo], axis=1)
+
+
+def head_pose(landmarks, sizes):
+    """
+    landmarks: (B, 478, 3) معيارية (z بوحدة عرض الصورة) → (yaw, pitch) بالدرجات لكل وجه.
+    yaw من فرق العمق بين طرفي الوجه، و pitch من فرقه بين الجبهة والذقن (0 = وجه أمامي).
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 1, 2)
+    # z يتبع مقياس x: نضربه بالعرض حتى تكون المحاور الثلاثة بالبكسل
+    p = np.concatenate([landmarks[..., :2] * sizes, landmarks[..., 2:3] * sizes[..., :1]], axis=-1)
+    across = p[:, FACE_RIGHT_EDGE] - p[:, FACE_LEFT_EDGE]
+    down = p[:, CHIN] - p[:, FOREHEAD_TOP]
+    yaw = np.degrees(np.arctan2(across[:, 2], np.hypot(across[:, 0], across[:, 1])))
+    pitch = np.degrees(np.arctan2(-down[:, 2], np.hypot(down[:, 0], down[:, 1]))) - NEUTRAL_PITCH_DEG
+    return yaw, pitch
+
+
+def correct_tilt(px):
+    """تدوير كل النقاط حول منتصف العينين حتى يصبح خط العينين أفقيًا (ضرب مصفوفات واحد للدفعة)."""
+    left_eye = px[:, LEFT_EYE_OUTER]
+    right_eye = px[:, RIGHT_EYE_OUTER]
+    eye_center = (left_eye + right_eye) / 2.0
+
+    d = right_eye - left_eye
+    angle = -np.arctan2(d[:, 1], d[:, 0])
+    cos, sin = np.cos(angle), np.sin(angle)
+    # R^T لكل وجه (B, 2, 2) لأن النقاط صفوف: p' = (p - c) @ R^T + c
+    rot_t = np.stack([np.stack([cos, sin], axis=-1),
+                      np.stack([-sin, cos], axis=-1)], axis=-2)
+
+    centered = px - eye_center[:, None, :]
+    return centered @ rot_t + eye_center[:, None, :]
+
+
+def pair_distances(px, pairs=DISTANCE_PAIRS):
+    """(B, 478, 2) → (B, len(pairs)) مسافات إقليدية بالفهرسة."""
+    return np.linalg.norm(px[:, pairs[:, 0]] - px[:, pairs[:, 1]], axis=-1)
+
+
+def measure_faces(px):
+    """
+    قياسات الوجه بالسنتيمتر لدفعة وجوه (B, 478, 2).
+    `pupil_px` صفر تقريبًا يعني أن الحدقة لم تُكتشف، والقياسات عندها NaN.
+    """
+    dist = pair_distances(correct_tilt(px))
+
+    pupil_px = (dist[:, IRIS_RIGHT] + dist[:, IRIS_LEFT]) / 2.0
+    valid = pupil_px >= EPS
+    scale = np.where(valid, IRIS_DIAMETER_CM / np.where(valid, pupil_px, 1.0), np.nan)   # سم/بكسل
+
+    return {
+        'pupil_px': pupil_px,
+        'jaw_width_cm': dist[:, JAW] * scale,
+        'face_height_cm': dist[:, FACE_HEIGHT] / FACE_HEIGHT_RATIO * scale,
+        'forehead_width_cm': dist[:, FOREHEAD] * scale,
+        'face_width_cm': dist[:, CHEEKS] * scale,
+    }
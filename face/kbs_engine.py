@@ -1,5 +1,11 @@
 # face/kbs_engine1.py
+import bisect
+import math
+import threading
+from dataclasses import dataclass
+
 from experta import *
+from experta.fieldconstraint import FieldConstraint
 
 class FaceData(Fact):
     face_shape = Field(str, mandatory=False)
@@ -7,6 +13,38 @@ class FaceData(Fact):
     skin_tone = Field(str, mandatory=False)
 
 
+@dataclass(frozen=True)
+class Range:
+    """
+    شرط P(...) عددي بحدود معلنة: experta تستدعيه كأي دالة، والنسخة المترجمة تقرأ
+    حدوده مباشرة (None = بلا حد). هو الشكل الوحيد لـ P الذي تقبله الترجمة.
+    """
+    lo: float = None
+    hi: float = None
+    lo_inclusive: bool = True
+    hi_inclusive: bool = True
+
+    def __call__(self, value):
+        if self.lo is not None and not (value >= self.lo if self.lo_inclusive else value > self.lo):
+            return False
+        if self.hi is not None and not (value <= self.hi if self.hi_inclusive else value < self.hi):
+            return False
+        return True
+
+    @property
+    def bounds(self):
+        return {float(b) for b in (self.lo, self.hi) if b is not None}
+
+
+# مقاس الإطار حسب عرض الوجه (سم): نفس الجدول لقواعد experta وللنسخة المترجمة
+FACE_WIDTH_SIZES = {
+    'Medium': Range(12.6, 13.2),
+    'Large': Range(13.3, 14.0),
+    'Extra Large': Range(lo=14.0, lo_inclusive=False),
+    'Small': Range(hi=12.6, hi_inclusive=False),
+}
+
+
 class GlassesRecommender(KnowledgeEngine):
     def __init__(self):
         super().__init__()
@@ -56,19 +94,19 @@ class GlassesRecommender(KnowledgeEngine):
             'Round', 'Geometric', 'Aviator', 'Wayfarer', 'Shield'
         ]
 
-    @Rule(FaceData(face_width_cm=P(lambda w: 12.6 <= w <= 13.2)))
+    @Rule(FaceData(face_width_cm=P(FACE_WIDTH_SIZES['Medium'])))
     def size_medium(self):
         self.recommended_size = 'Medium'
 
-    @Rule(FaceData(face_width_cm=P(lambda w: 13.3 <= w <= 14.0)))
+    @Rule(FaceData(face_width_cm=P(FACE_WIDTH_SIZES['Large'])))
     def size_large(self):
         self.recommended_size = 'Large'
 
-    @Rule(FaceData(face_width_cm=P(lambda w: w > 14.0)))
+    @Rule(FaceData(face_width_cm=P(FACE_WIDTH_SIZES['Extra Large'])))
     def size_xlarge(self):
         self.recommended_size = 'Extra Large'
 
-    @Rule(FaceData(face_width_cm=P(lambda w: w < 12.6)))
+    @Rule(FaceData(face_width_cm=P(FACE_WIDTH_SIZES['Small'])))
     def size_small(self):
         self.recommended_size = 'Small'
 
@@ -102,3 +140,129 @@ class GlassesRecommender(KnowledgeEngine):
             'recommended_tone': self.recommended_tone,
         }
 
+
+
+# =========================================================
+#          نسخة مُترجمة من GlassesRecommender (جداول)
+# =========================================================
+def _predicate_bounds(name, constraint):
+    """
+    حدود المجالات في P(Range(...)). أي شرط آخر (lambda، دالة مسماة، L/W، & | ~) لا يمكن
+    معرفة حدوده من الخارج، فيُرفض بدل أن يُترجم إلى مجالات خاطئة بصمت.
+    """
+    if not isinstance(constraint, P) or not all(isinstance(fn, Range) for fn in constraint):
+        raise ValueError(f"Cannot compile constraint {constraint!r} on {name!r}: use P(Range(...))")
+    return set().union(*(fn.bounds for fn in constraint))
+
+
+class CompiledGlassesRecommender:
+    """
+    نفس مخرجات GlassesRecommender لكن بدون بناء شبكة Rete لكل طلب.
+
+    تُقرأ القواعد من المحرك مرة واحدة ثم تُشغّل عليه لكل قيمة تميّزها القواعد:
+      - الحقول الحرفية (face_shape, skin_tone): جدول قيمة → مخرجات.
+      - حقول P(Range(...)) (face_width_cm): حدود المجالات المعلنة في Range، ثم جدول
+        مجالات بحث ثنائي (كل حد ونقطة داخل كل مجال، فالفجوات مثل 13.2..13.3 تبقى None).
+    كل قاعدة يجب أن تقيّد حقلًا واحدًا بقيمة حرفية أو P(Range(...))، ولا يشترك حقلان في
+    نفس المخرج؛ غير ذلك يرفع ValueError عند الترجمة.
+    """
+
+    def __init__(self, engine_class=GlassesRecommender, fact_class=FaceData):
+        self.engine_class = engine_class
+        self.fact_class = fact_class
+        self._compiled = False
+        self._lock = threading.Lock()
+        # Field(str) / Field(float): التحقق مجرد isinstance، بدون المرور بمكتبة schema
+        self._types = {
+            name: field.validator._schema
+            for name, field in fact_class.__fields__.items()
+            if isinstance(getattr(field.validator, "_schema", None), type)
+        }
+
+    def ensure_compiled(self):
+        """الترجمة (~0.2 ثانية) عند أول استدعاء، لا عند الاستيراد."""
+        if not self._compiled:
+            with self._lock:
+                if not self._compiled:
+                    self.compile()
+                    self._compiled = True
+        return self
+
+    def _run(self, **facts):
+        return self.engine_class().run_engine(**facts)
+
+    def compile(self):
+        literals, predicates = {}, {}
+        for rule in self.engine_class().get_rules():
+            patterns = list(rule)
+            if len(patterns) != 1 or not isinstance(patterns[0], self.fact_class) or len(patterns[0]) != 1:
+                raise ValueError(f"Rule {rule!r} must constrain exactly one {self.fact_class.__name__} field")
+            (name, value), = patterns[0].items()
+            if isinstance(value, FieldConstraint):
+                predicates.setdefault(name, set()).update(_predicate_bounds(name, value))
+            else:
+                literals.setdefault(name, set()).add(value)
+        if literals.keys() & predicates.keys():
+            raise ValueError(f"Fields {sorted(literals.keys() & predicates.keys())} mix literal and P() rules")
+
+        self.default = self._run()
+        owners = {}
+
+        def partial(name, value):
+            out = self._run(**{name: value})
+            changed = {k: v for k, v in out.items() if v != self.default[k]}
+            for key in changed:
+                if owners.setdefault(key, name) != name:
+                    raise ValueError(f"Output {key!r} depends on both {owners[key]!r} and {name!r}")
+            return changed
+
+        self.lookup = {name: {v: partial(name, v) for v in values} for name, values in literals.items()}
+
+        self.intervals = {}
+        for name, constants in predicates.items():
+            bounds = sorted(constants)
+            # عينة لكل منطقة: تحت أول حد، الحد نفسه، منتصف ما بين حدين، ... فوق آخر حد
+            samples = [bounds[0] - 1.0]
+            for lo, hi in zip(bounds, bounds[1:]):
+                samples += [lo, (lo + hi) / 2]
+            samples += [bounds[-1], bounds[-1] + 1.0]
+            self.intervals[name] = (bounds, [partial(name, s) for s in samples], partial(name, math.nan))
+
+    def _validate(self, name, value):
+        # نفس تحقق experta عند declare() (الأنواع من Field في FaceData)
+        if name in self._types:
+            if isinstance(value, self._types[name]):
+                return
+        else:
+            try:
+                self.fact_class.__fields__[name].validate(value)
+                return
+            except Exception:
+                pass
+        raise ValueError(f"Invalid value on field {name!r} for fact {self.fact_class.__name__}")
+
+    def run_engine(self, face_shape=None, face_width_cm=None, skin_tone=None):
+        self.ensure_compiled()
+        result = dict(self.default)
+        for name, value in (('face_shape', face_shape), ('face_width_cm', face_width_cm), ('skin_tone', skin_tone)):
+            if value is None:
+                continue
+            self._validate(name, value)
+            if name in self.lookup:
+                try:
+                    result.update(self.lookup[name].get(value, ()))
+                except TypeError:       # قيمة غير قابلة للـ hash لا تطابق أي قاعدة حرفية
+                    pass
+            elif name in self.intervals:
+                bounds, regions, nan_region = self.intervals[name]
+                if value != value:
+                    result.update(nan_region)
+                else:
+                    i = bisect.bisect_left(bounds, value)
+                    result.update(regions[2 * i + 1 if i < len(bounds) and bounds[i] == value else 2 * i])
+        # نسخ القوائم حتى لا يعدّل المستدعي الجدول المشترك
+        return {k: list(v) if isinstance(v, list) else v for k, v in result.items()}
+
+
+# تُترجم مرة واحدة عند أول استخدام (تعديل القواعد = إعادة تشغيل الخادم)
+glasses_recommender = CompiledGlassesRecommender()
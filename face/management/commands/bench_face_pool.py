@@ -0,0 +1,68 @@
+# face/management/commands/bench_face_pool.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from face.pool import create_pool
+
+
+class Command(BaseCommand):
+    help = "Measure FaceMesh throughput for different pool sizes on one image."
+
+    def add_arguments(self, parser):
+        parser.add_argument("image", help="Path to a face photo")
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+        parser.add_argument("--mode", choices=["queue", "process"], default="queue")
+        parser.add_argument("--requests", type=int, default=64, help="Calls per pool size")
+        parser.add_argument(
+            "--concurrency", type=int, default=None,
+            help="Client threads (default: the largest pool size)",
+        )
+
+    def handle(self, *args, **opts):
+        image_bgr = cv2.imread(opts["image"], cv2.IMREAD_COLOR)
+        if image_bgr is None:
+            raise CommandError(f"Cannot read image {opts['image']}")
+        rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+
+        sizes = sorted(set(opts["sizes"]))
+        concurrency = opts["concurrency"] or max(sizes)
+        n = opts["requests"]
+
+        self.stdout.write(
+            f"mode={opts['mode']} image={image_bgr.shape[1]}x{image_bgr.shape[0]} "
+            f"requests={n} concurrency={concurrency}"
+        )
+        self.stdout.write(f"{'pool':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8}")
+
+        baseline = None
+        for size in sizes:
+            pool = create_pool(opts["mode"], size)
+            try:
+                # تسخين: إنشاء كل النسخ وتحميل النموذج قبل القياس
+                with ThreadPoolExecutor(max_workers=size) as ex:
+                    list(ex.map(lambda _: pool.process(rgb), range(size)))
+
+                def timed_call(_):
+                    t0 = time.perf_counter()
+                    pool.process(rgb)
+                    return time.perf_counter() - t0
+
+                t_start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as ex:
+                    latencies = np.array(list(ex.map(timed_call, range(n))))
+                elapsed = time.perf_counter() - t_start
+            finally:
+                pool.close()
+
+            throughput = n / elapsed
+            baseline = baseline or throughput
+            self.stdout.write(
+                f"{size:>5} {throughput:>8.1f} "
+                f"{np.percentile(latencies, 50) * 1000:>8.1f} "
+                f"{np.percentile(latencies, 95) * 1000:>8.1f} "
+                f"{throughput / baseline:>7.2f}x"
+            )
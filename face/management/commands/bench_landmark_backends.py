@@ -0,0 +1,92 @@
+# face/management/commands/bench_landmark_backends.py
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from face import geometry
+from face.backends import BACKENDS, create_backend
+from face.fuzzy import classifier, shape_features
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare landmark backends on the same images: latency per call, and accuracy "
+        "against the reference backend (landmark error, face width, face shape)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("images", nargs="+", help="Face photos")
+        parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS), default=["mediapipe", "onnx"])
+        parser.add_argument("--reference", choices=sorted(BACKENDS), default="mediapipe")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed calls per image")
+        parser.add_argument("--onnx-model", help="Overrides FACE_ANALYSIS['ONNX_MODEL_PATH']")
+        parser.add_argument("--onnx-detector-model", help="Overrides FACE_ANALYSIS['ONNX_DETECTOR_MODEL_PATH']")
+        parser.add_argument("--onnx-iris-model", help="Overrides FACE_ANALYSIS['ONNX_IRIS_MODEL_PATH']")
+        parser.add_argument("--threads", type=int, default=None, help="ONNX intra-op threads")
+
+    def _backend(self, name, opts):
+        if name == "onnx":
+            return create_backend(
+                name,
+                model_path=opts["onnx_model"],
+                detector_model_path=opts["onnx_detector_model"],
+                iris_model_path=opts["onnx_iris_model"],
+                intra_op_threads=opts["threads"],
+            )
+        return create_backend(name)
+
+    @staticmethod
+    def _summary(face, size):
+        m = geometry.measure_faces(geometry.to_pixels(face, size))
+        features = shape_features(m['face_height_cm'], m['face_width_cm'], m['jaw_width_cm'], m['forehead_width_cm'])
+        return float(m['face_width_cm'][0]), classifier.classify(features)[0][0]
+
+    def handle(self, *args, **opts):
+        images = []
+        for path in opts["images"]:
+            bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+            if bgr is None:
+                raise CommandError(f"Cannot read image {path}")
+            images.append((path, cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)))
+
+        names = list(dict.fromkeys([opts["reference"], *opts["backends"]]))
+        results = {}
+        for name in names:
+            backend = self._backend(name, opts)
+            try:
+                results[name] = []
+                for path, rgb in images:
+                    faces = backend.process(rgb)      # تسخين + النتيجة المرجعية للدقة
+                    latencies = []
+                    for _ in range(opts["repeat"]):
+                        t0 = time.perf_counter()
+                        backend.process(rgb)
+                        latencies.append(time.perf_counter() - t0)
+                    results[name].append((faces[0] if faces else None, np.array(latencies)))
+            finally:
+                backend.close()
+
+        self.stdout.write(
+            f"{'image':<24} {'backend':<10} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'NME %':>7} {'width cm':>9} {'shape':>9}"
+        )
+        reference = results[opts["reference"]]
+        for i, (path, rgb) in enumerate(images):
+            size = (rgb.shape[1], rgb.shape[0])
+            ref_face = reference[i][0]
+            for name in names:
+                face, latencies = results[name][i]
+                timing = f"{np.percentile(latencies, 50) * 1000:>8.1f} {np.percentile(latencies, 95) * 1000:>8.1f}"
+                if face is None:
+                    self.stdout.write(f"{path[-24:]:<24} {name:<10} {timing} {'no face':>27}")
+                    continue
+                width, shape = self._summary(face, size)
+                nme = "-"
+                if ref_face is not None and name != opts["reference"]:
+                    # خطأ النقاط مُطبّعًا بالمسافة بين زاويتي العينين الخارجيتين
+                    px, ref_px = face[:, :2] * size, ref_face[:, :2] * size
+                    iod = np.linalg.norm(ref_px[geometry.RIGHT_EYE_OUTER] - ref_px[geometry.LEFT_EYE_OUTER])
+                    nme = f"{np.linalg.norm(px - ref_px, axis=1).mean() / iod * 100:.2f}"
+                self.stdout.write(f"{path[-24:]:<24} {name:<10} {timing} {nme:>7} {width:>9.2f} {shape:>9}")
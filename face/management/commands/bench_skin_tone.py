@@ -0,0 +1,74 @@
+# face/management/commands/bench_skin_tone.py
+import timeit
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from face.pipeline import detect_landmarks
+from face.skin_tone import SAMPLE_INDICES, estimate_skin_tone, skin_mask_ycrcb
+
+
+def legacy_estimate_skin_tone(image_bgr, landmarks, patch):
+    """التنفيذ القديم (قوائم بايثون + tolist) كمرجع للمقارنة فقط."""
+    h, w = image_bgr.shape[:2]
+
+    def gray_world_wb(bgr_roi):
+        roi = bgr_roi.astype(np.float32)
+        mean_b, mean_g, mean_r = roi[...,0].mean()+1e-6, roi[...,1].mean()+1e-6, roi[...,2].mean()+1e-6
+        gray = (mean_b + mean_g + mean_r) / 3.0
+        roi[...,0] *= (gray / mean_b)
+        roi[...,1] *= (gray / mean_g)
+        roi[...,2] *= (gray / mean_r)
+        return np.clip(roi, 0, 255).astype(np.uint8)
+
+    L_vals, A_vals, B_vals = [], [], []
+    for idx in SAMPLE_INDICES:
+        cx, cy = int(landmarks[idx][0] * w), int(landmarks[idx][1] * h)
+        roi = image_bgr[max(0, cy - patch):min(h, cy + patch), max(0, cx - patch):min(w, cx + patch)]
+        if roi.size == 0:
+            continue
+        roi = gray_world_wb(roi)
+        mask = skin_mask_ycrcb(roi)
+        if mask.sum() < 50:
+            continue
+        lab = cv2.cvtColor(roi, cv2.COLOR_BGR2LAB)
+        L_vals.extend(lab[...,0][mask>0].flatten().tolist())
+        A_vals.extend(lab[...,1][mask>0].flatten().tolist())
+        B_vals.extend(lab[...,2][mask>0].flatten().tolist())
+
+    if len(L_vals) < 100:
+        return 'Unknown'
+    L_med = float(np.median(L_vals))
+    return 'Light' if L_med >= 170 else 'Medium' if L_med >= 125 else 'Dark'
+
+
+class Command(BaseCommand):
+    help = "Compare the NumPy skin-tone extraction against the legacy list-based version."
+
+    def add_arguments(self, parser):
+        parser.add_argument("image", help="Path to a face photo")
+        parser.add_argument("--patches", type=int, nargs="+", default=[10, 25, 50, 100],
+                            help="Patch half-sizes in pixels")
+        parser.add_argument("--number", type=int, default=200)
+
+    def handle(self, *args, **opts):
+        image_bgr = cv2.imread(opts["image"], cv2.IMREAD_COLOR)
+        if image_bgr is None:
+            raise CommandError(f"Cannot read image {opts['image']}")
+        landmarks = detect_landmarks(image_bgr)
+        n = opts["number"]
+
+        self.stdout.write(f"{'patch':>6} {'legacy us':>10} {'numpy us':>10} {'speedup':>8}  tone")
+        for patch in opts["patches"]:
+            legacy = legacy_estimate_skin_tone(image_bgr, landmarks, patch)
+            current = estimate_skin_tone(image_bgr, landmarks, patch)
+            if legacy != current:
+                raise CommandError(f"patch={patch}: legacy={legacy} numpy={current}")
+
+            t_legacy = timeit.timeit(lambda: legacy_estimate_skin_tone(image_bgr, landmarks, patch), number=n) / n
+            t_numpy = timeit.timeit(lambda: estimate_skin_tone(image_bgr, landmarks, patch), number=n) / n
+            self.stdout.write(
+                f"{patch:>6} {t_legacy * 1e6:>10.1f} {t_numpy * 1e6:>10.1f} "
+                f"{t_legacy / t_numpy:>7.2f}x  {current}"
+            )
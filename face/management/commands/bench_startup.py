@@ -0,0 +1,70 @@
+# face/management/commands/bench_startup.py
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+HEAVY_MODULES = ("cv2", "mediapipe", "onnxruntime", "rembg", "numba", "scipy", "matplotlib", "experta")
+
+# يُشغَّل في عملية جديدة لكل قياس (بارد تمامًا)
+PROBE = r"""
+import json, resource, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+t_urls = time.perf_counter() - t0
+warm = sys.argv[1]
+if warm != "none":
+    from face.warmup import warmup
+    warmup(instances=warm == "full")
+print(json.dumps({
+    "urls_s": t_urls,
+    "total_s": time.perf_counter() - t0,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold process startup in fresh interpreters: django.setup() plus the "
+        "URLconf import, optionally followed by face warmup. Reports time, peak RSS "
+        "and which heavy modules got loaded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument(
+            "--warmup", nargs="+", choices=["none", "imports", "full"], default=["none", "imports", "full"],
+            help="Scenarios: URLconf only, + warmup(instances=False), + warmup(instances=True)",
+        )
+
+    def _probe(self, warm):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings")}
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE, warm, json.dumps(HEAVY_MODULES)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if out.returncode:
+            raise CommandError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "probe failed")
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **opts):
+        self.stdout.write(f"{'scenario':<9} {'urls ms':>9} {'total ms':>9} {'rss MB':>8}  heavy modules loaded")
+        for warm in opts["warmup"]:
+            runs = [self._probe(warm) for _ in range(opts["runs"])]
+            self.stdout.write(
+                f"{warm:<9} "
+                f"{statistics.median(r['urls_s'] for r in runs) * 1000:>9.0f} "
+                f"{statistics.median(r['total_s'] for r in runs) * 1000:>9.0f} "
+                f"{statistics.median(r['rss_mb'] for r in runs):>8.0f}  "
+                f"{', '.join(runs[-1]['loaded']) or '-'}"
+            )
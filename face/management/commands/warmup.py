@@ -0,0 +1,33 @@
+# face/management/commands/warmup.py
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from face.warmup import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the lazily imported face-analysis dependencies, compile the KBS tables and "
+        "start the FaceMesh pool, reporting the time of each step. Also loads the rembg "
+        "model (downloading it on first run), so a deploy can fail early instead of on "
+        "the first upload."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--no-pool", action="store_true", help="Skip creating the pool instances")
+        parser.add_argument("--no-rembg", action="store_true", help="Skip the rembg background-removal model")
+
+    def handle(self, *args, **opts):
+        for name, seconds in warmup(instances=not opts["no_pool"]):
+            self.stdout.write(f"{name:<26} {seconds * 1000:>9.1f} ms")
+
+        if not opts["no_rembg"]:
+            from glasses.serializers import get_rembg_session
+
+            t0 = perf_counter()
+            try:
+                get_rembg_session()
+            except Exception as e:
+                raise CommandError(f"rembg session failed: {e}")
+            self.stdout.write(f"{'rembg session':<26} {(perf_counter() - t0) * 1000:>9.1f} ms")
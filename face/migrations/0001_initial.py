@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceAnalysis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('image', 'Image'), ('landmarks', 'Landmarks')], default='image', max_length=20)),
+                ('pipeline_version', models.CharField(max_length=20)),
+                ('face_shape', models.CharField(max_length=20)),
+                ('face_width_cm', models.FloatField()),
+                ('face_height_cm', models.FloatField()),
+                ('jaw_width_cm', models.FloatField()),
+                ('forehead_width_cm', models.FloatField()),
+                ('skin_tone', models.CharField(max_length=20)),
+                ('shape_scores', models.JSONField(blank=True, default=dict)),
+                ('recommended_shape', models.JSONField(blank=True, default=list)),
+                ('recommended_size', models.CharField(blank=True, max_length=20, null=True)),
+                ('recommended_tone', models.CharField(blank=True, max_length=20, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_analyses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Face analysis',
+                'verbose_name_plural': 'Face analyses',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at'], name='face_facean_user_id_195af8_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,74 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class FaceAnalysis(models.Model):
+    """
+    نتيجة تحليل وجه محفوظة للمستخدم: نقاط التوصية تقرؤها عبر analysis_id
+    بدل إعادة إرسال الصورة أو shapes/size/tone.
+    """
+
+    class Source(models.TextChoices):
+        IMAGE = "image"
+        LANDMARKS = "landmarks"
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="face_analyses"
+    )
+    source = models.CharField(max_length=20, choices=Source.choices, default=Source.IMAGE)
+    # نسخة خط التحليل (face.pipeline.PIPELINE_VERSION) التي أنتجت النتيجة
+    pipeline_version = models.CharField(max_length=20)
+
+    face_shape = models.CharField(max_length=20)
+    # القياسات (سم): مدخلات التصنيف الضبابي، فتُعاد النتيجة أو يُعاد تصنيفها بدون الصورة
+    face_width_cm = models.FloatField()
+    face_height_cm = models.FloatField()
+    jaw_width_cm = models.FloatField()
+    forehead_width_cm = models.FloatField()
+    skin_tone = models.CharField(max_length=20)
+    shape_scores = models.JSONField(default=dict, blank=True)
+
+    # مخرجات KBS وقت التحليل
+    recommended_shape = models.JSONField(default=list, blank=True)
+    recommended_size = models.CharField(max_length=20, blank=True, null=True)
+    recommended_tone = models.CharField(max_length=20, blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "-created_at"])]
+        verbose_name = "Face analysis"
+        verbose_name_plural = "Face analyses"
+
+    def __str__(self):
+        return f"Analysis {self.id} - {self.face_shape} ({self.user_id})"
+
+    @classmethod
+    def from_payload(cls, user, payload, source=Source.IMAGE):
+        from .pipeline import PIPELINE_VERSION
+        return cls(
+            user=user,
+            source=source,
+            pipeline_version=PIPELINE_VERSION,
+            face_shape=payload["face_shape"],
+            face_width_cm=payload["face_width_cm"],
+            face_height_cm=payload["face_height_cm"],
+            jaw_width_cm=payload["jaw_width_cm"],
+            forehead_width_cm=payload["forehead_width_cm"],
+            skin_tone=payload["skin_tone"],
+            shape_scores=payload.get("shape_scores") or {},
+            recommended_shape=payload.get("recommended_shape") or [],
+            recommended_size=payload.get("recommended_size"),
+            recommended_tone=payload.get("recommended_tone"),
+        )
+
+    def recommendation_input(self):
+        """بنفس مفاتيح مدخلات SmartRecommendEndpoint."""
+        return {
+            "shapes": list(self.recommended_shape),
+            "size": self.recommended_size or "N/A",
+            "tone": self.recommended_tone or "N/A",
+        }
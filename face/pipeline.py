@@ -0,0 +1,222 @@
+# face/pipeline.py
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from . import geometry, quality
+from .conf import face_setting
+from .fuzzy import classifier, shape_features
+from .kbs_engine import glasses_recommender
+from .pool import get_face_mesh_pool, FaceMeshPoolTimeout
+from .preprocess import prepare_image
+from .skin_tone import estimate_skin_tone, estimate_skin_tone_from_patches
+from .timing import stage
+
+
+# يُرفع عند أي تغيير يبدّل نتائج التحليل (يُبطل الكاش والنتائج المخزنة)
+PIPELINE_VERSION = "4"
+
+# قياسات الوجه في النتيجة (بالسنتيمتر)، بترتيب مدخلات shape_features
+MEASUREMENT_KEYS = ('face_height_cm', 'face_width_cm', 'jaw_width_cm', 'forehead_width_cm')
+
+
+class FaceAnalysisError(Exception):
+    """خطأ متوقع في التحليل يُعاد للمستخدم كما هو (مع رمز ثابت يفهمه العميل)."""
+
+    def __init__(self, message, code, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status_code = status_code
+
+
+# ------------------------------
+# قراءة الصورة + استخراج الملامح
+# ------------------------------
+def decode_image(data):
+    with stage("decode"):
+        prepared = prepare_image(data)
+    if prepared is None:
+        raise FaceAnalysisError("Error reading image", "invalid_image")
+    return prepared
+
+
+def check_quality(image_bgr):
+    """يرفض الصورة غير الصالحة قبل دفع كلفة FaceMesh."""
+    if not face_setting("QUALITY_CHECKS"):
+        return
+    with stage("quality"):
+        issue = quality.check_image(image_bgr)
+    if issue:
+        raise FaceAnalysisError(*issue)
+
+
+def detect_faces(image_bgr, max_num_faces=1):
+    """
+    الوجوه المكتشفة (أول max_num_faces منها) كمصفوفات (478, 3) بإحداثيات معيارية.
+    الوجه الواحد من pool بـ max_num_faces=1؛ الأكثر من pool بسقف MAX_FACES (مرتبة حسب ثقة الكشف).
+    """
+    with stage("color"):
+        rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+    try:
+        with stage("facemesh"):
+            faces = get_face_mesh_pool(max_num_faces).process(rgb)
+    except FaceMeshPoolTimeout:
+        raise FaceAnalysisError("Face analysis is busy, try again", "busy", status_code=503)
+    if not faces:
+        raise FaceAnalysisError("No face detected", "no_face")
+    return faces[:max_num_faces]
+
+
+def detect_landmarks(image_bgr):
+    """أول وجه كمصفوفة (478, 3) بإحداثيات معيارية."""
+    return detect_faces(image_bgr)[0]
+
+
+# ------------------------------
+# تجميع المراحل
+# ------------------------------
+def extract_face(data):
+    """
+    المرحلة الثقيلة لكل صورة: فك الترميز + FaceMesh + لون البشرة.
+    يعيد (landmarks, original_size, skin_tone)؛ الهندسة تُحسب لاحقًا للدفعة كاملة.
+    """
+    prepared = decode_image(data)
+    w, h = prepared.original_size
+    check_quality(prepared.image_bgr)
+    landmarks = detect_landmarks(prepared.image_bgr)
+    # حجم الرقعة قابل للتعديل بحسب دقة الصورة (الأصلية) ثم يُحوَّل لبكسلات العمل
+    patch = prepared.to_working_px(max(10, int(min(w, h) * 0.02)))
+    with stage("skin_tone"):
+        skin_tone = estimate_skin_tone(prepared.image_bgr, landmarks, patch)
+    return landmarks, (w, h), skin_tone
+
+
+def make_payload(face_shape, measurements, skin_tone, shape_scores=None):
+    """measurements: {مفتاح من MEASUREMENT_KEYS: سنتيمتر} (تُحفظ مع النتيجة لإعادة التصنيف لاحقًا)."""
+    # KBS توصيات النظارات
+    with stage("kbs"):
+        recommendations = glasses_recommender.run_engine(face_shape, measurements['face_width_cm'], skin_tone)
+    return {
+        'face_width_cm': round(measurements['face_width_cm'], 2),
+        **{k: round(measurements[k], 2) for k in MEASUREMENT_KEYS if k != 'face_width_cm'},
+        'face_shape': face_shape,
+        'skin_tone': skin_tone,
+        **({'shape_scores': shape_scores} if shape_scores is not None else {}),
+        **recommendations
+    }
+
+
+def build_payloads(faces):
+    """
+    faces: قائمة (landmarks, (w, h), skin_tone).
+    الهندسة وتصنيف شكل الوجه لكل الوجوه بعمليات مصفوفات واحدة، ثم توصيات KBS.
+    يعيد لكل وجه payload أو FaceAnalysisError.
+    """
+    if not faces:
+        return []
+    landmarks, sizes, skin_tones = zip(*faces)
+
+    # قياسات الوجه ببكسلات الصورة الأصلية (بعد تصحيح الميلان)
+    landmarks = np.stack(landmarks)
+    with stage("geometry"):
+        m = geometry.measure_faces(geometry.to_pixels(landmarks, sizes))
+        # وضعية الرأس تحتاج z (ملامح العميل قد تكون x, y فقط)
+        poses = [None] * len(skin_tones)
+        if face_setting("QUALITY_CHECKS") and landmarks.shape[-1] == 3:
+            poses = quality.check_pose(*geometry.head_pose(landmarks, sizes))
+    with stage("fuzzy"):
+        features = shape_features(*(m[k] for k in MEASUREMENT_KEYS))
+        face_shapes, scores = classifier.classify(features)
+
+    payloads = []
+    for i, skin_tone in enumerate(skin_tones):
+        if poses[i]:
+            payloads.append(FaceAnalysisError(*poses[i]))
+            continue
+        if m['pupil_px'][i] < geometry.EPS:
+            payloads.append(FaceAnalysisError("Iris not detected reliably", "iris_not_detected"))
+            continue
+        payloads.append(make_payload(face_shapes[i], {k: float(m[k][i]) for k in MEASUREMENT_KEYS}, skin_tone,
+                                     shape_scores=classifier.score_dict(scores[i])))
+    return payloads
+
+
+def analyze_image(data):
+    result = build_payloads([extract_face(data)])[0]
+    if isinstance(result, FaceAnalysisError):
+        raise result
+    return result
+
+
+def analyze_faces(data, max_faces):
+    """
+    صورة جماعية: فك ترميز واستدلال FaceMesh مرة واحدة لكل الوجوه (حتى max_faces)،
+    ثم الهندسة والتصنيف كدفعة واحدة. النتائج مرتبة من اليسار لليمين مع صندوق كل وجه؛
+    الوجه الذي فشل قياسه يأخذ مدخل خطأ بدل أن يُسقط الباقي.
+    """
+    prepared = decode_image(data)
+    w, h = prepared.original_size
+    check_quality(prepared.image_bgr)
+    faces = detect_faces(prepared.image_bgr, max_faces)
+
+    patch = prepared.to_working_px(max(10, int(min(w, h) * 0.02)))
+    with stage("skin_tone"):
+        skin_tones = [estimate_skin_tone(prepared.image_bgr, landmarks, patch) for landmarks in faces]
+    with stage("geometry"):
+        boxes = geometry.bounding_boxes(geometry.to_pixels(np.stack(faces), (w, h)), (w, h))
+    results = build_payloads([(landmarks, (w, h), tone) for landmarks, tone in zip(faces, skin_tones)])
+
+    order = np.argsort(boxes[:, 0], kind="stable")
+    return [
+        {
+            'index': n,
+            'box': dict(zip(('x', 'y', 'width', 'height'), map(int, boxes[i]))),
+            **({'error': results[i].message, 'code': results[i].code}
+               if isinstance(results[i], FaceAnalysisError) else results[i]),
+        }
+        for n, i in enumerate(order)
+    ]
+
+
+def analyze_landmarks(landmarks, size, skin_patches=()):
+    """
+    ملامح جاهزة من العميل (MediaPipe على الجهاز): بدون فك ترميز ولا FaceMesh،
+    فقط الهندسة والتصنيف و KBS. لون البشرة من الرقع المرفقة إن وُجدت.
+    """
+    with stage("skin_tone"):
+        skin_tone = estimate_skin_tone_from_patches(skin_patches)
+    result = build_payloads([(landmarks, size, skin_tone)])[0]
+    if isinstance(result, FaceAnalysisError):
+        raise result
+    return result
+
+
+def analyze_batch(images, max_workers):
+    """
+    تحليل عدة صور معًا: فك الترميز والاستدلال بالتوازي، ثم الهندسة والتصنيف للدفعة كاملة.
+    النتائج بنفس ترتيب المدخلات؛ الصورة الفاشلة تأخذ مدخل خطأ بدل أن تُسقط الدفعة.
+    """
+    def safe_extract(data):
+        try:
+            return extract_face(data)
+        except FaceAnalysisError as e:
+            return e
+
+    # كل خيط بنسخة من الـ context حتى يصل المؤقت الفعّال (timing.stage) للمراحل
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, safe_extract, data) for data in images]
+        extracted = [f.result() for f in futures]
+
+    ok_indices = [i for i, r in enumerate(extracted) if not isinstance(r, FaceAnalysisError)]
+    results = list(extracted)
+    for i, payload in zip(ok_indices, build_payloads([extracted[i] for i in ok_indices])):
+        results[i] = payload
+
+    return [
+        {'index': i, 'error': r.message, 'code': r.code} if isinstance(r, FaceAnalysisError)
+        else {'index': i, **r}
+        for i, r in enumerate(results)
+    ]
@@ -0,0 +1,189 @@
+# face/pool.py
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+import numpy as np
+from django.core.exceptions import ImproperlyConfigured
+
+from .backends import create_backend
+from .conf import face_setting
+
+
+class FaceMeshPoolTimeout(Exception):
+    """لم تتوفر نسخة FaceMesh خلال المهلة المحددة."""
+
+
+class FaceMeshPool:
+    """
+    طابور محدود من نسخ backend الملامح (FaceMesh افتراضيًا): كل طلب يستعير نسخة
+    لنفسه ثم يعيدها، فلا تُستخدم نسخة واحدة من خيطين بنفس الوقت.
+    النسخ تُنشأ عند الحاجة حتى الحد الأقصى `size`.
+    """
+
+    def __init__(self, size, timeout=None, backend=None, **options):
+        if size < 1:
+            raise ImproperlyConfigured("FACE_ANALYSIS['POOL_SIZE'] must be >= 1")
+        self.size = size
+        self.timeout = timeout
+        self.backend = backend
+        self.options = options
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_instance(self):
+        return create_backend(self.backend, **self.options)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._new_instance()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise FaceMeshPoolTimeout(f"No FaceMesh instance available after {self.timeout}s")
+
+    @contextmanager
+    def checkout(self):
+        mesh = self._acquire()
+        try:
+            yield mesh
+        finally:
+            self._idle.put(mesh)
+
+    def process(self, rgb):
+        with self.checkout() as mesh:
+            return mesh.process(rgb)
+
+    def warm(self):
+        """ينشئ كل النسخ مسبقًا ويمرر على كل منها إطارًا فارغًا (تحميل النموذج)."""
+        blank = np.zeros((64, 64, 3), np.uint8)
+        instances = [self._acquire() for _ in range(self.size)]
+        try:
+            for mesh in instances:
+                mesh.process(blank)
+        finally:
+            for mesh in instances:
+                self._idle.put(mesh)
+
+    def close(self):
+        while True:
+            try:
+                mesh = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            mesh.close()
+            with self._lock:
+                self._created -= 1
+
+
+# ------------------------------
+# وضع العمليات: نسخة backend واحدة داخل كل عملية عاملة
+# ------------------------------
+_worker_mesh = None
+
+
+def _init_worker(backend, options):
+    global _worker_mesh
+    _worker_mesh = create_backend(backend, **options)
+
+
+def _process_in_worker(rgb):
+    return _worker_mesh.process(rgb)
+
+
+class ProcessFaceMeshPool:
+    """نفس واجهة FaceMeshPool لكن الاستدلال يجري في عمليات منفصلة (بدون GIL)."""
+
+    def __init__(self, size, timeout=None, backend=None, **options):
+        if size < 1:
+            raise ImproperlyConfigured("FACE_ANALYSIS['POOL_SIZE'] must be >= 1")
+        self.size = size
+        self.timeout = timeout
+        # الاسم يُحسم هنا: العمليات العاملة (spawn) قد لا ترى نفس الإعدادات
+        self.backend = backend or face_setting("LANDMARK_BACKEND")
+        self.options = options
+        # spawn بدل fork: العملية الأم فيها خيوط (خادم threaded) فلا يصح نسخها
+        self._executor = ProcessPoolExecutor(
+            max_workers=size,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.backend, self.options),
+        )
+
+    def process(self, rgb):
+        future = self._executor.submit(_process_in_worker, rgb)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise FaceMeshPoolTimeout(f"FaceMesh worker did not answer within {self.timeout}s")
+
+    def warm(self):
+        """يشغّل كل العمليات العاملة (spawn + تهيئة النموذج) قبل أول طلب."""
+        blank = np.zeros((64, 64, 3), np.uint8)
+        futures = [self._executor.submit(_process_in_worker, blank) for _ in range(self.size)]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+POOL_CLASSES = {
+    "queue": FaceMeshPool,
+    "process": ProcessFaceMeshPool,
+}
+
+
+def create_pool(mode, size, timeout=None, backend=None, **options):
+    try:
+        pool_class = POOL_CLASSES[mode]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"FACE_ANALYSIS['POOL_MODE'] must be one of {sorted(POOL_CLASSES)}, got {mode!r}"
+        )
+    return pool_class(size, timeout=timeout, backend=backend, **options)
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def get_face_mesh_pool(max_num_faces=1):
+    """
+    الـ pool المشترك للعملية الحالية (يُنشأ عند أول استخدام). التحليل العادي يأخذ pool
+    بـ max_num_faces=1 فلا يدفع استدلال الملامح لوجوه لن تُستخدم في صورة جماعية؛ وضع
+    الوجوه المتعددة يأخذ pool ثانيًا بسقف FACE_ANALYSIS['MAX_FACES'] (يُنشأ فقط إن استُخدم)
+    والمستدعي يقص القائمة إلى ما طلبه.
+    """
+    key = 1 if max_num_faces <= 1 else face_setting("MAX_FACES")
+    pool = _pools.get(key)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = create_pool(
+                    face_setting("POOL_MODE"),
+                    face_setting("POOL_SIZE"),
+                    timeout=face_setting("POOL_TIMEOUT"),
+                    max_num_faces=key,
+                )
+    return pool
@@ -0,0 +1,110 @@
+# face/preprocess.py
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .conf import face_setting
+
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# أكبر تصغير أولًا: فك ترميز JPEG بدقة 1/8 أو 1/4 أو 1/2 مباشرة من DCT
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+class PreparedImage:
+    """
+    الصورة المصغّرة التي يعمل عليها الخط، مع أبعاد الصورة الأصلية (بعد تطبيق EXIF).
+    الإحداثيات المعيارية (0..1) من FaceMesh تُحوَّل لبكسلات أصلية عبر original_size،
+    فالقياسات بالسنتيمتر ورقع لون البشرة تبقى صحيحة.
+    """
+
+    def __init__(self, image_bgr, original_size):
+        self.image_bgr = image_bgr
+        self.original_size = original_size          # (w, h)
+        self.scale = image_bgr.shape[1] / original_size[0]   # بكسل عمل / بكسل أصلي
+
+    def to_working_px(self, length_px):
+        """طول بالبكسل الأصلي → بكسل الصورة المصغرة."""
+        return max(1, int(round(length_px * self.scale)))
+
+
+def read_header(data):
+    """الأبعاد الخام واتجاه EXIF من ترويسة الصورة فقط (بدون فك ترميز البكسلات)."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size, img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        return None, 1
+
+
+def apply_exif_orientation(image, orientation):
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(image), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def _decode_flag(raw_size, max_side):
+    if not raw_size or not max_side:
+        return cv2.IMREAD_COLOR, 1
+    longest = max(raw_size)
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if longest / factor >= max_side:
+            return flag, factor
+    return cv2.IMREAD_COLOR, 1
+
+
+def prepare_image(data, max_side=None):
+    """
+    فك ترميز بدقة مخفّضة + تطبيق اتجاه EXIF + تصغير لأقصى ضلع `max_side`.
+    يعيد None إذا تعذرت قراءة الصورة.
+    """
+    if max_side is None:
+        max_side = face_setting("MAX_IMAGE_SIDE")
+
+    raw_size, orientation = read_header(data)
+    flag, _ = _decode_flag(raw_size, max_side)
+
+    # نطبق الاتجاه بأنفسنا حتى يكون نفسه مهما كانت طريقة فك الترميز
+    image_bgr = cv2.imdecode(np.frombuffer(data, np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image_bgr is None:
+        return None
+    image_bgr = apply_exif_orientation(image_bgr, orientation)
+
+    if raw_size is None:
+        original_size = (image_bgr.shape[1], image_bgr.shape[0])
+    elif orientation in (5, 6, 7, 8):
+        original_size = (raw_size[1], raw_size[0])
+    else:
+        original_size = raw_size
+
+    h, w = image_bgr.shape[:2]
+    if max_side and max(w, h) > max_side:
+        ratio = max_side / max(w, h)
+        # بعد فك الترميز المخفّض تبقى النسبة > 0.5 فيكفي LINEAR (أسرع بكثير من AREA)
+        interpolation = cv2.INTER_LINEAR if ratio >= 0.5 else cv2.INTER_AREA
+        image_bgr = cv2.resize(
+            image_bgr,
+            (max(1, round(w * ratio)), max(1, round(h * ratio))),
+            interpolation=interpolation,
+        )
+
+    return PreparedImage(image_bgr, original_size)
@@ -0,0 +1,66 @@
+# face/quality.py
+"""
+فحص جودة سريع قبل FaceMesh: صورة ضبابية أو مظلمة أو محروقة لا تستحق الاستدلال
+(تنتهي عادةً بـ "Iris not detected reliably" أو قياسات خاطئة). يُعاد رمز خطأ يفهمه العميل
+("image_too_dark"، "image_blurry"...) ليطلب من المستخدم صورة أفضل.
+
+الفحص على نسخة رمادية مصغرة (QUALITY_SIDE) فالكلفة ~1ms مهما كان حجم الصورة،
+والعتبات مستقلة عن دقة الصورة.
+"""
+import cv2
+import numpy as np
+
+from .conf import face_setting
+
+
+QUALITY_SIDE = 256
+DARK_LEVEL = 40          # بكسل رمادي أقل من هذا يُعد مظلمًا
+CLIPPED_LEVEL = 246      # وأعلى من هذا محروقًا (مشبع)
+
+
+def grayscale_thumbnail(image_bgr, side=QUALITY_SIDE):
+    h, w = image_bgr.shape[:2]
+    ratio = side / max(w, h)
+    if ratio < 1:
+        image_bgr = cv2.resize(
+            image_bgr, (max(1, round(w * ratio)), max(1, round(h * ratio))), interpolation=cv2.INTER_AREA
+        )
+    return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+
+
+def image_metrics(image_bgr):
+    """(حدة = تباين Laplacian، نسبة البكسلات المظلمة، نسبة البكسلات المحروقة)."""
+    gray = grayscale_thumbnail(image_bgr)
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    return sharpness, float(hist[:DARK_LEVEL].sum()), float(hist[CLIPPED_LEVEL:].sum())
+
+
+def check_image(image_bgr):
+    """يعيد (رسالة، رمز) لأول مشكلة، أو None إذا كانت الصورة صالحة للتحليل."""
+    sharpness, dark, clipped = image_metrics(image_bgr)
+    # الإضاءة أولًا: الصورة المظلمة تباينها منخفض فتبدو ضبابية أيضًا
+    if dark > face_setting("QUALITY_MAX_DARK_FRACTION"):
+        return "Image is too dark, use better lighting", "image_too_dark"
+    if clipped > face_setting("QUALITY_MAX_CLIPPED_FRACTION"):
+        return "Image is overexposed, avoid direct light on the face", "image_too_bright"
+    if sharpness < face_setting("QUALITY_MIN_SHARPNESS"):
+        return "Image is blurry, hold the camera steady", "image_blurry"
+    return None
+
+
+def check_pose(yaw, pitch):
+    """
+    yaw, pitch: (B,) بالدرجات من geometry.head_pose → قائمة (رسالة، رمز) أو None لكل وجه.
+    الميلان الجانبي (roll) لا يُرفض لأن geometry.correct_tilt يصححه.
+    """
+    max_yaw, max_pitch = face_setting("QUALITY_MAX_YAW"), face_setting("QUALITY_MAX_PITCH")
+    issues = []
+    for y, p in zip(np.abs(yaw), np.abs(pitch)):
+        if y > max_yaw:
+            issues.append(("Face is turned sideways, look straight at the camera", "head_turned"))
+        elif p > max_pitch:
+            issues.append(("Head is tilted up or down, look straight at the camera", "head_tilted"))
+        else:
+            issues.append(None)
+    return issues
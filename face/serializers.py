@@ -0,0 +1,83 @@
+# face/serializers.py
+import base64
+import binascii
+import json
+
+import cv2
+import numpy as np
+from rest_framework import serializers
+
+from .conf import face_setting
+from .preprocess import read_header
+from .skin_tone import SAMPLE_INDICES
+
+
+# FaceMesh مع refine_landmarks: 468 نقطة للوجه + 10 للقزحيتين (القياس يعتمد على القزحية)
+NUM_LANDMARKS = 478
+
+
+class LandmarksField(serializers.Field):
+    """
+    مصفوفة (478, 2|3) بإحداثيات معيارية كما يخرجها MediaPipe على الجهاز.
+    تُقبل كقائمة JSON أو كنص JSON (لطلبات multipart)، وتُتحقق دفعة واحدة بـ NumPy
+    بدل حقل لكل رقم.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                raise serializers.ValidationError("Landmarks must be a JSON array.")
+        try:
+            arr = np.asarray(data, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise serializers.ValidationError("Landmarks must be an array of [x, y] or [x, y, z] numbers.")
+        if arr.ndim != 2 or arr.shape[0] != NUM_LANDMARKS or arr.shape[1] not in (2, 3):
+            raise serializers.ValidationError(
+                f"Expected {NUM_LANDMARKS} points of [x, y] or [x, y, z] (refine_landmarks=True)."
+            )
+        if not np.isfinite(arr).all():
+            raise serializers.ValidationError("Landmarks must be finite numbers.")
+        return arr
+
+    def to_representation(self, value):
+        return np.asarray(value).tolist()
+
+
+class SkinPatchField(serializers.CharField):
+    """رقعة جلد صغيرة (JPEG/PNG بترميز base64) → مصفوفة BGR."""
+
+    def to_internal_value(self, data):
+        data = super().to_internal_value(data)
+        if "," in data and data.startswith("data:"):
+            data = data.split(",", 1)[1]
+        if len(data) > face_setting("CLIENT_PATCH_MAX_BYTES") * 4 // 3 + 4:
+            raise serializers.ValidationError("Skin patch is too large.")
+        try:
+            raw = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raise serializers.ValidationError("Skin patch must be base64 encoded.")
+
+        # الأبعاد من الترويسة قبل فك الترميز: PNG بحجم 32KB قد يُفك إلى عشرات آلاف البكسلات لكل ضلع
+        size, _ = read_header(raw)
+        if size is None:
+            raise serializers.ValidationError("Skin patch is not a valid image.")
+        max_side = face_setting("CLIENT_PATCH_MAX_SIDE")
+        if max(size) > max_side:
+            raise serializers.ValidationError(f"Skin patch side must be at most {max_side}px.")
+
+        patch = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+        if patch is None:
+            raise serializers.ValidationError("Skin patch is not a valid image.")
+        return patch
+
+
+class ClientLandmarksSerializer(serializers.Serializer):
+    landmarks = LandmarksField()
+    image_width = serializers.IntegerField(min_value=1)
+    image_height = serializers.IntegerField(min_value=1)
+    # رقع حول الخدين والجبهة (نفس نقاط SAMPLE_INDICES)؛ بدونها skin_tone = Unknown
+    skin_patches = serializers.ListField(
+        child=SkinPatchField(), required=False, max_length=len(SAMPLE_INDICES), default=list
+    )
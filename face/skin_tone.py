@@ -0,0 +1,99 @@
+# face/skin_tone.py
+import cv2
+import numpy as np
+
+
+# نقاط آمنة: خد أيسر 234، خد أيمن 454، جبهة 10 (قد تحوي شعر؛ سنفلتره بالقناع)
+SAMPLE_INDICES = (234, 454, 10)
+
+MIN_SKIN_PIXELS = 100
+
+# حدود مرنة للجلد في YCrCb: Cr∈[133,173], Cb∈[77,127]
+SKIN_YCRCB_LOW = (0, 133, 77)
+SKIN_YCRCB_HIGH = (255, 173, 127)
+MORPH_KERNEL = np.ones((3, 3), np.uint8)
+
+# تصنيف مبسّط على أساس L (OpenCV Lab: L ∈ [0..255])
+LIGHT_MIN_L = 170
+MEDIUM_MIN_L = 125
+
+
+def gray_world_wb(bgr_roi):
+    """
+    ❶ توازن أبيض بسيط (Gray-World) داخل كل ROI لمنع انحياز الإضاءة.
+    المتوسطات من cv2.mean مباشرة على uint8، ثم ضرب واحد في مخزن float32 واحد
+    يُقص ويُقطع لـ uint8 (نفس نتيجة التحويل القديم بدون النسخ الوسيطة).
+    """
+    means = np.asarray(cv2.mean(bgr_roi)[:3], dtype=np.float32) + np.float32(1e-6)
+    gains = means.mean() / means
+    buf = cv2.multiply(bgr_roi, (*gains.tolist(), 0.0), dtype=cv2.CV_32F)
+    np.minimum(buf, 255, out=buf)
+    return buf.astype(np.uint8)
+
+
+def skin_mask_ycrcb(bgr_roi):
+    # ❷ قناع الجلد في YCrCb (نطاقات شائعة للجلد البشري)
+    ycrcb = cv2.cvtColor(bgr_roi, cv2.COLOR_BGR2YCrCb)
+    mask = cv2.inRange(ycrcb, SKIN_YCRCB_LOW, SKIN_YCRCB_HIGH)
+    # تنظيف القناع
+    cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=mask, iterations=1)
+    cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MORPH_KERNEL, dst=mask, iterations=1)
+    return mask
+
+
+def patch_lightness(bgr_roi):
+    """قيم L لبكسلات الجلد داخل رقعة واحدة (مصفوفة uint8)، أو None إن لم يوجد جلد."""
+    roi = gray_world_wb(bgr_roi)
+    mask = skin_mask_ycrcb(roi)
+    if not cv2.countNonZero(mask):
+        return None
+    # تحويل Lab واحد للرقعة؛ نأخذ قناة L فقط (A و B لا تدخل في التصنيف)
+    lab = cv2.cvtColor(roi, cv2.COLOR_BGR2LAB)
+    return lab[..., 0][mask > 0]
+
+
+def classify_lightness(L_med):
+    if L_med >= LIGHT_MIN_L:
+        return 'Light'
+    if L_med >= MEDIUM_MIN_L:
+        return 'Medium'
+    return 'Dark'
+
+
+def estimate_skin_tone(image_bgr, landmarks, patch):
+    """
+    ❸ لون البشرة من عدّة رقع حول الخدين والجبهة.
+    landmarks معيارية (478, 2|3)، و`patch` نصف ضلع الرقعة ببكسلات `image_bgr` نفسها.
+    """
+    h, w = image_bgr.shape[:2]
+    centers = (np.asarray(landmarks)[SAMPLE_INDICES, :2] * (w, h)).astype(int)
+
+    parts = []
+    for cx, cy in centers:
+        x0, x1 = max(0, cx - patch), min(w, cx + patch)
+        y0, y1 = max(0, cy - patch), min(h, cy + patch)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        values = patch_lightness(image_bgr[y0:y1, x0:x1])
+        if values is not None:
+            parts.append(values)
+    return classify_parts(parts)
+
+
+def estimate_skin_tone_from_patches(patches_bgr):
+    """
+    لون البشرة من رقع جاهزة قصّها العميل حول نفس النقاط (SAMPLE_INDICES)،
+    بدل الصورة الكاملة. بدون رقع → Unknown.
+    """
+    parts = [v for v in map(patch_lightness, patches_bgr) if v is not None]
+    return classify_parts(parts)
+
+
+def classify_parts(parts):
+    """يدمج قيم L لكل الرقع ويصنّفها."""
+    L_vals = np.concatenate(parts) if parts else np.empty(0, np.uint8)
+    # لو ما قدرنا نستخرج جلد كفاية، نرجع Unknown
+    if L_vals.size < MIN_SKIN_PIXELS:
+        return 'Unknown'
+    # وسطي متين (Median) لمقاومة الضوضاء/الظلال
+    return classify_lightness(float(np.median(L_vals)))
@@ -0,0 +1,184 @@
+# face/streaming.py
+"""
+وضع البث المباشر للتجربة الافتراضية (webcam try-on) عبر WebSocket على ASGI.
+
+العميل يرسل إطارات JPEG/PNG كرسائل binary على /ws/face/stream/، والخادم يرد
+برسالة JSON فقط عندما يتغير face_shape أو skin_tone أو يتحرك face_width_cm
+بمقدار STREAM_WIDTH_STEP_CM. إذا وصلت إطارات أسرع من المعالجة نعالج الأحدث فقط.
+الإطار الأكبر من STREAM_MAX_FRAME_BYTES يغلق الاتصال (1009) قبل أي فك ترميز.
+"""
+import asyncio
+import json
+import threading
+from collections import Counter, deque
+
+import cv2
+
+from . import geometry
+from .backends import MediaPipeBackend
+from .conf import face_setting
+from .fuzzy import classifier, shape_features
+from .pipeline import MEASUREMENT_KEYS, make_payload
+from .preprocess import prepare_image
+from .skin_tone import estimate_skin_tone
+
+
+STREAM_PATH = "/ws/face/stream/"
+
+_sessions = None
+_sessions_lock = threading.Lock()
+
+
+def _session_slots():
+    global _sessions
+    with _sessions_lock:
+        if _sessions is None:
+            _sessions = threading.BoundedSemaphore(face_setting("STREAM_MAX_SESSIONS"))
+    return _sessions
+
+
+class FaceTracker:
+    """
+    حالة جلسة بث واحدة: FaceMesh بوضع التتبع (static_image_mode=False) يستفيد من
+    الإطار السابق بدل إعادة الكشف الكامل، مع تنعيم أُسّي للقياسات عبر الزمن.
+    ليست آمنة للخيوط: إطار واحد في كل مرة.
+    """
+
+    def __init__(self, smoothing=None, width_step_cm=None, skin_tone_every=None):
+        self.smoothing = face_setting("STREAM_SMOOTHING") if smoothing is None else smoothing
+        self.width_step_cm = face_setting("STREAM_WIDTH_STEP_CM") if width_step_cm is None else width_step_cm
+        self.skin_tone_every = skin_tone_every or face_setting("STREAM_SKIN_TONE_EVERY")
+        self.mesh = MediaPipeBackend(static_image_mode=False)
+        self.face_visible = None
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.smoothed = None
+        self.tones = deque(maxlen=5)
+        self.last_sent = None
+
+    def close(self):
+        self.mesh.close()
+
+    def _skin_tone(self, prepared, landmarks):
+        # لون البشرة لا يتغير بين الإطارات؛ نعيد حسابه كل عدة إطارات ونأخذ الأغلبية
+        if (self.frames - 1) % self.skin_tone_every == 0 or not self.tones:
+            w, h = prepared.original_size
+            patch = prepared.to_working_px(max(10, int(min(w, h) * 0.02)))
+            tone = estimate_skin_tone(prepared.image_bgr, landmarks, patch)
+            if tone != 'Unknown':
+                self.tones.append(tone)
+        return Counter(self.tones).most_common(1)[0][0] if self.tones else 'Unknown'
+
+    def _smooth(self, current):
+        if self.smoothed is None:
+            self.smoothed = current
+        else:
+            a = self.smoothing
+            self.smoothed = {k: a * current[k] + (1 - a) * self.smoothed[k] for k in current}
+        return self.smoothed
+
+    def _changed(self, state):
+        last = self.last_sent
+        return (
+            last is None
+            or state['face_shape'] != last['face_shape']
+            or state['skin_tone'] != last['skin_tone']
+            or abs(state['face_width_cm'] - last['face_width_cm']) >= self.width_step_cm
+        )
+
+    def process_frame(self, data):
+        """يعيد رسالة (dict) إذا تغيرت النتيجة، وإلا None."""
+        prepared = prepare_image(data)
+        if prepared is None:
+            return {'error': "Error reading image", 'code': "invalid_image"}
+
+        faces = self.mesh.process(cv2.cvtColor(prepared.image_bgr, cv2.COLOR_BGR2RGB))
+        if not faces:
+            # نبلّغ مرة واحدة عند اختفاء الوجه ونبدأ التنعيم من جديد عند عودته
+            if self.face_visible is False:
+                return None
+            self.face_visible = False
+            self.reset()
+            return {'face': False}
+
+        self.face_visible = True
+        self.frames += 1
+        landmarks = faces[0]
+        m = geometry.measure_faces(geometry.to_pixels(landmarks, prepared.original_size))
+        if m['pupil_px'][0] < geometry.EPS:
+            return None
+
+        smoothed = self._smooth({k: float(m[k][0]) for k in MEASUREMENT_KEYS})
+        face_shapes, scores = classifier.classify(shape_features(*(smoothed[k] for k in MEASUREMENT_KEYS)))
+        state = {
+            'face_shape': face_shapes[0],
+            'face_width_cm': smoothed['face_width_cm'],
+            'skin_tone': self._skin_tone(prepared, landmarks),
+        }
+        if not self._changed(state):
+            return None
+        self.last_sent = state
+        return {'face': True, **make_payload(state['face_shape'], smoothed, state['skin_tone'],
+                                             shape_scores=classifier.score_dict(scores[0]))}
+
+
+async def face_stream_app(scope, receive, send):
+    """تطبيق ASGI خام لمسار STREAM_PATH (بدون اعتماد على Channels)."""
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+
+    slots = _session_slots()
+    if not slots.acquire(blocking=False):
+        # 1013 = Try Again Later
+        await send({"type": "websocket.close", "code": 1013})
+        return
+
+    tracker = None
+    try:
+        await send({"type": "websocket.accept"})
+        tracker = await asyncio.to_thread(FaceTracker)
+
+        latest = None
+        too_large = False
+        max_bytes = face_setting("STREAM_MAX_FRAME_BYTES")
+        frame_ready = asyncio.Event()
+        closed = asyncio.Event()
+
+        async def reader():
+            nonlocal latest, too_large
+            while True:
+                msg = await receive()
+                if msg["type"] == "websocket.disconnect":
+                    break
+                if msg["type"] == "websocket.receive" and msg.get("bytes"):
+                    if len(msg["bytes"]) > max_bytes:
+                        too_large = True
+                        break
+                    latest = msg["bytes"]      # الأحدث يحل محل إطار لم يُعالج بعد
+                    frame_ready.set()
+            closed.set()
+            frame_ready.set()
+
+        reader_task = asyncio.create_task(reader())
+        try:
+            while not closed.is_set():
+                await frame_ready.wait()
+                frame_ready.clear()
+                if latest is None:
+                    continue
+                frame, latest = latest, None
+                update = await asyncio.to_thread(tracker.process_frame, frame)
+                if update is not None and not closed.is_set():
+                    await send({"type": "websocket.send", "text": json.dumps(update)})
+            if too_large:
+                # 1009 = Message Too Big
+                await send({"type": "websocket.close", "code": 1009})
+        finally:
+            reader_task.cancel()
+    finally:
+        if tracker is not None:
+            tracker.close()
+        slots.release()
@@ -1,3 +1,1437 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from experta import L, P, Rule
+from PIL import Image, ImageOps
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import backends, geometry, pool, quality, skin_tone, streaming
+from .cache import CACHE_HEADER, content_key
+from .conf import face_setting
+from .fuzzy import FACE_SHAPES, classifier, shape_features
+from .kbs_engine import (
+    FACE_WIDTH_SIZES, CompiledGlassesRecommender, FaceData, GlassesRecommender, Range, glasses_recommender,
+)
+from .models import FaceAnalysis
+from .pipeline import MEASUREMENT_KEYS, FaceAnalysisError, extract_face as pipeline_extract_face
+from .preprocess import EXIF_ORIENTATION_TAG, prepare_image
+from .serializers import ClientLandmarksSerializer
+from .views import FaceMetricsView
+from users.models import CustomUser
+
+
+class CompiledGlassesRecommenderTests(SimpleTestCase):
+    """الجداول المترجمة تعطي نفس مخرجات محرك experta على كامل مجال المدخلات."""
+
+    SHAPES = (None, *FACE_SHAPES, 'Unknown', '')
+    TONES = (None, 'Dark', 'Medium', 'Light', 'Unknown')
+
+    @classmethod
+    def width_classes(cls):
+        # كل حد ومجاوراه المباشران، منتصف كل مجال، الطرفان، والقيم الخاصة
+        bounds, _, _ = glasses_recommender.ensure_compiled().intervals['face_width_cm']
+        widths = [None, math.nan, math.inf, -math.inf, 0.0, bounds[0] - 5.0, bounds[-1] + 5.0]
+        for b in bounds:
+            widths += [float(np.nextafter(b, -math.inf)), b, float(np.nextafter(b, math.inf))]
+        widths += [(lo + hi) / 2 for lo, hi in zip(bounds, bounds[1:])]
+        return widths
+
+    @staticmethod
+    def expected(*args):
+        try:
+            return GlassesRecommender().run_engine(*args)
+        except ValueError:
+            return ValueError
+
+    @staticmethod
+    def compiled(*args):
+        try:
+            return glasses_recommender.run_engine(*args)
+        except ValueError:
+            return ValueError
+
+    def assertSameOutput(self, args):
+        expected, actual = self.expected(*args), self.compiled(*args)
+        self.assertEqual(actual, expected, msg=f"run_engine{args!r}")
+
+    def test_exhaustive_equivalence(self):
+        for args in itertools.product(self.SHAPES, self.width_classes(), self.TONES):
+            self.assertSameOutput(args)
+
+    def test_width_sweep(self):
+        for w in np.round(np.arange(10.0, 16.0, 0.01), 2):
+            self.assertSameOutput(('Oval', float(w), 'Dark'))
+
+    def test_invalid_types_raise_like_experta(self):
+        for args in ((5, 13.0, 'Dark'), ('Oval', 13, 'Dark'), ('Oval', '13.0', 'Dark'),
+                     ('Oval', 13.0, ['Dark']), (['Oval'], None, None), ('Oval', True, None)):
+            self.assertIs(self.expected(*args), ValueError, msg=args)
+            self.assertIs(self.compiled(*args), ValueError, msg=args)
+
+    def test_results_are_independent_copies(self):
+        first = glasses_recommender.run_engine('Oval', 13.0, 'Dark')
+        first['recommended_shape'].append('Mutated')
+        self.assertNotIn('Mutated', glasses_recommender.run_engine('Oval', 13.0, 'Dark')['recommended_shape'])
+
+    def test_bounds_come_from_the_threshold_table(self):
+        bounds, _, _ = glasses_recommender.ensure_compiled().intervals['face_width_cm']
+        self.assertEqual(bounds, sorted(set().union(*(r.bounds for r in FACE_WIDTH_SIZES.values()))))
+
+    def test_predicates_without_declared_bounds_are_rejected(self):
+        def over_fifteen(w):
+            return w > 15.0
+
+        for constraint in (P(lambda w: w > 15.0), P(over_fifteen), ~P(Range(hi=15.0)),
+                           P(Range(hi=12.0)) | P(Range(lo=15.0)), L(15.0) | L(16.0)):
+            engine = type('Engine', (GlassesRecommender,), {
+                'size_huge': Rule(FaceData(face_width_cm=constraint))(lambda self: None),
+            })
+            with self.subTest(constraint=constraint), self.assertRaisesRegex(ValueError, 'face_width_cm'):
+                CompiledGlassesRecommender(engine_class=engine).compile()
+
+
+class PreparedImageTests(SimpleTestCase):
+    """
+    كل اتجاهات EXIF الثمانية تعطي نفس الصورة المعروضة (بمرجع PIL.ImageOps.exif_transpose)،
+    والإحداثيات في الصورة المصغرة تعود لنفس البكسلات الأصلية.
+    """
+
+    WIDTH, HEIGHT = 800, 600
+    RED = (40, 120, 200, 200)        # x, y, w, h في الصورة كما تُعرض (بعد تطبيق EXIF)
+    BLUE = (560, 60, 120, 80)
+    # عكس تحويل كل اتجاه: البكسلات المخزنة التي تُعرض كالمرجع بعد تطبيق الاتجاه
+    STORED = {
+        1: None,
+        2: Image.Transpose.FLIP_LEFT_RIGHT,
+        3: Image.Transpose.ROTATE_180,
+        4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE,
+        6: Image.Transpose.ROTATE_90,
+        7: Image.Transpose.TRANSVERSE,
+        8: Image.Transpose.ROTATE_270,
+    }
+
+    @classmethod
+    def reference(cls):
+        image = np.full((cls.HEIGHT, cls.WIDTH, 3), 235, dtype=np.uint8)
+        for (x, y, w, h), bgr in ((cls.RED, (0, 0, 255)), (cls.BLUE, (255, 0, 0))):
+            image[y:y + h, x:x + w] = bgr
+        return image
+
+    def encode(self, orientation):
+        image = Image.fromarray(cv2.cvtColor(self.reference(), cv2.COLOR_BGR2RGB))
+        if self.STORED[orientation] is not None:
+            image = image.transpose(self.STORED[orientation])
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION_TAG] = orientation
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=95, exif=exif.tobytes())
+        return buffer.getvalue()
+
+    @staticmethod
+    def box(image_bgr, channel):
+        """(x, y, w, h) للبكسلات التي تغلب عليها القناة channel."""
+        other = [c for c in range(3) if c != channel]
+        mask = (image_bgr[..., channel] > 150) & (image_bgr[..., other].max(axis=2) < 100)
+        ys, xs = np.nonzero(mask)
+        return xs.min(), ys.min(), xs.max() - xs.min() + 1, ys.max() - ys.min() + 1
+
+    def test_orientations_match_pil_and_map_back(self):
+        for orientation, max_side in itertools.product(self.STORED, (None, 300, 100)):
+            with self.subTest(orientation=orientation, max_side=max_side):
+                data = self.encode(orientation)
+                shown = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+                self.assertEqual(shown.size, (self.WIDTH, self.HEIGHT))
+
+                prepared = prepare_image(data, max_side=max_side or 0)
+                self.assertEqual(prepared.original_size, (self.WIDTH, self.HEIGHT))
+                h, w = prepared.image_bgr.shape[:2]
+                self.assertLessEqual(max(w, h), max_side or self.WIDTH)
+                self.assertAlmostEqual(w / h, self.WIDTH / self.HEIGHT, delta=0.02)
+
+                # مقارنة بالمرجع المستقل بعد تصغيره لنفس الحجم
+                expected = cv2.resize(cv2.cvtColor(np.asarray(shown), cv2.COLOR_RGB2BGR), (w, h),
+                                      interpolation=cv2.INTER_AREA)
+                diff = np.abs(prepared.image_bgr.astype(int) - expected.astype(int)).max(axis=2)
+                self.assertLess(np.mean(diff > 60), 0.02)
+
+                # بكسلات العمل (كإحداثيات FaceMesh المعيارية) → بكسلات أصلية
+                tolerance = 2 / prepared.scale + 2
+                for channel, (x, y, bw, bh) in ((2, self.RED), (0, self.BLUE)):
+                    wx, wy, ww, wh = self.box(prepared.image_bgr, channel)
+                    ox, oy = wx / w * self.WIDTH, wy / h * self.HEIGHT
+                    self.assertAlmostEqual(ox, x, delta=tolerance)
+                    self.assertAlmostEqual(oy, y, delta=tolerance)
+                    self.assertAlmostEqual(prepared.to_working_px(bw), ww, delta=2)
+                    self.assertAlmostEqual(prepared.to_working_px(bh), wh, delta=2)
+
+    def test_to_working_px(self):
+        prepared = prepare_image(self.encode(6), max_side=300)
+        self.assertEqual(prepared.image_bgr.shape[:2], (225, 300))
+        self.assertAlmostEqual(prepared.scale, 300 / self.WIDTH)
+        self.assertEqual(prepared.to_working_px(self.WIDTH), 300)
+        self.assertEqual(prepared.to_working_px(80), 30)
+        self.assertEqual(prepared.to_working_px(0.1), 1)       # لا يقل عن بكسل
+
+    def test_undecodable(self):
+        self.assertIsNone(prepare_image(b"not an image"))
+
+
+# ------------------------------
+# نسخة مجمدة من القياس القديم لوجه واحد (face/views.py قبل face/geometry.py)
+# ------------------------------
+def baseline_corrected_px(landmarks, w, h):
+    """دالة corrected_px القديمة: بكسلات النقطة بعد التدوير حول منتصف العينين."""
+    def lm_to_px(lm):
+        return np.array([lm[0] * w, lm[1] * h], dtype=np.float64)
+
+    def rotate_point(point, center, angle_rad):
+        R = np.array([[np.cos(angle_rad), -np.sin(angle_rad)],
+                      [np.sin(angle_rad),  np.cos(angle_rad)]], dtype=np.float64)
+        return (R @ (point - center)) + center
+
+    left_eye_outer = lm_to_px(landmarks[33])
+    right_eye_outer = lm_to_px(landmarks[263])
+    eye_center = (left_eye_outer + right_eye_outer) / 2.0
+    angle_rad = np.arctan2(right_eye_outer[1] - left_eye_outer[1], right_eye_outer[0] - left_eye_outer[0])
+    return lambda lm: rotate_point(lm_to_px(lm), eye_center, -angle_rad)
+
+
+def baseline_measure(landmarks, w, h):
+    corrected_px = baseline_corrected_px(landmarks, w, h)
+
+    def euclidean(p1, p2):
+        return float(np.linalg.norm(p1 - p2))
+
+    pupil_d_avg = (euclidean(corrected_px(landmarks[469]), corrected_px(landmarks[471]))
+                   + euclidean(corrected_px(landmarks[474]), corrected_px(landmarks[476]))) / 2.0
+    if pupil_d_avg < 1e-6:
+        return None
+    scale = 1.3 / pupil_d_avg
+    return {
+        'jaw_width_cm': euclidean(corrected_px(landmarks[135]), corrected_px(landmarks[364])) * scale,
+        'face_height_cm': euclidean(corrected_px(landmarks[10]), corrected_px(landmarks[152])) / 0.88 * scale,
+        'forehead_width_cm': euclidean(corrected_px(landmarks[54]), corrected_px(landmarks[284])) * scale,
+        'face_width_cm': euclidean(corrected_px(landmarks[123]), corrected_px(landmarks[352])) * scale,
+    }
+
+
+def scalar_head_pose(landmarks, w, h):
+    """head_pose لوجه واحد بعمليات عددية مفردة (مرجع للنسخة المجمعة)."""
+    def point(i):
+        x, y, z = landmarks[i]
+        return x * w, y * h, z * w
+
+    (lx, ly, lz), (rx, ry, rz) = point(geometry.FACE_LEFT_EDGE), point(geometry.FACE_RIGHT_EDGE)
+    (tx, ty, tz), (cx, cy, cz) = point(geometry.FOREHEAD_TOP), point(geometry.CHIN)
+    yaw = math.degrees(math.atan2(rz - lz, math.hypot(rx - lx, ry - ly)))
+    pitch = math.degrees(math.atan2(-(cz - tz), math.hypot(cx - tx, cy - ty))) - geometry.NEUTRAL_PITCH_DEG
+    return yaw, pitch
+
+
+class GeometryTests(SimpleTestCase):
+    """القياس والوضعية المجمّعان = الحساب القديم لكل وجه على حدة، لدفعة من وجه واحد أو أكثر."""
+
+    @staticmethod
+    def random_faces(rng, n):
+        faces = rng.uniform(0.2, 0.8, size=(n, 478, 3))
+        faces[..., 2] = rng.normal(0, 0.05, size=(n, 478))
+        # ميلان عشوائي لخط العينين حتى يعمل تصحيح الميلان فعلًا
+        for face in faces:
+            cx, cy = rng.uniform(0.4, 0.6, size=2)
+            angle, half = rng.uniform(-0.6, 0.6), rng.uniform(0.05, 0.2)
+            face[33, :2] = cx - half * math.cos(angle), cy - half * math.sin(angle)
+            face[263, :2] = cx + half * math.cos(angle), cy + half * math.sin(angle)
+        sizes = rng.integers(200, 2000, size=(n, 2))
+        return faces, sizes
+
+    def assertMatchesBaseline(self, faces, sizes):
+        # المسافات لا تتأثر بالتدوير: النقاط المصححة نفسها تُقارن بـ corrected_px القديمة
+        corrected = geometry.correct_tilt(geometry.to_pixels(faces, sizes))
+        for i, (face, (w, h)) in enumerate(zip(faces, sizes)):
+            corrected_px = baseline_corrected_px(face, w, h)
+            expected = np.array([corrected_px(lm) for lm in face])
+            np.testing.assert_allclose(corrected[i], expected, rtol=0, atol=1e-9)
+            self.assertAlmostEqual(corrected[i, 33, 1], corrected[i, 263, 1], places=9)
+
+        m = geometry.measure_faces(geometry.to_pixels(faces, sizes))
+        yaw, pitch = geometry.head_pose(faces, sizes)
+        self.assertEqual(yaw.shape, (len(faces),))
+        for i, (face, (w, h)) in enumerate(zip(faces, sizes)):
+            expected = baseline_measure(face, w, h)
+            if expected is None:
+                self.assertLess(m['pupil_px'][i], geometry.EPS)
+                self.assertTrue(np.isnan(m['face_width_cm'][i]))
+            else:
+                for key, value in expected.items():
+                    self.assertAlmostEqual(m[key][i], value, delta=1e-9 * max(1.0, abs(value)), msg=(i, key))
+            expected_yaw, expected_pitch = scalar_head_pose(face, w, h)
+            self.assertAlmostEqual(yaw[i], expected_yaw, places=9)
+            self.assertAlmostEqual(pitch[i], expected_pitch, places=9)
+
+    def test_single_face_batches(self):
+        rng = np.random.default_rng(4)
+        for _ in range(50):
+            faces, sizes = self.random_faces(rng, 1)
+            self.assertMatchesBaseline(faces, sizes)
+            # (478, 3) بدون بُعد الدفعة و sizes كزوج واحد
+            m = geometry.measure_faces(geometry.to_pixels(faces[0], tuple(sizes[0])))
+            self.assertAlmostEqual(m['face_width_cm'][0], baseline_measure(faces[0], *sizes[0])['face_width_cm'])
+
+    def test_multi_face_batches(self):
+        rng = np.random.default_rng(5)
+        for n in (2, 3, 8):
+            faces, sizes = self.random_faces(rng, n)
+            self.assertMatchesBaseline(faces, sizes)
+
+    def test_undetected_iris_in_batch(self):
+        rng = np.random.default_rng(6)
+        faces, sizes = self.random_faces(rng, 3)
+        faces[1, [471, 476]] = faces[1, [469, 474]]
+        self.assertMatchesBaseline(faces, sizes)
+        m = geometry.measure_faces(geometry.to_pixels(faces, sizes))
+        self.assertFalse(np.isnan(m['face_width_cm'][[0, 2]]).any())
+
+
+def baseline_skin_tone(image_bgr, landmarks, patch):
+    """نسخة مجمّدة من حساب لون البشرة القديم في face/views.py (مرجع لـ skin_tone)."""
+    h, w = image_bgr.shape[:2]
+
+    def gray_world_wb(bgr_roi):
+        roi = bgr_roi.astype(np.float32)
+        mean_b, mean_g, mean_r = roi[..., 0].mean() + 1e-6, roi[..., 1].mean() + 1e-6, roi[..., 2].mean() + 1e-6
+        gray = (mean_b + mean_g + mean_r) / 3.0
+        roi[..., 0] *= (gray / mean_b)
+        roi[..., 1] *= (gray / mean_g)
+        roi[..., 2] *= (gray / mean_r)
+        return np.clip(roi, 0, 255).astype(np.uint8)
+
+    def skin_mask_ycrcb(bgr_roi):
+        ycrcb = cv2.cvtColor(bgr_roi, cv2.COLOR_BGR2YCrCb)
+        mask = cv2.inRange(ycrcb, (0, 133, 77), (255, 173, 127))
+        kernel = np.ones((3, 3), np.uint8)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=1)
+        return mask
+
+    L_vals = []
+    for idx in (234, 454, 10):
+        cx, cy = int(landmarks[idx][0] * w), int(landmarks[idx][1] * h)
+        x0, x1 = max(0, cx - patch), min(w, cx + patch)
+        y0, y1 = max(0, cy - patch), min(h, cy + patch)
+        roi = image_bgr[y0:y1, x0:x1]
+        if roi.size == 0:
+            continue
+        roi = gray_world_wb(roi)
+        mask = skin_mask_ycrcb(roi)
+        if mask.sum() < 50:
+            continue
+        lab = cv2.cvtColor(roi, cv2.COLOR_BGR2LAB)
+        L_vals.extend(lab[..., 0][mask > 0].flatten().tolist())
+
+    if len(L_vals) < 100:
+        return 'Unknown', None
+    L_med = float(np.median(L_vals))
+    if L_med >= 170:
+        return 'Light', L_med
+    if L_med >= 125:
+        return 'Medium', L_med
+    return 'Dark', L_med
+
+
+class SkinToneTests(SimpleTestCase):
+    """skin_tone يعطي نفس وسيط L ونفس التصنيف الذي يعطيه الحساب القديم، خصوصًا حول الحدين."""
+
+    PATCH = 20
+
+    @staticmethod
+    def synthetic_image(rng, k, h=240, w=320, skin_ratio=0.5):
+        # كتل بلون بشرة بسطوع k على خلفية متممة له (متوسط الصورة رمادي → توازن الأبيض لا يمحو اللون)
+        skin = np.array([110.0, 140.0, 190.0]) * k
+        image = np.empty((h, w, 3))
+        image[:] = 2 * skin.mean() - skin
+        blocks = rng.random((h // 8, w // 8)) < skin_ratio
+        image[np.kron(blocks, np.ones((8, 8), bool))] = skin
+        image += rng.normal(0, 6, image.shape)
+        return np.clip(image, 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def random_landmarks(rng, low=0.1, high=0.9):
+        landmarks = np.zeros((478, 3))
+        landmarks[list(skin_tone.SAMPLE_INDICES), :2] = rng.uniform(low, high, size=(3, 2))
+        return landmarks
+
+    def crops(self, image, landmarks):
+        h, w = image.shape[:2]
+        out = []
+        for cx, cy in (landmarks[list(skin_tone.SAMPLE_INDICES), :2] * (w, h)).astype(int):
+            out.append(image[max(0, cy - self.PATCH):min(h, cy + self.PATCH),
+                             max(0, cx - self.PATCH):min(w, cx + self.PATCH)])
+        return out
+
+    def assertMatchesBaseline(self, image, landmarks):
+        tone, L_med = baseline_skin_tone(image, landmarks, self.PATCH)
+        self.assertEqual(skin_tone.estimate_skin_tone(image, landmarks, self.PATCH), tone)
+        crops = self.crops(image, landmarks)
+        self.assertEqual(skin_tone.estimate_skin_tone_from_patches(crops), tone)
+        if L_med is not None:
+            parts = [v for v in map(skin_tone.patch_lightness, crops) if v is not None]
+            self.assertEqual(float(np.median(np.concatenate(parts))), L_med)
+        return L_med
+
+    def test_brightness_sweep(self):
+        rng = np.random.default_rng(7)
+        for k in np.linspace(0.3, 1.4, 23):
+            with self.subTest(k=k):
+                self.assertMatchesBaseline(self.synthetic_image(rng, k), self.random_landmarks(rng))
+
+    def test_near_thresholds(self):
+        rng = np.random.default_rng(8)
+        medians = []
+        for k in itertools.chain(np.linspace(0.76, 0.81, 26), np.linspace(1.05, 1.11, 31)):
+            with self.subTest(k=k):
+                medians.append(self.assertMatchesBaseline(self.synthetic_image(rng, k), self.random_landmarks(rng)))
+        # الاجتياح يغطي فعلًا القيم على جانبي كل حد
+        for threshold in (skin_tone.MEDIUM_MIN_L, skin_tone.LIGHT_MIN_L):
+            self.assertIn(threshold - 1, medians)
+            self.assertIn(threshold, medians)
+
+    def test_unknown(self):
+        rng = np.random.default_rng(9)
+        # بدون جلد، ثم جلد قليل جدًا (أقل من MIN_SKIN_PIXELS)
+        for ratio in (0.0, 0.02):
+            image = self.synthetic_image(rng, 1.0, skin_ratio=ratio)
+            self.assertIsNone(self.assertMatchesBaseline(image, self.random_landmarks(rng)))
+        self.assertEqual(skin_tone.estimate_skin_tone_from_patches([]), 'Unknown')
+
+    def test_patches_clipped_at_border(self):
+        rng = np.random.default_rng(10)
+        for _ in range(10):
+            self.assertMatchesBaseline(self.synthetic_image(rng, 1.0), self.random_landmarks(rng, 0.0, 0.999))
+
+
+class FaceMetricsPermissionTests(SimpleTestCase):
+    """/api/face/metrics/ لا يُفتح لمجرد أن الطلب جاء من 127.0.0.1 (reverse proxy محلي)."""
+
+    def get(self, user=None, **headers):
+        request = APIRequestFactory().get("/api/face/metrics/", REMOTE_ADDR="127.0.0.1", **headers)
+        if user is not None:
+            force_authenticate(request, user=user)
+        return FaceMetricsView.as_view()(request)
+
+    def test_local_anonymous_rejected(self):
+        self.assertIn(self.get().status_code, (401, 403))
+
+    def test_staff(self):
+        self.assertEqual(self.get(User(username="admin", is_staff=True)).status_code, 200)
+        self.assertEqual(self.get(User(username="user")).status_code, 403)
+
+    def test_token(self):
+        with override_settings(FACE_ANALYSIS={"METRICS_TOKEN": "s3cret"}):
+            self.assertEqual(self.get(HTTP_X_METRICS_TOKEN="s3cret").status_code, 200)
+            self.assertIn(self.get(HTTP_X_METRICS_TOKEN="wrong").status_code, (401, 403))
+            self.assertIn(self.get(HTTP_X_METRICS_TOKEN="").status_code, (401, 403))
+        # بدون METRICS_TOKEN لا تفتح أي ترويسة النقطة
+        with override_settings(FACE_ANALYSIS={"METRICS_TOKEN": None}):
+            self.assertIn(self.get(HTTP_X_METRICS_TOKEN="s3cret").status_code, (401, 403))
+
+
+def baseline_shape_scores(face_height_cm, face_width_cm, jaw_w, forehead_w):
+    """نسخة مجمّدة من التقييم الضبابي القديم في face/views.py (دوال trapmf/gaussmf لكل قيمة)."""
+    eps = 1e-6
+    ar = face_height_cm / max(face_width_cm, eps)
+    jw_fw = jaw_w / max(forehead_w, eps)
+    cb_fw = face_width_cm / max(forehead_w, eps)
+    cb_jw = face_width_cm / max(jaw_w, eps)
+
+    def trapmf(x, a, b, c, d):
+        if x <= a or x >= d: return 0.0
+        if b <= x <= c: return 1.0
+        if a < x < b: return (x - a) / max((b - a), eps)
+        if c < x < d: return (d - x) / max((d - c), eps)
+        return 0.0
+
+    def gaussmf(x, mu, sigma):
+        return float(np.exp(-0.5 * ((x - mu) / (sigma + eps)) ** 2))
+
+    ar_short = trapmf(ar, 0.80, 0.90, 1.05, 1.15)
+    ar_medium = trapmf(ar, 1.05, 1.20, 1.35, 1.50)
+    ar_tall = trapmf(ar, 1.35, 1.55, 1.80, 2.10)
+    jw_eq_fw = gaussmf(jw_fw, 1.0, 0.08)
+    jw_gt_fw = trapmf(jw_fw, 1.05, 1.12, 1.40, 1.80)
+    jw_lt_fw = trapmf(jw_fw, 0.55, 0.70, 0.92, 0.98)
+    cb_prom_over_fw = trapmf(cb_fw, 1.05, 1.12, 1.40, 1.80)
+    cb_prom_over_jw = trapmf(cb_jw, 1.05, 1.12, 1.40, 1.80)
+
+    scores = {
+        'Square':   0.45*ar_short + 0.35*jw_eq_fw + 0.20*(1.0 - cb_prom_over_fw),
+        'Round':    0.50*gaussmf(ar, 1.0, 0.06) + 0.25*jw_eq_fw + 0.25*cb_prom_over_fw,
+        'Oval':     0.55*ar_medium + 0.25*jw_eq_fw + 0.20*cb_prom_over_fw,
+        'Oblong':   0.70*ar_tall + 0.15*jw_eq_fw + 0.15*(1.0 - cb_prom_over_fw),
+        'Heart':    0.45*ar_medium + 0.40*jw_lt_fw + 0.15*cb_prom_over_fw,
+        'Triangle': 0.45*ar_medium + 0.40*jw_gt_fw + 0.15*(1.0 - cb_prom_over_fw),
+        'Diamond':  0.40*ar_medium + 0.30*cb_prom_over_fw + 0.20*cb_prom_over_jw + 0.10*jw_eq_fw,
+    }
+    ssum = sum(scores.values()) + eps
+    scores = {k: float(v) / ssum for k, v in scores.items()}
+    return max(scores, key=scores.get), scores
+
+
+class FuzzyShapeClassifierTests(SimpleTestCase):
+    """FuzzyShapeClassifier بجداول MEMBERSHIPS/RULES = التقييم الضبابي القديم لكل وجه."""
+
+    # نقاط الانكسار لكل نسبة (a, b, c, d لكل شبه منحرف) وقيم بينها
+    AR = (0.80, 0.90, 1.0, 1.05, 1.15, 1.20, 1.35, 1.50, 1.55, 1.80, 2.10, 2.5)
+    JW_FW = (0.5, 0.55, 0.70, 0.92, 0.98, 1.0, 1.05, 1.12, 1.40, 1.80, 2.0)
+    CB_FW = (1.0, 1.05, 1.12, 1.40, 1.80, 2.0)
+
+    def assertMatchesBaseline(self, measurements):
+        measurements = np.asarray(measurements, dtype=np.float64)
+        shapes, scores = classifier.classify(shape_features(*measurements.T))
+        self.assertEqual(scores.shape, (len(measurements), len(FACE_SHAPES)))
+        for row, (shape, got) in enumerate(zip(shapes, scores)):
+            expected_shape, expected = baseline_shape_scores(*measurements[row])
+            np.testing.assert_allclose(got, [expected[s] for s in FACE_SHAPES], rtol=0, atol=1e-12)
+            top = sorted(expected.values(), reverse=True)
+            if top[0] - top[1] > 1e-9:      # التعادل التام قد يُحسم بفرق ulp
+                self.assertEqual(shape, expected_shape, msg=measurements[row])
+
+    def test_breakpoints(self):
+        # forehead = 1: jw_fw = jaw، cb_fw = عرض الوجه، ar = الطول / العرض
+        rows = [
+            (ar * cb_fw, cb_fw, jw_fw, 1.0)
+            for ar, jw_fw, cb_fw in itertools.product(self.AR, self.JW_FW, self.CB_FW)
+        ]
+        self.assertMatchesBaseline(rows)
+
+    def test_random_batches(self):
+        rng = np.random.default_rng(11)
+        for n in (1, 2, 64):
+            widths = rng.uniform(10, 18, size=n)
+            rows = np.stack([
+                widths * rng.uniform(0.7, 2.2, size=n),
+                widths,
+                widths * rng.uniform(0.5, 1.1, size=n),
+                widths * rng.uniform(0.5, 1.1, size=n),
+            ], axis=1)
+            self.assertMatchesBaseline(rows)
+
+    def test_degenerate_widths(self):
+        self.assertMatchesBaseline([(15.0, 0.0, 0.0, 0.0), (15.0, 12.0, 0.0, 10.0), (0.0, 12.0, 11.0, 0.0)])
+
+    def test_single_face(self):
+        shapes, scores = classifier.classify(shape_features(18.0, 14.0, 11.5, 12.0))
+        expected_shape, expected = baseline_shape_scores(18.0, 14.0, 11.5, 12.0)
+        self.assertEqual(shapes, [expected_shape])
+        self.assertEqual(classifier.score_dict(scores[0]), {k: round(v, 4) for k, v in expected.items()})
+
+
+def encode_patch(patch_bgr, ext=".png"):
+    ok, buf = cv2.imencode(ext, patch_bgr)
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+class ClientLandmarksTests(SimpleTestCase):
+    """وضع الملامح من العميل: التحقق في ClientLandmarksSerializer ومطابقة نتيجة الصورة."""
+
+    URL = "/api/face/analyze-face/"
+
+    def setUp(self):
+        rng = np.random.default_rng(12)
+        faces, _ = GeometryTests.random_faces(rng, 1)
+        self.landmarks = faces[0]
+        self.image = SkinToneTests.synthetic_image(rng, 1.0)
+        self.client = APIClient()
+
+    def data(self, landmarks=None, **extra):
+        h, w = self.image.shape[:2]
+        landmarks = self.landmarks if landmarks is None else landmarks
+        return {"landmarks": np.asarray(landmarks).tolist(), "image_width": w, "image_height": h, **extra}
+
+    def validate(self, **kwargs):
+        serializer = ClientLandmarksSerializer(data=self.data(**kwargs))
+        return serializer.is_valid(), serializer.errors
+
+    def test_point_count(self):
+        for n in (468, 477, 479):
+            with self.subTest(n=n):
+                valid, errors = self.validate(landmarks=self.landmarks[:n] if n < 478
+                                              else np.vstack([self.landmarks, self.landmarks[:1]]))
+                self.assertFalse(valid)
+                self.assertIn("landmarks", errors)
+        self.assertFalse(self.validate(landmarks=self.landmarks.ravel())[0])
+        self.assertFalse(self.validate(landmarks=[[0.5, "x"]] * 478)[0])
+
+    def test_columns(self):
+        self.assertTrue(self.validate(landmarks=self.landmarks[:, :2])[0])
+        self.assertTrue(self.validate(landmarks=self.landmarks)[0])
+        self.assertFalse(self.validate(landmarks=np.hstack([self.landmarks, self.landmarks[:, :1]]))[0])
+        nan = self.landmarks.copy()
+        nan[0, 0] = np.nan
+        self.assertFalse(self.validate(landmarks=nan)[0])
+        # نص JSON (طلبات multipart)
+        serializer = ClientLandmarksSerializer(data={**self.data(), "landmarks": json.dumps(self.landmarks[:, :2].tolist())})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["landmarks"].shape, (478, 2))
+
+    def test_oversized_patches(self):
+        big = np.full((200, 200, 3), 128, np.uint8)
+        valid, errors = self.validate(skin_patches=[encode_patch(big)])
+        self.assertFalse(valid)
+        self.assertIn("skin_patches", errors)
+        # بايتات أكثر من CLIENT_PATCH_MAX_BYTES قبل فك الترميز
+        noise = np.random.default_rng(13).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+        with override_settings(FACE_ANALYSIS={"CLIENT_PATCH_MAX_BYTES": 1024}):
+            self.assertFalse(self.validate(skin_patches=[encode_patch(noise)])[0])
+        self.assertTrue(self.validate(skin_patches=[encode_patch(noise)])[0])
+        self.assertFalse(self.validate(skin_patches=[encode_patch(self.image[:20, :20])] * 4)[0])
+
+    def test_decompression_bomb_rejected_before_decoding(self):
+        # PNG أقل من CLIENT_PATCH_MAX_BYTES يُفك إلى 4000×4000 (48MB BGR)
+        ok, buf = cv2.imencode(".png", np.zeros((4000, 4000), np.uint8), [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        self.assertLess(len(buf), face_setting("CLIENT_PATCH_MAX_BYTES"))
+        with mock.patch("face.serializers.cv2.imdecode", wraps=cv2.imdecode) as imdecode:
+            valid, errors = self.validate(skin_patches=[base64.b64encode(buf.tobytes()).decode("ascii")])
+            self.assertFalse(valid)
+            self.assertIn("at most", str(errors["skin_patches"]))
+            imdecode.assert_not_called()
+            self.assertTrue(self.validate(skin_patches=[encode_patch(self.image[:20, :20])])[0])
+            imdecode.assert_called_once()
+
+    def test_undecodable_patches(self):
+        for patch in ("not base64!", base64.b64encode(b"not an image").decode("ascii")):
+            with self.subTest(patch=patch):
+                valid, errors = self.validate(skin_patches=[patch])
+                self.assertFalse(valid)
+                self.assertIn("skin_patches", errors)
+        # بادئة data: URL مقبولة
+        self.assertTrue(self.validate(skin_patches=["data:image/png;base64," + encode_patch(self.image[:20, :20])])[0])
+
+    def test_invalid_request_returns_400(self):
+        response = self.client.post(self.URL, self.data(landmarks=self.landmarks[:10]), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("landmarks", response.json())
+
+    @override_settings(FACE_ANALYSIS={"CACHE_ALIAS": None, "QUALITY_CHECKS": False})
+    def test_matches_image_analysis(self):
+        # نفس الملامح عبر الصورة (FaceMesh يعيدها) وعبر العميل مع رقع مقصوصة حول SAMPLE_INDICES
+        h, w = self.image.shape[:2]
+        ok, png = cv2.imencode(".png", self.image)
+        with mock.patch("face.pipeline.detect_landmarks", return_value=self.landmarks):
+            from_image = self.client.post(
+                self.URL, {"image": SimpleUploadedFile("face.png", png.tobytes(), "image/png")}, format="multipart"
+            )
+        self.assertEqual(from_image.status_code, 200, from_image.content)
+
+        patch = max(10, int(min(w, h) * 0.02))
+        patches = [
+            encode_patch(self.image[max(0, cy - patch):cy + patch, max(0, cx - patch):cx + patch])
+            for cx, cy in (self.landmarks[list(skin_tone.SAMPLE_INDICES), :2] * (w, h)).astype(int)
+        ]
+        from_landmarks = self.client.post(self.URL, self.data(skin_patches=patches), format="json")
+        self.assertEqual(from_landmarks.status_code, 200, from_landmarks.content)
+
+        self.assertNotEqual(from_image.json()["skin_tone"], "Unknown")
+        self.assertEqual(from_landmarks.json(), from_image.json())
+        # بدون رقع: نفس القياس والشكل، لون البشرة Unknown
+        without = self.client.post(self.URL, self.data(), format="json").json()
+        self.assertEqual(without["skin_tone"], "Unknown")
+        self.assertEqual((without["face_width_cm"], without["face_shape"]),
+                         (from_image.json()["face_width_cm"], from_image.json()["face_shape"]))
+
+
+def posed_landmarks(landmarks, size, yaw, pitch):
+    """نسخة من landmarks بعمق z يعطي (yaw, pitch) بالدرجات في geometry.head_pose."""
+    landmarks = landmarks.copy()
+    w, h = size
+    px = landmarks[:, :2] * (w, h)
+    across = np.hypot(*(px[geometry.FACE_RIGHT_EDGE] - px[geometry.FACE_LEFT_EDGE]))
+    down = np.hypot(*(px[geometry.CHIN] - px[geometry.FOREHEAD_TOP]))
+    landmarks[geometry.FACE_LEFT_EDGE, 2] = 0.0
+    landmarks[geometry.FACE_RIGHT_EDGE, 2] = math.tan(math.radians(yaw)) * across / w
+    landmarks[geometry.FOREHEAD_TOP, 2] = 0.0
+    landmarks[geometry.CHIN, 2] = -math.tan(math.radians(pitch + geometry.NEUTRAL_PITCH_DEG)) * down / w
+    return landmarks
+
+
+@override_settings(FACE_ANALYSIS={"CACHE_ALIAS": None, "QUALITY_CHECKS": True})
+class QualityChecksTests(SimpleTestCase):
+    """رموز الرفض image_blurry/image_too_dark/image_too_bright/head_turned/head_tilted، ومرور الصورة الجيدة."""
+
+    URL = "/api/face/analyze-face/"
+
+    def setUp(self):
+        rng = np.random.default_rng(14)
+        # نسيج حاد بإضاءة متوسطة (~ تباين Laplacian صورة وجه حقيقية 1400-1700)
+        self.sharp = cv2.resize(rng.integers(60, 200, (64, 86, 3), dtype=np.uint8), (640, 480),
+                                interpolation=cv2.INTER_NEAREST)
+        faces, _ = GeometryTests.random_faces(rng, 1)
+        self.size = (640, 480)
+        self.frontal = posed_landmarks(faces[0], self.size, 0.0, 0.0)
+        self.client = APIClient()
+
+    def post_image(self, image_bgr, landmarks=None):
+        ok, png = cv2.imencode(".png", image_bgr)
+        upload = SimpleUploadedFile("face.png", png.tobytes(), "image/png")
+        with mock.patch("face.pipeline.detect_landmarks", return_value=self.frontal if landmarks is None else landmarks) as detect:
+            response = self.client.post(self.URL, {"image": upload}, format="multipart")
+        return response, detect.called
+
+    def test_image_metrics(self):
+        self.assertIsNone(quality.check_image(self.sharp))
+        blurred = cv2.GaussianBlur(self.sharp, (0, 0), 6)
+        self.assertEqual(quality.check_image(blurred)[1], "image_blurry")
+        self.assertEqual(quality.check_image((self.sharp * 0.15).astype(np.uint8))[1], "image_too_dark")
+        self.assertEqual(quality.check_image(np.clip(self.sharp.astype(int) + 200, 0, 255).astype(np.uint8))[1],
+                         "image_too_bright")
+
+    def test_rejected_before_facemesh(self):
+        for image, code in (
+            (cv2.GaussianBlur(self.sharp, (0, 0), 6), "image_blurry"),
+            ((self.sharp * 0.15).astype(np.uint8), "image_too_dark"),
+        ):
+            with self.subTest(code=code):
+                response, detected = self.post_image(image)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["code"], code)
+                self.assertFalse(detected)
+
+    def test_head_pose(self):
+        faces = np.stack([
+            self.frontal,
+            posed_landmarks(self.frontal, self.size, 35.0, 0.0),
+            posed_landmarks(self.frontal, self.size, -35.0, 0.0),
+            posed_landmarks(self.frontal, self.size, 0.0, 40.0),
+            posed_landmarks(self.frontal, self.size, 10.0, -10.0),
+        ])
+        yaw, pitch = geometry.head_pose(faces, [self.size] * len(faces))
+        np.testing.assert_allclose(yaw, [0, 35, -35, 0, 10], atol=1e-9)
+        np.testing.assert_allclose(pitch, [0, 0, 0, 40, -10], atol=1e-9)
+        codes = [issue and issue[1] for issue in quality.check_pose(yaw, pitch)]
+        self.assertEqual(codes, [None, "head_turned", "head_turned", "head_tilted", None])
+
+    def test_profile_rejected_and_frontal_accepted(self):
+        response, _ = self.post_image(self.sharp, posed_landmarks(self.frontal, self.size, 40.0, 0.0))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["code"], "head_turned")
+
+        response, detected = self.post_image(self.sharp)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(detected)
+        self.assertIn("face_shape", response.json())
+
+    def test_disabled_by_default(self):
+        with override_settings(FACE_ANALYSIS={"CACHE_ALIAS": None}):
+            response, detected = self.post_image(cv2.GaussianBlur(self.sharp, (0, 0), 6),
+                                                 posed_landmarks(self.frontal, self.size, 40.0, 0.0))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(detected)
+
+
+class FakePool:
+    """بديل الـ pool: يعيد نفس الوجوه لكل صورة ويحفظ عدد الاستدعاءات."""
+
+    def __init__(self, faces):
+        self.faces = list(faces)
+        self.calls = 0
+
+    def process(self, rgb):
+        self.calls += 1
+        return [face.copy() for face in self.faces]
+
+
+@override_settings(FACE_ANALYSIS={"CACHE_ALIAS": None, "QUALITY_CHECKS": False})
+class MultiFaceTests(SimpleTestCase):
+    """analyze-face مع max_faces > 1: التحقق، الترتيب من اليسار لليمين، الصناديق، أخطاء كل وجه والكاش."""
+
+    URL = "/api/face/analyze-face/"
+
+    def setUp(self):
+        rng = np.random.default_rng(15)
+        self.image = SkinToneTests.synthetic_image(rng, 1.0, h=320, w=960)
+        faces, _ = GeometryTests.random_faces(rng, 3)
+        # كل وجه في ثلث من الصورة؛ FaceMesh يعيدها بترتيب الثقة: الأوسط ثم الأيمن ثم الأيسر
+        faces[..., 0] = (faces[..., 0] - 0.2) / 0.6 * 0.3
+        for face, third in zip(faces, (1, 2, 0)):
+            face[:, 0] += third / 3 + 0.01
+        self.faces = faces
+        self.client = APIClient()
+        caches["face-analysis"].clear()
+
+    def post(self, pool=None, **data):
+        ok, png = cv2.imencode(".png", self.image)
+        upload = SimpleUploadedFile("group.png", png.tobytes(), "image/png")
+        pool = pool or FakePool(self.faces)
+        with mock.patch("face.pipeline.get_face_mesh_pool", return_value=pool) as get_pool:
+            response = self.client.post(self.URL, {"image": upload, **data}, format="multipart")
+        return response, get_pool
+
+    def test_max_faces_validation(self):
+        for value in (0, -1, "two", "1.5", 6):
+            with self.subTest(max_faces=value):
+                response, get_pool = self.post(max_faces=value)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("max_faces", response.json()["error"])
+                get_pool.assert_not_called()
+
+    def test_faces_left_to_right(self):
+        response, get_pool = self.post(max_faces=3)
+        self.assertEqual(response.status_code, 200, response.content)
+        get_pool.assert_called_once_with(3)
+        body = response.json()
+        self.assertEqual(body["count"], 3)
+        self.assertEqual([face["index"] for face in body["faces"]], [0, 1, 2])
+
+        h, w = self.image.shape[:2]
+        xs = [face["box"]["x"] for face in body["faces"]]
+        self.assertEqual(xs, sorted(xs))
+        for face, third in zip(body["faces"], range(3)):
+            box = face["box"]
+            self.assertEqual(set(box), {"x", "y", "width", "height"})
+            self.assertTrue(third * w / 3 <= box["x"] < box["x"] + box["width"] <= (third + 1) * w / 3, box)
+            self.assertTrue(0 <= box["y"] < box["y"] + box["height"] <= h, box)
+            self.assertIn("face_shape", face)
+
+        # max_faces=2: أعلى وجهين ثقة (الأوسط والأيمن) من اليسار لليمين
+        two = self.post(max_faces=2)[0].json()
+        self.assertEqual(two["count"], 2)
+        self.assertEqual([face["box"] for face in two["faces"]], [face["box"] for face in body["faces"][1:]])
+
+    def test_per_face_errors(self):
+        # القزحية غير مكتشفة في الوجه الأيسر فقط
+        self.faces[2][[471, 476]] = self.faces[2][[469, 474]]
+        body = self.post(max_faces=3)[0].json()
+        self.assertEqual(body["count"], 3)
+        first, *rest = body["faces"]
+        self.assertEqual((first["error"], first["code"]), ("Iris not detected reliably", "iris_not_detected"))
+        self.assertIn("box", first)
+        self.assertNotIn("face_shape", first)
+        for face in rest:
+            self.assertNotIn("error", face)
+            self.assertIn("face_shape", face)
+
+    def test_no_face(self):
+        response, _ = self.post(FakePool([]), max_faces=3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["code"], "no_face")
+
+    @override_settings(FACE_ANALYSIS={"QUALITY_CHECKS": False})
+    def test_cache_variants(self):
+        pool = FakePool(self.faces)
+        self.assertEqual(self.post(pool, max_faces=2)[0][CACHE_HEADER], "MISS")
+        self.assertEqual(self.post(pool, max_faces=2)[0][CACHE_HEADER], "HIT")
+        self.assertEqual(self.post(pool, max_faces=3)[0][CACHE_HEADER], "MISS")
+        self.assertEqual(self.post(pool, max_faces=3)[0][CACHE_HEADER], "HIT")
+        # نفس الصورة بوجه واحد لها مفتاحها الخاص (payload مختلف الشكل)
+        single = self.post(pool)[0]
+        self.assertEqual(single[CACHE_HEADER], "MISS")
+        self.assertIn("face_shape", single.json())
+        self.assertNotIn("faces", single.json())
+        self.assertEqual(pool.calls, 3)
+
+        data = b"image bytes"
+        keys = {content_key(data), content_key(data, "faces2"), content_key(data, "faces3")}
+        self.assertEqual(len(keys), 3)
+
+    def test_single_face_uses_single_face_pool(self):
+        response, get_pool = self.post()
+        self.assertEqual(response.status_code, 200, response.content)
+        get_pool.assert_called_once_with(1)
+
+    def test_pools_by_face_count(self):
+        with mock.patch("face.pool.create_pool", side_effect=lambda *a, **kw: mock.Mock(options=kw)) as create, \
+                mock.patch.dict("face.pool._pools", clear=True):
+            single = pool.get_face_mesh_pool()
+            self.assertEqual(single.options["max_num_faces"], 1)
+            self.assertIs(pool.get_face_mesh_pool(1), single)
+            multi = pool.get_face_mesh_pool(3)
+            self.assertEqual(multi.options["max_num_faces"], face_setting("MAX_FACES"))
+            self.assertIs(pool.get_face_mesh_pool(2), multi)
+            self.assertEqual(create.call_count, 2)
+
+
+class ResultCacheTests(SimpleTestCase):
+    """كاش النتائج حسب بصمة الصورة: MISS ثم HIT، الأخطاء لا تُخزن، والإعدادات المؤثرة جزء من المفتاح."""
+
+    URL = "/api/face/analyze-face/"
+    PAYLOAD = {"face_shape": "Oval", "face_width_cm": 13.5, "skin_tone": "Medium"}
+
+    def setUp(self):
+        caches["face-analysis"].clear()
+        self.client = APIClient()
+
+    def post(self, data=b"same image bytes"):
+        upload = SimpleUploadedFile("face.png", data, "image/png")
+        return self.client.post(self.URL, {"image": upload}, format="multipart")
+
+    def analyze(self, **kwargs):
+        return mock.patch("face.views.analyze_image", **kwargs)
+
+    def test_miss_then_hit(self):
+        with self.analyze(return_value=self.PAYLOAD) as analyze:
+            first, second = self.post(), self.post()
+            other = self.post(b"other image bytes")
+        self.assertEqual((first[CACHE_HEADER], second[CACHE_HEADER], other[CACHE_HEADER]), ("MISS", "HIT", "MISS"))
+        self.assertEqual(first.json(), self.PAYLOAD)
+        self.assertEqual(second.json(), self.PAYLOAD)
+        self.assertEqual(analyze.call_count, 2)
+        self.assertEqual(analyze.call_args_list[0].args, (b"same image bytes",))
+
+    def test_errors_not_cached(self):
+        busy = FaceAnalysisError("Face analysis is busy, try again", "busy", status_code=503)
+        with self.analyze(side_effect=[busy, self.PAYLOAD]) as analyze:
+            failed, retried = self.post(), self.post()
+        self.assertEqual(failed.status_code, 503)
+        self.assertEqual(failed.json()["code"], "busy")
+        self.assertNotIn(CACHE_HEADER, failed)
+        self.assertEqual((retried.status_code, retried[CACHE_HEADER]), (200, "MISS"))
+        self.assertEqual(analyze.call_count, 2)
+
+    def test_output_settings_change_key(self):
+        data = b"image bytes"
+        base = content_key(data)
+        for name, value in (("QUALITY_CHECKS", True), ("MAX_IMAGE_SIDE", 640), ("LANDMARK_BACKEND", "onnx")):
+            with self.subTest(name=name), override_settings(FACE_ANALYSIS={name: value}):
+                self.assertNotEqual(content_key(data), base)
+        # إعدادات لا تغيّر النتيجة لا تبطل الكاش
+        with override_settings(FACE_ANALYSIS={"POOL_SIZE": 7, "SERVER_TIMING": True}):
+            self.assertEqual(content_key(data), base)
+
+        with self.analyze(return_value=self.PAYLOAD) as analyze:
+            self.assertEqual(self.post()[CACHE_HEADER], "MISS")
+            with override_settings(FACE_ANALYSIS={"QUALITY_CHECKS": True}):
+                self.assertEqual(self.post()[CACHE_HEADER], "MISS")
+                self.assertEqual(self.post()[CACHE_HEADER], "HIT")
+            self.assertEqual(self.post()[CACHE_HEADER], "HIT")
+        self.assertEqual(analyze.call_count, 2)
+
+    @override_settings(FACE_ANALYSIS={"CACHE_ALIAS": None})
+    def test_disabled(self):
+        with self.analyze(return_value=self.PAYLOAD) as analyze:
+            responses = [self.post(), self.post()]
+        self.assertEqual([r[CACHE_HEADER] for r in responses], ["MISS", "MISS"])
+        self.assertEqual(analyze.call_count, 2)
+
+
+@override_settings(FACE_ANALYSIS={"BATCH_WORKERS": 4, "BATCH_MAX_IMAGES": 6})
+class BatchAnalysisTests(TestCase):
+    """analyze-batch: ترتيب الرفع مهما كان ترتيب انتهاء الخيوط، أخطاء لكل صورة، والحد الأقصى."""
+
+    URL = "/api/face/analyze-batch/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("batch@example.com", "pw", name="B", role="customer")
+
+    def setUp(self):
+        rng = np.random.default_rng(16)
+        self.faces, self.sizes = GeometryTests.random_faces(rng, 4)
+        self.finished = []
+        self.client = APIClient()
+
+    def extract(self, data):
+        # الصورة i تنتهي بعد الصور التي بعدها: ترتيب الانتهاء عكس ترتيب الرفع
+        if not data.startswith(b"face-"):
+            return pipeline_extract_face(data)
+        i = int(data[5:])
+        time.sleep(0.05 * (len(self.faces) - i))
+        self.finished.append(i)
+        return self.faces[i], tuple(int(v) for v in self.sizes[i]), "Medium"
+
+    def post(self, images):
+        uploads = [SimpleUploadedFile(f"{n}.png", data, "image/png") for n, data in enumerate(images)]
+        with mock.patch("face.pipeline.extract_face", side_effect=self.extract):
+            return self.client.post(self.URL, {"images": uploads}, format="multipart")
+
+    def test_upload_order_and_per_item_errors(self):
+        images = [b"face-0", b"face-1", b"not an image", b"face-2", b"face-3"]
+        response = self.post(images)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(self.finished, sorted(self.finished))
+
+        body = response.json()
+        self.assertEqual(body["count"], len(images))
+        self.assertEqual([r["index"] for r in body["results"]], list(range(len(images))))
+        bad = body["results"][2]
+        self.assertEqual((bad["error"], bad["code"]), ("Error reading image", "invalid_image"))
+        for result, face, size in zip(body["results"][:2] + body["results"][3:], self.faces, self.sizes):
+            self.assertNotIn("error", result)
+            self.assertAlmostEqual(result["face_width_cm"], baseline_measure(face, *size)["face_width_cm"], places=2)
+            self.assertNotIn("analysis_id", result)
+
+    def test_too_many_images(self):
+        response = self.post([b"face-0"] * 7)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 6", response.json()["error"])
+        self.assertEqual(self.client.post(self.URL, {}, format="multipart").status_code, 400)
+
+    def test_analysis_id_only_on_successes(self):
+        self.client.force_authenticate(self.user)
+        response = self.post([b"face-0", b"not an image", b"face-1"])
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()["results"]
+        self.assertNotIn("analysis_id", results[1])
+        ids = [results[0]["analysis_id"], results[2]["analysis_id"]]
+        saved = FaceAnalysis.objects.filter(user=self.user).order_by("id")
+        self.assertEqual(list(saved.values_list("id", flat=True)), ids)
+        self.assertEqual([a.face_width_cm for a in saved], [results[0]["face_width_cm"], results[2]["face_width_cm"]])
+
+
+class FakeMesh:
+    def __init__(self, n):
+        self.n = n
+        self.closed = False
+
+    def process(self, rgb):
+        return [self.n]
+
+    def close(self):
+        self.closed = True
+
+
+class FaceMeshPoolTests(SimpleTestCase):
+    """FaceMeshPool بمصنع وهمي: إنشاء كسول حتى size، إعادة استخدام LIFO، المهلة، الإرجاع بعد الخطأ و close()."""
+
+    def make_pool(self, size=2, timeout=0.05):
+        created = []
+
+        def factory(name=None, **options):
+            created.append(FakeMesh(len(created)))
+            return created[-1]
+
+        patcher = mock.patch("face.pool.create_backend", side_effect=factory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return pool.FaceMeshPool(size, timeout=timeout), created
+
+    def test_lazy_creation_up_to_size(self):
+        mesh_pool, created = self.make_pool(size=3)
+        self.assertEqual(created, [])
+        with mesh_pool.checkout() as a:
+            self.assertEqual(len(created), 1)
+            with mesh_pool.checkout() as b:
+                self.assertIsNot(a, b)
+                self.assertEqual(len(created), 2)
+        # نسختان عادتا للطابور: لا إنشاء جديد
+        for _ in range(5):
+            mesh_pool.process(None)
+        self.assertEqual(len(created), 2)
+
+    def test_lifo_reuse(self):
+        mesh_pool, created = self.make_pool()
+        with mesh_pool.checkout() as first, mesh_pool.checkout() as second:
+            pass
+        # first أُعيد أخيرًا (الخروج من with بترتيب عكسي) فيُستعار أولًا
+        with mesh_pool.checkout() as mesh:
+            self.assertIs(mesh, first)
+        with mesh_pool.checkout() as mesh:
+            self.assertIs(mesh, first)
+        self.assertEqual(mesh_pool.process(None), [first.n])
+        self.assertEqual(len(created), 2)
+
+    def test_busy_pool_blocks_then_times_out(self):
+        mesh_pool, created = self.make_pool(size=1, timeout=0.1)
+        with mesh_pool.checkout():
+            start = time.monotonic()
+            with self.assertRaises(pool.FaceMeshPoolTimeout):
+                mesh_pool.process(None)
+            self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+        # نسخة تعود أثناء الانتظار تُسلَّم للمنتظر
+        mesh_pool.timeout = 2.0
+        release = threading.Event()
+
+        def hold():
+            with mesh_pool.checkout():
+                release.wait()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        time.sleep(0.02)
+        threading.Timer(0.1, release.set).start()
+        self.assertEqual(mesh_pool.process(None), [0])
+        holder.join()
+        self.assertEqual(len(created), 1)
+
+    def test_instance_returned_when_caller_raises(self):
+        mesh_pool, created = self.make_pool(size=1)
+        with self.assertRaises(RuntimeError):
+            with mesh_pool.checkout():
+                raise RuntimeError
+        with mesh_pool.checkout() as mesh:
+            self.assertIs(mesh, created[0])
+
+    def test_failed_creation_frees_the_slot(self):
+        mesh_pool, created = self.make_pool(size=1)
+        with mock.patch("face.pool.create_backend", side_effect=OSError("model missing")):
+            with self.assertRaises(OSError):
+                mesh_pool.process(None)
+        self.assertEqual(mesh_pool.process(None), [0])
+
+    def test_close(self):
+        mesh_pool, created = self.make_pool(size=2)
+        with mesh_pool.checkout(), mesh_pool.checkout():
+            pass
+        mesh_pool.close()
+        self.assertTrue(all(mesh.closed for mesh in created))
+        # بعد close() تُنشأ نسخ جديدة عند الحاجة
+        mesh_pool.process(None)
+        self.assertEqual(len(created), 3)
+
+    def test_invalid_size(self):
+        with self.assertRaises(ImproperlyConfigured):
+            pool.FaceMeshPool(0)
+        with self.assertRaises(ImproperlyConfigured):
+            pool.create_pool("threads", 1)
+
+
+class FakeTrackingMesh:
+    """بديل MediaPipeBackend في FaceTracker: يعيد الوجوه المحقونة في faces."""
+
+    faces = []
+
+    def __init__(self, **options):
+        self.options = options
+
+    def process(self, rgb):
+        return [face.copy() for face in self.faces]
+
+    def close(self):
+        pass
+
+
+class FaceTrackerTests(SimpleTestCase):
+    """FaceTracker بملامح محقونة: التنعيم الأسي، أغلبية لون البشرة، ومتى تُرسل رسالة."""
+
+    SIZE = (640, 480)
+
+    def setUp(self):
+        rng = np.random.default_rng(17)
+        (self.a, self.b), _ = GeometryTests.random_faces(rng, 2)
+        ok, png = cv2.imencode(".png", SkinToneTests.synthetic_image(rng, 1.0, h=480, w=640))
+        self.frame = png.tobytes()
+        patcher = mock.patch("face.streaming.MediaPipeBackend", FakeTrackingMesh)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tracker(self, **options):
+        tracker = streaming.FaceTracker(**options)
+        self.assertEqual(tracker.mesh.options, {"static_image_mode": False})
+        return tracker
+
+    def feed(self, tracker, faces):
+        FakeTrackingMesh.faces = faces
+        return tracker.process_frame(self.frame)
+
+    def measure(self, landmarks):
+        m = geometry.measure_faces(geometry.to_pixels(landmarks, self.SIZE))
+        return {k: float(m[k][0]) for k in MEASUREMENT_KEYS}
+
+    def test_exponential_smoothing(self):
+        tracker = self.tracker(smoothing=0.25, width_step_cm=0.0)
+        a, b = self.measure(self.a), self.measure(self.b)
+        first = self.feed(tracker, [self.a])
+        self.assertEqual(first["face_width_cm"], round(a["face_width_cm"], 2))
+
+        second = self.feed(tracker, [self.b])
+        expected = {k: 0.25 * b[k] + 0.75 * a[k] for k in MEASUREMENT_KEYS}
+        for k in MEASUREMENT_KEYS:
+            self.assertAlmostEqual(tracker.smoothed[k], expected[k], places=9)
+            self.assertEqual(second[k], round(expected[k], 2))
+        shapes, _ = classifier.classify(shape_features(*(expected[k] for k in MEASUREMENT_KEYS)))
+        self.assertEqual(second["face_shape"], shapes[0])
+
+    def test_skin_tone_majority(self):
+        tracker = self.tracker(width_step_cm=100.0, skin_tone_every=1)
+        tones = ["Dark", "Light", "Light", "Unknown", "Dark"]
+        with mock.patch("face.streaming.estimate_skin_tone", side_effect=tones):
+            updates = [self.feed(tracker, [self.a]) for _ in tones]
+        # Dark؛ تعادل (الأقدم يفوز)؛ Light أغلبية؛ Unknown لا يُحتسب؛ تعادل 2-2 → Dark
+        self.assertEqual([u and u["skin_tone"] for u in updates], ["Dark", None, "Light", None, "Dark"])
+        self.assertEqual(list(tracker.tones), ["Dark", "Light", "Light", "Dark"])
+
+        tracker = self.tracker(width_step_cm=100.0, skin_tone_every=3)
+        with mock.patch("face.streaming.estimate_skin_tone", return_value="Medium") as estimate:
+            for _ in range(7):
+                self.feed(tracker, [self.a])
+        self.assertEqual(estimate.call_count, 3)        # الإطارات 1 و 4 و 7
+
+    def test_change_detection(self):
+        tracker = self.tracker(smoothing=1.0, width_step_cm=0.1)
+        self.assertEqual(self.feed(tracker, [self.a])["face"], True)
+        self.assertIsNone(self.feed(tracker, [self.a]))
+
+        # تحريك طرف الخد: أقل من الخطوة لا يرسل، وأكثر منها يرسل
+        base = self.measure(self.a)["face_width_cm"]
+        left, right = geometry.DISTANCE_PAIRS[geometry.CHEEKS]
+        for shift, sent in ((1e-5, False), (0.5, True)):
+            moved = self.a.copy()
+            moved[right, :2] += shift * (moved[right, :2] - moved[left, :2])
+            width = self.measure(moved)["face_width_cm"]
+            self.assertEqual(abs(width - base) >= 0.1, sent)
+            update = self.feed(tracker, [moved])
+            if sent:
+                self.assertEqual(update["face_width_cm"], round(width, 2))
+            else:
+                self.assertIsNone(update)
+
+        # اختفاء الوجه: رسالة واحدة ثم صمت، وعند عودته يبدأ التنعيم من جديد
+        self.assertEqual(self.feed(tracker, []), {"face": False})
+        self.assertIsNone(self.feed(tracker, []))
+        tracker.smoothing = 0.5
+        back = self.feed(tracker, [self.b])
+        self.assertEqual(back["face_width_cm"], round(self.measure(self.b)["face_width_cm"], 2))
+
+    def test_invalid_frame(self):
+        tracker = self.tracker()
+        self.assertEqual(tracker.process_frame(b"not an image"), {"error": "Error reading image", "code": "invalid_image"})
+
+
+class FakeStreamTracker:
+    """بديل FaceTracker في face_stream_app: يسجل الإطارات ويوقف الأول حتى release."""
+
+    def __init__(self):
+        self.processed = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def process_frame(self, frame):
+        self.processed.append(frame)
+        if len(self.processed) == 1:
+            self.started.set()
+            self.release.wait(5)
+        return {"frame": frame.decode()}
+
+    def close(self):
+        pass
+
+
+@override_settings(FACE_ANALYSIS={"STREAM_MAX_SESSIONS": 1, "STREAM_MAX_FRAME_BYTES": 64})
+class FaceStreamAppTests(SimpleTestCase):
+    """تطبيق ASGI للبث: سقف الجلسات، معالجة الأحدث فقط، وحد حجم الرسالة."""
+
+    SCOPE = {"type": "websocket", "path": streaming.STREAM_PATH}
+
+    def setUp(self):
+        patcher = mock.patch.object(streaming, "_sessions", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.trackers = []
+        patcher = mock.patch("face.streaming.FaceTracker", side_effect=self.new_tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def new_tracker(self):
+        self.trackers.append(FakeStreamTracker())
+        return self.trackers[-1]
+
+    def connect(self):
+        inbox, sent = asyncio.Queue(), []
+
+        async def send(message):
+            sent.append(message)
+
+        task = asyncio.create_task(streaming.face_stream_app(self.SCOPE, inbox.get, send))
+        inbox.put_nowait({"type": "websocket.connect"})
+        return task, inbox, sent
+
+    @staticmethod
+    async def until(condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError("timed out")
+            await asyncio.sleep(0.005)
+
+    def test_session_cap(self):
+        async def scenario():
+            first, inbox, sent = self.connect()
+            await self.until(lambda: sent)
+            self.assertEqual(sent[0], {"type": "websocket.accept"})
+
+            second, _, rejected = self.connect()
+            await asyncio.wait_for(second, 5)
+            self.assertEqual(rejected, [{"type": "websocket.close", "code": 1013}])
+
+            # الجلسة التي تنتهي تحرر مكانها
+            inbox.put_nowait({"type": "websocket.disconnect"})
+            await asyncio.wait_for(first, 5)
+            third, inbox, accepted = self.connect()
+            await self.until(lambda: accepted)
+            self.assertEqual(accepted[0], {"type": "websocket.accept"})
+            inbox.put_nowait({"type": "websocket.disconnect"})
+            await asyncio.wait_for(third, 5)
+
+        asyncio.run(scenario())
+
+    def test_only_newest_frame_processed(self):
+        async def scenario():
+            task, inbox, sent = self.connect()
+            inbox.put_nowait({"type": "websocket.receive", "bytes": b"1"})
+            await self.until(lambda: self.trackers and self.trackers[0].started.is_set())
+            tracker = self.trackers[0]
+            for frame in (b"2", b"3", b"4"):
+                inbox.put_nowait({"type": "websocket.receive", "bytes": frame})
+            await self.until(lambda: inbox.empty())
+            await asyncio.sleep(0.01)
+            tracker.release.set()
+            await self.until(lambda: len(sent) == 3)
+            inbox.put_nowait({"type": "websocket.disconnect"})
+            await asyncio.wait_for(task, 5)
+            return tracker, sent
+
+        tracker, sent = asyncio.run(scenario())
+        self.assertEqual(tracker.processed, [b"1", b"4"])
+        self.assertEqual([json.loads(m["text"]) for m in sent[1:]], [{"frame": "1"}, {"frame": "4"}])
+
+    def test_oversized_frame_closes_before_decoding(self):
+        async def scenario():
+            task, inbox, sent = self.connect()
+            inbox.put_nowait({"type": "websocket.receive", "bytes": b"x" * 65})
+            await asyncio.wait_for(task, 5)
+            return sent
+
+        with mock.patch("face.streaming.prepare_image") as prepare:
+            sent = asyncio.run(scenario())
+        self.assertEqual(sent, [{"type": "websocket.accept"}, {"type": "websocket.close", "code": 1009}])
+        self.assertEqual(self.trackers[0].processed, [])
+        prepare.assert_not_called()
+        # المكان يتحرر بعد الإغلاق
+        self.assertTrue(streaming._session_slots().acquire(blocking=False))
+
+
+class FakeSession:
+    """جلسة onnxruntime وهمية: مدخل مربع input_size ومخرجات ثابتة."""
+
+    def __init__(self, input_size, outputs):
+        self.input_size = input_size
+        self.input_name = "input"
+        self.outputs = outputs
+        self.inputs = []
+
+    def run(self, names, feeds):
+        self.inputs.append(feeds[self.input_name])
+        return self.outputs
+
+
+class LandmarkBackendTests(SimpleTestCase):
+    """create_backend وإعدادات ONNX، ومراسي BlazeFace وفك الكشف مع NMS على مصفوفات مصطنعة."""
+
+    def test_unknown_backend(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "LANDMARK_BACKEND"):
+            backends.create_backend("tflite")
+        with override_settings(FACE_ANALYSIS={"LANDMARK_BACKEND": "dlib"}):
+            with self.assertRaises(ImproperlyConfigured):
+                backends.create_backend()
+
+    def test_missing_onnx_models(self):
+        with override_settings(FACE_ANALYSIS={"LANDMARK_BACKEND": "onnx"}):
+            with self.assertRaisesMessage(ImproperlyConfigured, "ONNX_DETECTOR_MODEL_PATH"):
+                backends.create_backend()
+            with self.assertRaisesMessage(ImproperlyConfigured, "ONNX_MODEL_PATH"):
+                backends.create_backend(detector_model_path=__file__)
+            with self.assertRaisesMessage(ImproperlyConfigured, "not found"):
+                backends.create_backend(model_path="/nonexistent/face_landmark.onnx", detector_model_path=__file__)
+        with override_settings(FACE_ANALYSIS={"ONNX_MODEL_PATH": __file__, "ONNX_DETECTOR_MODEL_PATH": __file__,
+                                              "ONNX_IRIS_MODEL_PATH": "/nonexistent/iris.onnx"}):
+            with self.assertRaisesMessage(ImproperlyConfigured, "/nonexistent/iris.onnx"):
+                backends.create_backend("onnx")
+
+    def test_blazeface_anchors(self):
+        anchors = backends._blazeface_anchors(128)
+        self.assertEqual(anchors.shape, (896, 2))
+        # stride 8: شبكة 16×16 بمرساتين لكل خلية، ثم stride 16: شبكة 8×8 بست مراسٍ
+        np.testing.assert_allclose(anchors[0], anchors[1])
+        np.testing.assert_allclose(anchors[0], (0.5 / 16, 0.5 / 16))
+        np.testing.assert_allclose(anchors[2], (1.5 / 16, 0.5 / 16))
+        np.testing.assert_allclose(anchors[32], (0.5 / 16, 1.5 / 16))
+        np.testing.assert_allclose(anchors[511], (15.5 / 16, 15.5 / 16))
+        np.testing.assert_allclose(anchors[512:518], [(0.5 / 8, 0.5 / 8)] * 6)
+        np.testing.assert_allclose(anchors[-1], (7.5 / 8, 7.5 / 8))
+        self.assertTrue(((anchors > 0) & (anchors < 1)).all())
+
+    def detector(self, detections, max_num_faces=3):
+        """detections: [(مرساة، مركز في المربع 0..1، حجم، إزاحة العين اليسرى عن اليمنى، logit)]."""
+        n = 128
+        anchors = backends._blazeface_anchors(n)
+        regressors = np.zeros((1, len(anchors), 16), np.float32)
+        scores = np.full((1, len(anchors), 1), -10.0, np.float32)
+        for k, center, size, eye_offset, logit in detections:
+            c = np.array(center) - anchors[k]
+            regressors[0, k, 0:2] = c * n
+            regressors[0, k, 2:4] = size * n
+            regressors[0, k, 4:6] = (c - np.array(eye_offset) / 2) * n
+            regressors[0, k, 6:8] = (c + np.array(eye_offset) / 2) * n
+            scores[0, k, 0] = logit
+
+        backend = backends.OnnxLandmarkBackend.__new__(backends.OnnxLandmarkBackend)
+        backend.max_num_faces = max_num_faces
+        backend.min_detection_confidence = 0.5
+        backend._detector = FakeSession(n, [regressors, scores])
+        backend._anchors = anchors
+        return backend
+
+    def test_detection_decode_and_nms(self):
+        w, h = 400, 200
+        rgb = np.zeros((h, w, 3), np.uint8)
+        # letterbox: الصورة بعرض المربع كاملًا، بارتفاع 0.5 منه ابتداءً من 0.25
+        to_image = lambda x, y: (x * w, (y - 0.25) * w)
+        backend = self.detector([
+            (100, (0.30, 0.40), 0.20, (0.08, 0.0), 4.0),      # الأعلى ثقة
+            (101, (0.31, 0.41), 0.20, (0.08, 0.0), 3.0),      # نفس الوجه تقريبًا: يحذفه NMS
+            (600, (0.70, 0.55), 0.10, (0.04, 0.04), 2.0),     # وجه ثان مائل 45°
+            (700, (0.50, 0.60), 0.10, (0.04, 0.0), -1.0),     # ثقة 0.27 < 0.5
+        ])
+        rois = backend._detect(rgb)
+        self.assertEqual(len(rois), 2)
+        (c1, s1, a1), (c2, s2, a2) = rois
+        np.testing.assert_allclose(c1, to_image(0.30, 0.40), atol=1e-3)
+        np.testing.assert_allclose(c2, to_image(0.70, 0.55), atol=1e-3)
+        self.assertAlmostEqual(s1, 0.20 * w * backends.FACE_ROI_SCALE, places=3)
+        self.assertAlmostEqual(s2, 0.10 * w * backends.FACE_ROI_SCALE, places=3)
+        self.assertAlmostEqual(a1, 0.0, places=3)
+        self.assertAlmostEqual(a2, 45.0, places=3)
+        # المدخل بالمجال [-1, 1] ومربع 128
+        tensor = backend._detector.inputs[0]
+        self.assertEqual(tensor.shape, (1, 128, 128, 3))
+        self.assertAlmostEqual(float(tensor.min()), -1.0)
+
+        backend.max_num_faces = 1
+        self.assertEqual(len(backend._detect(rgb)), 1)
+        self.assertEqual(self.detector([(5, (0.5, 0.5), 0.2, (0.1, 0.0), -3.0)])._detect(rgb), [])
+
+
+class LazyImportTests(SimpleTestCase):
+    """استيراد الـ URLconf (كل الـ views) لا يحمّل mediapipe ولا rembg ولا onnxruntime."""
+
+    HEAVY = ("mediapipe", "rembg", "onnxruntime")
+
+    def test_urlconf_import_is_lazy(self):
+        code = (
+            "import json, sys, django; django.setup(); "
+            "from django.urls import get_resolver; get_resolver().url_patterns; "
+            f"print(json.dumps([m for m in {list(self.HEAVY)!r} if m in sys.modules]))"
+        )
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings")}
+        result = subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        self.assertEqual(json.loads(result.stdout.strip().splitlines()[-1]), [])
@@ -0,0 +1,120 @@
+# face/timing.py
+import bisect
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from .conf import face_setting
+
+
+logger = logging.getLogger("face.pipeline")
+
+_current_timer = contextvars.ContextVar("face_stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    زمن كل مرحلة في طلب واحد. يُفعَّل بـ activate() فتسجل الدوال المشتركة
+    (decode, facemesh, ...) عبر stage() بدون تمرير الكائن صراحة.
+    المراحل المكررة (الدفعات) تُجمع.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+        self._started = perf_counter()
+
+    @contextmanager
+    def activate(self):
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    @property
+    def total(self):
+        return perf_counter() - self._started
+
+    def server_timing(self):
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.durations.items()]
+        parts.append(f"total;dur={self.total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def stage(name):
+    """يسجل زمن الكتلة في المؤقت الفعّال؛ لا يفعل شيئًا إن لم يوجد."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, perf_counter() - t0)
+
+
+class StageHistogram:
+    """هيستوغرام تراكمي لكل مرحلة داخل العملية (بصيغة Prometheus)."""
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, name, seconds):
+        with self._lock:
+            counts, total = self._stages.get(name, ([0] * (len(self.BUCKETS) + 1), 0.0))
+            counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            self._stages[name] = (counts, total + seconds)
+
+    def render_prometheus(self, metric="face_pipeline_stage_seconds"):
+        with self._lock:
+            stages = {name: (list(counts), total) for name, (counts, total) in self._stages.items()}
+        lines = [
+            f"# HELP {metric} Face analysis pipeline stage latency.",
+            f"# TYPE {metric} histogram",
+        ]
+        for name, (counts, total) in sorted(stages.items()):
+            cumulative = 0
+            for le, count in zip(self.BUCKETS + (float("inf"),), counts):
+                cumulative += count
+                le_label = "+Inf" if le == float("inf") else repr(le)
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{le_label}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+histogram = StageHistogram()
+
+
+def report(timer, response, endpoint):
+    """نهاية الطلب: الهيستوغرام + سطر log منظم + ترويسة Server-Timing (اختيارية)."""
+    for name, seconds in timer.durations.items():
+        histogram.observe(name, seconds)
+    histogram.observe("total", timer.total)
+
+    logger.info(
+        "%s timings",
+        endpoint,
+        extra={
+            "endpoint": endpoint,
+            "status_code": response.status_code,
+            "total_ms": round(timer.total * 1000, 2),
+            "stages_ms": {name: round(s * 1000, 2) for name, s in timer.durations.items()},
+        },
+    )
+
+    if face_setting("SERVER_TIMING"):
+        response["Server-Timing"] = timer.server_timing()
+    return response
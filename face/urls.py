@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import FaceAnalysisView
+from .views import FaceAnalysisView, FaceBatchAnalysisView, FaceMetricsView
 
 urlpatterns = [
     path('analyze-face/', FaceAnalysisView.as_view(), name='analyze-face'),
+    path('analyze-batch/', FaceBatchAnalysisView.as_view(), name='analyze-batch'),
+    path('metrics/', FaceMetricsView.as_view(), name='face-metrics'),
 ]
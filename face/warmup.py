@@ -0,0 +1,68 @@
+# face/warmup.py
+"""
+تحميل مسبق لما يُحمّل كسولًا عند أول طلب (الـ views، mediapipe/onnxruntime، جداول KBS، نسخ الـ pool).
+
+- preload(): تُستدعى من backend/wsgi.py و backend/asgi.py حسب FACE_ANALYSIS['PRELOAD']:
+    "imports" → المكتبات والجداول فقط. آمن قبل fork (gunicorn --preload): تُشارك
+                الذاكرة بين العمال بدل أن يحمّلها كل عامل مع أول طلب.
+    "full"    → + إنشاء نسخ الـ pool. فقط بعد fork أو بدون fork (نسخ FaceMesh فيها خيوط).
+- warmup(): نفسها مباشرة، مثلًا من post_fork في gunicorn.conf.py أو أمر `manage.py warmup`.
+
+أوامر manage.py لا تحمّل wsgi/asgi، فلا تدفع هذه الكلفة أبدًا.
+"""
+from time import perf_counter
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .conf import face_setting
+
+
+def _import_urlconf():
+    # Django يستورد الـ views مع أول طلب؛ هنا نستوردها مسبقًا
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+
+def _import_backend():
+    backend = face_setting("LANDMARK_BACKEND")
+    if backend == "mediapipe":
+        import mediapipe  # noqa: F401
+    elif backend == "onnx":
+        import onnxruntime  # noqa: F401
+
+
+def _compile_kbs():
+    from .kbs_engine import glasses_recommender
+    glasses_recommender.ensure_compiled()
+
+
+def _warm_pool():
+    from .pool import get_face_mesh_pool
+    get_face_mesh_pool().warm()
+
+
+def warmup(instances=True):
+    """يعيد [(المرحلة، الثواني)]."""
+    steps = [
+        ("urlconf", _import_urlconf),
+        ("landmark backend import", _import_backend),
+        ("kbs tables", _compile_kbs),
+    ]
+    if instances:
+        steps.append(("face pool", _warm_pool))
+
+    timings = []
+    for name, step in steps:
+        t0 = perf_counter()
+        step()
+        timings.append((name, perf_counter() - t0))
+    return timings
+
+
+def preload():
+    mode = face_setting("PRELOAD")
+    if not mode:
+        return []
+    if mode not in ("imports", "full"):
+        raise ImproperlyConfigured(f"FACE_ANALYSIS['PRELOAD'] must be None, 'imports' or 'full', got {mode!r}")
+    return warmup(instances=mode == "full")
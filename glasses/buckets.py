@@ -0,0 +1,217 @@
+# glasses/buckets.py
+"""
+ترتيب الكتالوج محسوبًا مسبقًا لكل مخرج ممكن لـ GlassesRecommender (جدول RecommendationBucket):
+شكل الوجه (7 + غير معروف) × المقاس (4 + بدون) × النبرة (3 + بدون) = 160 صفًا.
+
+نقاط الصف هي قواعد shape/size/tone فقط (أول ثلاث قواعد في scoring.RULES)، أي نفس ما يعطيه
+score_catalog بدون تفضيلات المستخدم. فـ recommend/face-shape و analyze-and-recommend بدون
+تفضيلات يقرآن صفًا واحدًا بالمفتاح الفريد بدل مسح shape__in أو تقييم الكتالوج.
+
+- يُبنى كاملًا عند أول قراءة (أو بـ manage.py rebuild_recommendation_buckets).
+- إشارات glasses/signals.py تحدّث بعد كل حفظ أو حذف لنظارة الصفوف التي تغيّر فيها
+  موضع تلك النظارة فقط (وتقفلها وحدها: القيم السابقة تُقرأ قبل الحفظ). الأغراض لا تدخل في
+  هذه القواعد فتغييرها لا يمس الجدول.
+- بعد QuerySet.update() / bulk_create (بدون إشارات) تُستدعى rebuild_buckets().
+"""
+import itertools
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from face.fuzzy import FACE_SHAPES
+from face.kbs_engine import glasses_recommender
+from face.timing import stage
+
+from .conf import glasses_setting
+from .index import get_catalog
+from .kbs import compute_max_possible_score
+from .models import Glasses, RecommendationBucket
+from .recommend import Ranking
+from .scoring import RULE_POINTS, RULES
+
+
+UNKNOWN = ""
+BUCKET_RULES = 3            # shape, size, tone
+BUCKET_POINTS = RULE_POINTS[:BUCKET_RULES]
+SIZES = (UNKNOWN, *Glasses.Size.values)
+TONES = (UNKNOWN, *Glasses.Tone.values)
+
+
+def bucket_shapes():
+    """شكل الوجه → الأشكال التي يوصي بها GlassesRecommender."""
+    shapes = {UNKNOWN: []}
+    for face_shape in FACE_SHAPES:
+        shapes[face_shape] = glasses_recommender.run_engine(face_shape=face_shape)["recommended_shape"]
+    return shapes
+
+
+def bucket_key(face_shape, size=None, tone=None):
+    """مخرجات التحليل → مفتاح الصف (القيم التي لا تطابق أي نظارة → "")."""
+    return (
+        face_shape if face_shape in FACE_SHAPES else UNKNOWN,
+        size if size in Glasses.Size.values else UNKNOWN,
+        tone if tone in Glasses.Tone.values else UNKNOWN,
+    )
+
+
+# ------------------------------
+# بتات القواعد والترتيب
+# ------------------------------
+def _rules(shape, size, tone):
+    return shape.astype(np.uint8) | (size.astype(np.uint8) << 1) | (tone.astype(np.uint8) << 2)
+
+
+def _matched(rules):
+    return ((rules[:, None] >> np.arange(BUCKET_RULES, dtype=np.uint8)) & 1).astype(bool)
+
+
+def _ordered(ids, rules):
+    """المرشحون فقط (نقاط > 0) مرتبين بالنقاط تنازليًا ثم id، كما في Ranking."""
+    keep = rules != 0
+    ids, rules = ids[keep], rules[keep]
+    order = np.lexsort((ids, -(_matched(rules) @ BUCKET_POINTS)))
+    return ids[order], rules[order]
+
+
+def _fact_rules(row, shapes, size, tone):
+    if row is None:
+        return 0
+    return (row["shape"] in shapes) | (bool(size) and row["size"] == size) << 1 | (bool(tone) and row["tone"] == tone) << 2
+
+
+def _load(bucket):
+    ids = np.frombuffer(bytes(bucket.glasses_ids), dtype=np.int64)
+    return ids, np.frombuffer(bytes(bucket.rules), dtype=np.uint8)
+
+
+def _store(bucket, ids, rules):
+    bucket.glasses_ids, bucket.rules = ids.tobytes(), rules.tobytes()
+
+
+# ------------------------------
+# البناء والتحديث
+# ------------------------------
+def compute_buckets(catalog):
+    """{(شكل الوجه، المقاس، النبرة): (ids، بتات القواعد)} لكل الكتالوج."""
+    none = np.zeros(len(catalog), dtype=bool)
+    shape_masks = {
+        face_shape: catalog.category_match("shape", lambda c: c in shapes)
+        for face_shape, shapes in bucket_shapes().items()
+    }
+    size_masks = {z: catalog.category_match("size", lambda c: c == z) if z else none for z in SIZES}
+    tone_masks = {t: catalog.category_match("tone", lambda c: c == t) if t else none for t in TONES}
+    return {
+        (f, z, t): _ordered(catalog.ids, _rules(shape_masks[f], size_masks[z], tone_masks[t]))
+        for f, z, t in itertools.product(shape_masks, SIZES, TONES)
+    }
+
+
+def rebuild_buckets():
+    """إعادة بناء الجدول كاملًا من الكتالوج."""
+    buckets = []
+    for (face_shape, size, tone), (ids, rules) in compute_buckets(get_catalog()).items():
+        bucket = RecommendationBucket(face_shape=face_shape, size=size, tone=tone)
+        _store(bucket, ids, rules)
+        buckets.append(bucket)
+    with transaction.atomic():
+        RecommendationBucket.objects.all().delete()
+        RecommendationBucket.objects.bulk_create(buckets)
+    return len(buckets)
+
+
+def affected_buckets(before, after, shapes):
+    """
+    مفاتيح الصفوف التي تختلف فيها بتات نظارة كانت قيمها before وأصبحت after
+    ({"shape", "size", "tone"}، أو None للنظارة الجديدة/المحذوفة).
+    """
+    return {
+        (face_shape, size, tone)
+        for face_shape, recommended in shapes.items()
+        for size, tone in itertools.product(SIZES, TONES)
+        if _fact_rules(before, recommended, size, tone) != _fact_rules(after, recommended, size, tone)
+    }
+
+
+def refresh_buckets(ids, previous=None):
+    """
+    بعد تغيير النظارات ids: تُزال من كل صف ثم تُدرج بقواعدها الجديدة (المحذوفة لا تعود).
+    الصف الذي لم تتغير فيه بتات هذه النظارات لا يُكتب.
+    previous: {id: قيم shape/size/tone قبل التغيير أو None للجديدة} (glasses/signals.py)؛ معه
+    تُقفل وتُقرأ الصفوف التي تختلف فيها البتات فقط، وبدونه كل الصفوف.
+    """
+    ids = set(ids)
+    changed = np.fromiter(ids, dtype=np.int64, count=len(ids))
+    rows = list(Glasses.objects.filter(id__in=ids).values("id", "shape", "size", "tone"))
+    new_ids = np.array([row["id"] for row in rows], dtype=np.int64)
+    shapes = bucket_shapes()
+
+    queryset = RecommendationBucket.objects.select_for_update()
+    if previous is not None:
+        current = {row["id"]: row for row in rows}
+        keys = set()
+        for glasses_id in ids:
+            keys |= affected_buckets(previous.get(glasses_id), current.get(glasses_id), shapes)
+        if not keys:
+            return 0                # تغيير لا يمس الشكل/المقاس/النبرة (السعر مثلًا)
+        q = Q()
+        for face_shape, size, tone in keys:
+            q |= Q(face_shape=face_shape, size=size, tone=tone)
+        queryset = queryset.filter(q)
+
+    with transaction.atomic():
+        buckets = list(queryset)
+        updated = []
+        for bucket in buckets:
+            old_ids, old_rules = _load(bucket)
+            new_rules = np.array(
+                [_fact_rules(row, shapes.get(bucket.face_shape, ()), bucket.size, bucket.tone) for row in rows],
+                dtype=np.uint8,
+            )
+            present = np.isin(old_ids, changed)
+            before = dict(zip(old_ids[present].tolist(), old_rules[present].tolist()))
+            after = {i: r for i, r in zip(new_ids.tolist(), new_rules.tolist()) if r}
+            if before == after:
+                continue
+            _store(bucket, *_ordered(
+                np.concatenate([old_ids[~present], new_ids]),
+                np.concatenate([old_rules[~present], new_rules]),
+            ))
+            bucket.updated_at = timezone.now()
+            updated.append(bucket)
+        RecommendationBucket.objects.bulk_update(updated, ["glasses_ids", "rules", "updated_at"])
+    return len(updated)
+
+
+# ------------------------------
+# القراءة
+# ------------------------------
+def bucket_ranking(face_shape, size=None, tone=None):
+    """
+    Ranking مرتبة لمخرجات التحليل من صف واحد بالمفتاح الفريد (يُبنى الجدول إن لم يوجد).
+    مع RECOMMENDATION_BUCKETS=False تُحسب نفس النتيجة من الكتالوج مباشرة.
+    """
+    key = bucket_key(face_shape, size, tone)
+    with stage("bucket"):
+        if glasses_setting("RECOMMENDATION_BUCKETS"):
+            ids, rules = _read(key)
+        else:
+            ids, rules = compute_buckets(get_catalog())[key]
+
+    matched = np.zeros((len(ids), len(RULES)), dtype=bool)
+    matched[:, :BUCKET_RULES] = _matched(rules)
+    scores = matched[:, :BUCKET_RULES] @ BUCKET_POINTS
+    return Ranking(ids, scores, matched, compute_max_possible_score([]), presorted=True)
+
+
+def _read(key):
+    face_shape, size, tone = key
+    bucket = RecommendationBucket.objects.filter(face_shape=face_shape, size=size, tone=tone).first()
+    if bucket is None:
+        try:
+            rebuild_buckets()
+        except IntegrityError:
+            pass                    # عملية أخرى بنت الجدول في نفس الوقت
+        bucket = RecommendationBucket.objects.get(face_shape=face_shape, size=size, tone=tone)
+    return _load(bucket)
@@ -0,0 +1,33 @@
+# glasses/conf.py
+from django.conf import settings
+
+
+# ------------------------------
+# الإعدادات الافتراضية للتوصيات والكتالوج
+# تُدمج مع settings.GLASSES_RECOMMENDER (بنفس أسلوب face/conf.py)
+# ------------------------------
+DEFAULTS = {
+    # فهرس الكتالوج في ذاكرة كل عملية (glasses/index.py)؛ False = قراءة الجدول مع كل طلب
+    "CATALOG_INDEX": True,
+    # كاش مشترك بين العمليات لرقم نسخة الكتالوج: تغيير في عامل يُبطل فهارس العمال الآخرين.
+    # يجب أن يكون مشتركًا فعلًا (Redis/Memcached) عند تشغيل أكثر من عملية
+    "CATALOG_VERSION_CACHE_ALIAS": "default",
+    # لقطات الترتيب للصفحات التالية (glasses/pagination.py): الكاش ومدة صلاحية اللقطة بالثواني.
+    # بعد انتهائها يُعاد التقييم ويُكمل المؤشر من آخر (نقاط، id) أُرسل
+    "RANKING_CACHE_ALIAS": "default",
+    "RANKING_SNAPSHOT_TTL": 5 * 60,
+    # نتائج smart-recommend / analyze-and-recommend المرتبة حسب التفضيلات ونسخة الكتالوج
+    # (glasses/recommend.cached_ranking)؛ None = بدون كاش. مشتركة بين المستخدمين
+    "RESULT_CACHE_ALIAS": "default",
+    "RESULT_CACHE_TTL": 10 * 60,
+    # جدول الترتيب المحسوب مسبقًا لكل (شكل وجه، مقاس، نبرة) (glasses/buckets.py)؛
+    # False = الحساب من الكتالوج مع كل طلب
+    "RECOMMENDATION_BUCKETS": True,
+}
+
+
+def glasses_setting(name):
+    user_settings = getattr(settings, "GLASSES_RECOMMENDER", {})
+    if name in user_settings:
+        return user_settings[name]
+    return DEFAULTS[name]
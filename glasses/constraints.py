@@ -0,0 +1,91 @@
+# glasses/constraints.py
+"""
+قيود صارمة اختيارية على smart-recommend (hard_constraints في الطلب): النظارة التي لا تحقق
+القيد تُستبعد قبل التقييم، بدل أن تخسر نقاط القاعدة المقابلة فقط.
+
+- gender: جنس المستخدم أو Unisex (بنفس قيم فلتر smart-filter)
+- lightweight: نفس شرط match_weight (الوزن المقرّب لعدد صحيح <= 18)
+- material: إحدى المواد المطلوبة (جزء من الاسم بدون حالة الأحرف، كما في match_material)
+- store: إحدى store_ids
+
+مع فهرس الكتالوج تُطبق كأقنعة على الأعمدة ثم يُقيّم الناجون فقط؛ بدونه تُدفع إلى استعلام
+تحميل الكتالوج (Q) فلا يُقرأ من القاعدة إلا الناجون.
+"""
+import numpy as np
+from django.db.models import Q
+
+from .conf import glasses_setting
+from .index import catalog_index, load_facts
+from .models import Glasses
+from .scoring import LIGHTWEIGHT_MAX, CatalogArrays
+
+
+MODES = ("gender", "lightweight", "material", "store")
+GENDERS = {
+    "male": ("Male", "Unisex"),
+    "female": ("Female", "Unisex"),
+    "unisex": ("Unisex",),
+    "kids": ("Kids",),
+}
+
+
+def constraint_q(mode, value):
+    if mode == "gender":
+        return Q(gender__in=value)
+    if mode == "lightweight":
+        # int(round(w)) <= 18 مع round إلى الزوجي (18.5 → 18)؛ الفارغ والصفر → 999 في GlassesFact
+        return Q(weight__lte=LIGHTWEIGHT_MAX + 0.5) & ~Q(weight=0)
+    if mode == "material":
+        q = Q()
+        for material in value:
+            q |= Q(material__icontains=material)
+        return q
+    if mode == "store":
+        return Q(store_id__in=value)
+    raise ValueError(f"Unknown constraint {mode!r}")
+
+
+def constraint_mask(catalog, mode, value):
+    if mode == "gender":
+        return catalog.category_match("gender", lambda c: c in value)
+    if mode == "lightweight":
+        return catalog.weight <= LIGHTWEIGHT_MAX
+    if mode == "material":
+        return catalog.category_match("material", lambda c: any(m in c.lower() for m in value))
+    if mode == "store":
+        return np.isin(catalog.numeric["store_id"], np.array(value, dtype=np.int64))
+    raise ValueError(f"Unknown constraint {mode!r}")
+
+
+def prefiltered_catalog(constraints, explain=False):
+    """
+    (CatalogArrays للنظارات التي تحقق كل القيود، المراحل) حيث المراحل قائمة
+    {"stage", "pruned", "remaining"} بترتيب تطبيق القيود. بدون فهرس تُحسب المراحل
+    (استعلام count لكل قيد) فقط مع explain، وإلا تكون None.
+    """
+    if glasses_setting("CATALOG_INDEX"):
+        catalog = catalog_index.catalog()
+        stages = [{"stage": "catalog", "pruned": 0, "remaining": len(catalog)}]
+        if not constraints:
+            return catalog, stages
+        mask = np.ones(len(catalog), dtype=bool)
+        for mode, value in constraints:
+            mask &= constraint_mask(catalog, mode, value)
+            remaining = int(np.count_nonzero(mask))
+            stages.append({"stage": mode, "pruned": stages[-1]["remaining"] - remaining, "remaining": remaining})
+        return catalog.subset(np.flatnonzero(mask)), stages
+
+    q = Q()
+    stages = None
+    if explain:
+        queryset = Glasses.objects.all()
+        stages = [{"stage": "catalog", "pruned": 0, "remaining": queryset.count()}]
+    for mode, value in constraints:
+        q &= constraint_q(mode, value)
+        if explain:
+            remaining = queryset.filter(q).count()
+            stages.append({"stage": mode, "pruned": stages[-1]["remaining"] - remaining, "remaining": remaining})
+    catalog = CatalogArrays(load_facts(filters=q if constraints else None))
+    if stages is None and not constraints:
+        stages = [{"stage": "catalog", "pruned": 0, "remaining": len(catalog)}]
+    return catalog, stages
@@ -0,0 +1,158 @@
+# glasses/index.py
+"""
+فهرس الكتالوج في ذاكرة العملية: كل النظارات كأعمدة (glasses/scoring.CatalogArrays) مع
+الأغراض والسعر والمتجر، فالتقييم والفلترة يجريان بدون SQL ولا يُقرأ من القاعدة إلا ما سيُعاد للعميل.
+
+- يُبنى مرة عند أول استخدام (استعلامان).
+- إشارات glasses/signals.py تحدّثه تدريجيًا بعد نجاح الـ transaction: تُعاد قراءة النظارات
+  المتأثرة فقط وتُستبدل صفوفها في نسخة جديدة من الأعمدة.
+- رقم نسخة مشترك في كاش (CATALOG_VERSION_CACHE_ALIAS) يُرفع مع كل تغيير: العملية التي
+  تجد الرقم تغيّر من عملية أخرى تعيد البناء. QuerySet.update() و bulk_create لا ترسل
+  إشارات؛ بعدها تُستدعى invalidate() (أو bump_catalog_version())، و buckets.rebuild_buckets().
+"""
+import threading
+from collections import defaultdict
+
+from django.core.cache import caches
+
+from .conf import glasses_setting
+from .models import Glasses, GlassesPurpose
+from .scoring import CatalogArrays
+
+
+VERSION_KEY = "glasses:catalog-version"
+FIELDS = ("id", "shape", "material", "size", "gender", "tone", "color", "weight", "price", "store_id")
+
+
+# ------------------------------
+# قراءة الكتالوج من القاعدة
+# ------------------------------
+def to_fact(row, tags):
+    frame_id, shape, material, size, gender, tone, color, weight, price, store_id = row
+    return dict(
+        frame_id=frame_id, shape=shape, material=material,
+        size=size, gender=gender, tone=tone, color=color,
+        # نفس تحويل الوزن في GlassesFact (الفارغ والصفر → 999)
+        weight=int(round(float(weight))) if weight else 999,
+        style_tags=tags,
+        weight_value=weight,
+        price=float(price) if price is not None else None,
+        store_id=store_id,
+    )
+
+
+def load_facts(ids=None, filters=None):
+    """
+    صفوف الكتالوج (كلها أو ids فقط، أو ما يحقق Q في filters) كقواميس GlassesFact،
+    باستعلامين مهما كان العدد.
+    """
+    glasses = Glasses.objects.order_by("id")
+    purposes = GlassesPurpose.objects.order_by("id")
+    if ids is not None:
+        glasses = glasses.filter(id__in=ids)
+        purposes = purposes.filter(glasses_id__in=ids)
+    if filters is not None:
+        glasses = glasses.filter(filters)
+        purposes = purposes.filter(glasses_id__in=glasses.values("id"))
+
+    tags = defaultdict(list)
+    for glasses_id, name in purposes.values_list("glasses_id", "purpose__name"):
+        tags[glasses_id].append(name)
+    return [to_fact(row, tags[row[0]]) for row in glasses.values_list(*FIELDS)]
+
+
+# ------------------------------
+# رقم النسخة المشترك بين العمليات
+# ------------------------------
+def _version_cache():
+    return caches[glasses_setting("CATALOG_VERSION_CACHE_ALIAS")]
+
+
+def catalog_version():
+    cache = _version_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def bump_catalog_version():
+    cache = _version_cache()
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # المفتاح غير موجود (أول تغيير أو أُخرج من الكاش)
+        cache.add(VERSION_KEY, 0, timeout=None)
+        return cache.incr(VERSION_KEY)
+
+
+# ------------------------------
+# الفهرس
+# ------------------------------
+class CatalogIndex:
+    def __init__(self):
+        self._catalog = None
+        self._synced_version = None       # رقم النسخة المشترك الذي يطابقه _catalog
+        self._lock = threading.Lock()
+        self.version = 0                  # يزيد مع كل بناء أو تحديث داخل هذه العملية
+
+    def catalog(self):
+        """الأعمدة الحالية (CatalogArrays). لا تُعدّل؛ التحديثات تستبدلها بنسخة جديدة."""
+        shared = catalog_version()
+        catalog = self._catalog
+        if catalog is not None and shared == self._synced_version:
+            return catalog
+        with self._lock:
+            if self._catalog is None or shared != self._synced_version:
+                self._catalog = CatalogArrays(load_facts())
+                self._synced_version = shared
+                self.version += 1
+            return self._catalog
+
+    def refresh(self, ids):
+        """بعد تغيير النظارات ids في القاعدة: تعاد قراءتها فقط (المحذوفة تُزال)."""
+        ids = set(ids)
+        shared = bump_catalog_version()
+        with self._lock:
+            if self._catalog is None:
+                return
+            if shared != self._synced_version + 1:
+                # غيّرت عملية أخرى الكتالوج أيضًا منذ آخر مزامنة: بناء كامل عند القراءة التالية
+                self._catalog = None
+                return
+            facts = load_facts(ids)
+            removed = ids - {f["frame_id"] for f in facts}
+            self._catalog = self._catalog.updated(facts, removed_ids=removed)
+            self._synced_version = shared
+            self.version += 1
+
+    def invalidate(self):
+        """بعد تغييرات لا ترسل إشارات (update/bulk_create) أو تغيير أسماء الأغراض."""
+        bump_catalog_version()
+        with self._lock:
+            self._catalog = None
+
+
+catalog_index = CatalogIndex()
+
+
+def get_catalog():
+    """الكتالوج كأعمدة: من الفهرس، أو مقروءًا من القاعدة مباشرة إن كان الفهرس معطلًا."""
+    if glasses_setting("CATALOG_INDEX"):
+        return catalog_index.catalog()
+    return CatalogArrays(load_facts())
+
+
+def hydrate(ids, queryset=None):
+    """
+    نماذج Glasses لـ ids بنفس ترتيبها، بعدد ثابت من الاستعلامات مهما كان عدد ids
+    (استعلام للنظارات + واحد لكل prefetch، بدون تقسيم in_bulk على دفعات في SQLite).
+    """
+    if queryset is None:
+        queryset = Glasses.objects.select_related("store").prefetch_related("purposes", "images")
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    found = {g.id: g for g in queryset.filter(id__in=ids)}
+    return [found[i] for i in ids if i in found]
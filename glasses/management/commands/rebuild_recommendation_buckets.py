@@ -0,0 +1,19 @@
+# glasses/management/commands/rebuild_recommendation_buckets.py
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from glasses.buckets import rebuild_buckets
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the precomputed ranking of every face-shape/size/tone bucket from the catalog. "
+        "Run after bulk imports or QuerySet.update() on Glasses, which bypass the signals that "
+        "keep the table up to date."
+    )
+
+    def handle(self, *args, **opts):
+        t0 = perf_counter()
+        count = rebuild_buckets()
+        self.stdout.write(f"{count} buckets rebuilt in {(perf_counter() - t0) * 1000:.1f} ms")
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('glasses', '0007_alter_glasses_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('face_shape', models.CharField(blank=True, max_length=20)),
+                ('size', models.CharField(blank=True, max_length=20)),
+                ('tone', models.CharField(blank=True, max_length=10)),
+                ('glasses_ids', models.BinaryField()),
+                ('rules', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Recommendation bucket',
+                'verbose_name_plural': 'Recommendation buckets',
+                'constraints': [models.UniqueConstraint(fields=('face_shape', 'size', 'tone'), name='unique_recommendation_bucket')],
+            },
+        ),
+    ]
@@ -130,3 +130,27 @@ class GlassesImage(models.Model):
     def __str__(self):
         return f"Image for {self.id}"
 
+
+
+class RecommendationBucket(models.Model):
+    """
+    ترتيب الكتالوج محسوبًا مسبقًا لكل مخرج ممكن لـ GlassesRecommender
+    (شكل الوجه × المقاس × النبرة؛ "" = بدون توصية). تبنيه وتحدّثه glasses/buckets.py.
+    """
+    face_shape = models.CharField(max_length=20, blank=True)
+    size = models.CharField(max_length=20, blank=True)
+    tone = models.CharField(max_length=10, blank=True)
+    # مصفوفات NumPy كبايتات: ids النظارات بالترتيب (int64) وبتات القواعد المنطبقة لكل منها (uint8)
+    glasses_ids = models.BinaryField()
+    rules = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["face_shape", "size", "tone"], name="unique_recommendation_bucket"),
+        ]
+        verbose_name = "Recommendation bucket"
+        verbose_name_plural = "Recommendation buckets"
+
+    def __str__(self):
+        return f"{self.face_shape or '-'} / {self.size or '-'} / {self.tone or '-'}"
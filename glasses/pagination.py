@@ -0,0 +1,144 @@
+# glasses/pagination.py
+"""
+ترقيم صفحات نتائج التوصية (recommend.Ranking) بمؤشر مُعتم بدل رقم الصفحة.
+
+- الترتيب: النقاط تنازليًا ثم id تصاعديًا.
+- الصفحة الأولى تقيّم الكتالوج. إن كانت هناك صفحات تالية يُحفظ الترتيب كاملًا (ids، نقاط،
+  القواعد المنطبقة) كلقطة في الكاش لمدة RANKING_SNAPSHOT_TTL، فالصفحات التالية لا تعيد التقييم
+  ولا تتغير إن تغيّر الكتالوج أثناء التصفح.
+- إن أعادت rank() نتيجة من كاش النتائج (recommend.cached_ranking) فهي مرتبة ومخزنة أصلًا:
+  المؤشر يشير إليها مباشرة بدل لقطة خاصة بالمستخدم.
+- المؤشر = (رمز اللقطة، الموضع، (النقاط، id) لآخر عنصر قبل الصفحة). إن انتهت اللقطة يُعاد
+  التقييم بنفس مدخلات الطلب ويُكمل من بعد (النقاط، id) بدون تكرار أو قفز.
+- link_params: معاملات تُضاف لروابط next/previous (مدخلات إعادة التقييم لطلب GET لاحق).
+"""
+import base64
+import json
+import secrets
+from urllib import parse
+
+from django.core.cache import caches
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
+
+from face.timing import stage
+
+from .conf import glasses_setting
+from .recommend import Ranking, load_ranking
+
+
+def _snapshot_cache():
+    return caches[glasses_setting("RANKING_CACHE_ALIAS")]
+
+
+class RankingCursorPagination(BasePagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, link_params=None):
+        self.link_params = link_params or {}
+
+    def paginate_ranking(self, request, rank, scope):
+        """
+        rank: دالة بدون وسائط تعيد Ranking؛ لا تُستدعى إذا وُجدت لقطة المؤشر في الكاش.
+        scope: اسم النقطة (لقطات smart-recommend لا تُقرأ من نقطة أخرى).
+        يعيد نماذج Glasses للصفحة؛ العدد في self.count.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        token, offset, last_key = self.decode_cursor(request)
+        prefix = f"glasses:ranking:{scope}:{request.user.pk}:"
+
+        ranking = None
+        if token:
+            with stage("snapshot"):
+                ranking = self.load_snapshot(prefix, token)
+        if ranking is None:
+            ranking = rank()
+            token = ranking.key
+            # لقطة منتهية: نفس الموضع حسب (النقاط، id) في الترتيب الجديد
+            offset = ranking.seek(*last_key) if last_key else 0
+            if token is None and offset + self.page_size < len(ranking):
+                with stage("snapshot"):
+                    ranking = ranking.snapshot()
+                    token = secrets.token_urlsafe(12)
+                    _snapshot_cache().set(
+                        prefix + token,
+                        (ranking.ids, ranking.scores, ranking.matched, ranking.max_score),
+                        glasses_setting("RANKING_SNAPSHOT_TTL"),
+                    )
+
+        self.ranking, self.count = ranking, len(ranking)
+        self.next_cursor = self.previous_cursor = None
+        stop = offset + self.page_size
+        if stop < self.count:
+            self.next_cursor = (token, stop, ranking.key_at(stop - 1))
+        if offset > 0:
+            start = max(0, min(offset, self.count) - self.page_size)
+            self.previous_cursor = (token, start, ranking.key_at(start - 1) if start else None)
+        return ranking[offset:stop]
+
+    def load_snapshot(self, prefix, token):
+        # "نسخة.بصمة" من كاش النتائج المشترك؛ وإلا رمز لقطة خاص بالمستخدم (token_urlsafe بدون ".")
+        if "." in token:
+            return load_ranking(token)
+        stored = _snapshot_cache().get(prefix + token)
+        return Ranking(*stored, presorted=True) if stored is not None else None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    # ------------------------------
+    # المؤشر
+    # ------------------------------
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, 0, None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("ascii"))
+            token, offset, last_key = data["t"], int(data["o"]), data["k"]
+            if offset < 0 or (token is not None and not isinstance(token, str)):
+                raise ValueError
+            if last_key is not None:
+                last_key = (int(last_key[0]), int(last_key[1]))
+        except (TypeError, ValueError, KeyError, IndexError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if offset and last_key is None:
+            raise NotFound(self.invalid_cursor_message)
+        return token, offset, last_key
+
+    def cursor_value(self, cursor):
+        token, offset, last_key = cursor
+        data = json.dumps({"t": token, "o": offset, "k": last_key}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode("ascii")).decode("ascii")
+
+    def encode_cursor(self, cursor):
+        url = self.request.build_absolute_uri()
+        if self.link_params:
+            # القوائم كمعاملات مكررة (تُقرأ بـ getlist)
+            scheme, netloc, path, query, fragment = parse.urlsplit(url)
+            query_dict = parse.parse_qs(query, keep_blank_values=True)
+            for key, value in self.link_params.items():
+                query_dict[key] = value if isinstance(value, (list, tuple)) else [value]
+            url = parse.urlunsplit((scheme, netloc, path, parse.urlencode(sorted(query_dict.items()), doseq=True), fragment))
+        return replace_query_param(url, self.cursor_query_param, self.cursor_value(cursor))
+
+    def get_next_cursor(self):
+        """قيمة ?cursor= للصفحة التالية وحدها (لنقاط أخرى تقرأ نفس اللقطة)."""
+        return self.cursor_value(self.next_cursor) if self.next_cursor else None
+
+    def get_next_link(self):
+        return self.encode_cursor(self.next_cursor) if self.next_cursor else None
+
+    def get_previous_link(self):
+        # حتى الصفحة الأولى بمؤشر: تُقرأ من نفس اللقطة
+        return self.encode_cursor(self.previous_cursor) if self.previous_cursor else None
@@ -0,0 +1,299 @@
+# glasses/recommend.py
+"""
+ترتيب الكتالوج بقواعد SmartRecommenderKBS (تُقيّم بـ glasses/scoring.py)، مشترك بين
+smart-recommend و analyze-and-recommend (الثانية تمرر نتيجة تحليل الوجه مباشرة داخل نفس العملية).
+
+نتيجة الترتيب (ids ونقاط وقواعد منطبقة فقط، بدون أي حقل خاص بالمستخدم) تُخزن في كاش مشترك
+بمفتاح = رقم نسخة الكتالوج + بصمة التفضيلات بعد توحيدها؛ "favorite" وغيره يُحسب بعد القراءة
+من الكاش عند التسلسل. أي تغيير في Glasses/GlassesPurpose يرفع رقم النسخة (glasses/signals.py)
+فلا تُقرأ نتائج قديمة.
+"""
+import hashlib
+import json
+
+import numpy as np
+from django.core.cache import caches
+from rest_framework.exceptions import ValidationError
+
+from face.timing import stage
+
+from .conf import glasses_setting
+from .constraints import GENDERS, MODES, prefiltered_catalog
+from .index import catalog_version, hydrate
+from .kbs import compute_max_possible_score
+from .scoring import RULE_POINTS, reasons
+
+
+RESULTS_KEY = "glasses:results:"
+
+
+def _getlist(data, key):
+    # form-data: القيم المكررة؛ JSON: قائمة أو قيمة واحدة
+    if hasattr(data, "getlist"):
+        return data.getlist(key)
+    value = data.get(key)
+    if value in (None, ""):
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def user_preferences(data):
+    """تفضيلات المستخدم من مدخلات الطلب → قائمة UserPreference (كقواميس)."""
+    user_prefs = []
+    if data.get("gender"):
+        user_prefs.append({"category": "gender", "value": data["gender"]})
+    purposes = _getlist(data, "purposes")
+    if purposes:
+        user_prefs.append({"category": "purpose", "value": purposes})
+    if data.get("weight_preference"):
+        user_prefs.append({"category": "weight_pref", "value": "lightweight"})
+    for m in _getlist(data, "materials"):
+        user_prefs.append({"category": "material_pref", "value": m})
+    return user_prefs
+
+
+def preference_params(data):
+    """حقول الطلب التي تقرؤها user_preferences (غير الفارغة)، لتمريرها كمعاملات رابط GET."""
+    params = {}
+    for key in ("gender", "weight_preference"):
+        if data.get(key):
+            params[key] = str(data[key])
+    for key in ("purposes", "materials"):
+        values = _getlist(data, key)
+        if values:
+            params[key] = [str(v) for v in values]
+    return params
+
+
+def hard_constraints(data):
+    """
+    hard_constraints في الطلب (قائمة من constraints.MODES) → [(القيد، القيمة)] بترتيب MODES
+    وبقيم موحدة، فنفس القيود بأي ترتيب أو حالة أحرف تعطي نفس مفتاح الكاش.
+    """
+    modes = [str(mode).strip().lower() for mode in _getlist(data, "hard_constraints")]
+    unknown = sorted(set(modes) - set(MODES))
+    if unknown:
+        raise ValidationError({"hard_constraints": f"Unknown constraints {unknown}, expected any of {list(MODES)}"})
+
+    constraints = []
+    for mode in MODES:
+        if mode not in modes:
+            continue
+        if mode == "gender":
+            gender = str(data.get("gender") or "").lower()
+            if gender not in GENDERS:
+                raise ValidationError({"gender": "The gender constraint needs gender: Male, Female, Unisex or Kids"})
+            value = GENDERS[gender]
+        elif mode == "lightweight":
+            value = True
+        elif mode == "material":
+            value = tuple(sorted({str(m).lower() for m in _getlist(data, "materials")}))
+            if not value:
+                raise ValidationError({"materials": "The material constraint needs at least one material"})
+        else:
+            try:
+                value = tuple(sorted({int(i) for i in _getlist(data, "store_ids")}))
+            except (TypeError, ValueError):
+                raise ValidationError({"store_ids": "store_ids must be integers"})
+            if not value:
+                raise ValidationError({"store_ids": "The store constraint needs at least one store id"})
+        constraints.append((mode, value))
+    return constraints
+
+
+def analysis_from_request(data):
+    """مدخلات smart-recommend (shapes/size/tone) → AnalysisResult."""
+    return {
+        "recommended_shapes": data.get("shapes", []),
+        "recommended_size": data.get("size", "N/A"),
+        "recommended_tone": data.get("tone", "N/A"),
+    }
+
+
+def analysis_from_payload(payload):
+    """نتيجة face.pipeline → AnalysisResult (النبرة None عندما لون البشرة Unknown)."""
+    return {
+        "recommended_shapes": payload.get("recommended_shape") or [],
+        "recommended_size": payload.get("recommended_size") or "N/A",
+        "recommended_tone": payload.get("recommended_tone") or "N/A",
+    }
+
+
+class Ranking:
+    """
+    نتيجة التقييم كمصفوفات (نقاط لكل نظارة)، مرتبة تنازليًا حسب النقاط ثم تصاعديًا حسب id.
+    النظارات ذات النقاط 0 ليست في الترتيب.
+
+    الشريحة ranking[a:b] (ما يطلبه Paginator) هي فقط ما يُقرأ من القاعدة ويُسلسل:
+    أعلى b صف تُختار بـ argpartition بدل ترتيب الكتالوج كله.
+    presorted=True: المصفوفات مرتبة مسبقًا (لقطة من snapshot()) فالشريحة قصّ مباشر.
+    matched=None: بدون score/match_percentage/reasons على النماذج.
+    stages: أعداد المستبعدين في كل مرحلة (القيود الصارمة ثم التقييم) لـ explain، إن حُسبت.
+    """
+
+    def __init__(self, ids, scores, matched, max_score, presorted=False, key=None, stages=None):
+        self.key = key                    # مفتاح النتيجة في كاش النتائج المشترك، إن خُزنت فيه
+        self.stages = stages
+        self.ids = ids
+        self.scores = scores
+        self.matched = matched
+        self.max_score = max_score
+        self.presorted = presorted
+        self.candidates = np.flatnonzero(scores > 0)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def rows(self, start, stop):
+        """صفوف المصفوفات للرتب [start, stop)."""
+        stop = min(stop, len(self.candidates))
+        if start >= stop:
+            return np.empty(0, dtype=np.int64)
+        if self.presorted:
+            return self.candidates[start:stop]
+        # مفتاح واحد فريد لكل صف: النقاط تنازليًا ثم id تصاعديًا
+        ids = self.ids[self.candidates]
+        key = -self.scores[self.candidates].astype(np.int64) * (int(ids.max()) + 1) + ids
+        if stop < len(key):
+            top = np.argpartition(key, stop - 1)[:stop]
+        else:
+            top = np.arange(len(key))
+        top = top[np.argsort(key[top])]
+        return self.candidates[top[start:stop]]
+
+    def snapshot(self):
+        """نسخة مرتبة بالكامل تحوي المرشحين فقط (تُحفظ في الكاش للصفحات التالية)."""
+        rows = self.rows(0, len(self))
+        matched = self.matched[rows] if self.matched is not None else None
+        return Ranking(self.ids[rows], self.scores[rows], matched, self.max_score, presorted=True, stages=self.stages)
+
+    def key_at(self, position):
+        """(النقاط، id) للرتبة position."""
+        [row] = self.rows(position, position + 1)
+        return int(self.scores[row]), int(self.ids[row])
+
+    def seek(self, score, frame_id):
+        """عدد الرتب حتى (score, frame_id) ضمنًا: موضع ما بعده حتى لو لم يعد موجودًا."""
+        scores, ids = self.scores[self.candidates], self.ids[self.candidates]
+        return int(np.count_nonzero((scores > score) | ((scores == score) & (ids <= frame_id))))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            with stage("ranking"):
+                rows = self.rows(start, stop)[::step]
+            return self.hydrate(rows)
+        if index < 0:
+            index += len(self)
+        return self[index:index + 1][0]
+
+    def hydrate(self, rows):
+        """نماذج Glasses للصفوف rows مع score و match_percentage و reasons."""
+        with stage("hydrate"):
+            ids = self.ids[rows]
+            # نظارة حُذفت بعد التقييم لا تعود من القاعدة فتسقط من النتائج
+            enriched = hydrate(ids)
+            if self.matched is None:
+                return enriched
+            by_id = dict(zip(ids.tolist(), rows))
+            for g in enriched:
+                row = by_id[g.id]
+                g.score = int(self.scores[row])
+                g.match_percentage = round((g.score / self.max_score) * 100, 1) if self.max_score else 0
+                g.reasons = reasons(self.matched[row])
+        return enriched
+
+
+def score_catalog(analysis, user_prefs, constraints=(), explain=False):
+    """
+    يعيد Ranking للكتالوج (تقييم فقط؛ القراءة من القاعدة عند أخذ شريحة). مع constraints
+    (من hard_constraints) يُقيّم فقط ما يحققها.
+    """
+    max_score = compute_max_possible_score(user_prefs)
+
+    with stage("catalog"):
+        catalog, stages = prefiltered_catalog(constraints, explain)
+
+    with stage("scoring"):
+        scores, matched = catalog.score(analysis, user_prefs)
+
+    ranking = Ranking(catalog.ids, scores, matched, max_score)
+    if stages is not None:
+        stages.append({"stage": "scoring", "pruned": len(catalog) - len(ranking), "remaining": len(ranking)})
+        ranking.stages = stages
+    return ranking
+
+
+# ------------------------------
+# كاش النتائج المشترك بين المستخدمين
+# ------------------------------
+def preferences_key(analysis, user_prefs, constraints=()):
+    """
+    بصمة المدخلات بعد توحيدها كما تقارنها scoring.CatalogArrays.matches: ترتيب القوائم
+    والتكرار لا يهمان، والجنس والأغراض والمواد بدون حالة الأحرف.
+    (القيود الصارمة موحدة أصلًا في hard_constraints)
+    """
+    canonical = {
+        "constraints": [[mode, value] for mode, value in constraints],
+        "points": RULE_POINTS.tolist(),
+        "shapes": sorted({str(shape) for shape in analysis.get("recommended_shapes") or ()}),
+        "size": analysis.get("recommended_size"),
+        "tone": analysis.get("recommended_tone"),
+        "gender": set(), "purposes": set(), "materials": set(), "lightweight": False,
+    }
+    for pref in user_prefs:
+        category, value = pref["category"], pref["value"]
+        if category == "gender":
+            canonical["gender"].add(str(value).lower())
+        elif category == "purpose":
+            canonical["purposes"].update(str(name).lower() for name in value)
+        elif category == "material_pref":
+            canonical["materials"].add(str(value).lower())
+        elif category == "weight_pref" and value == "lightweight":
+            canonical["lightweight"] = True
+    for name in ("gender", "purposes", "materials"):
+        canonical[name] = sorted(canonical[name])
+    data = json.dumps(canonical, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+
+def get_results_cache():
+    alias = glasses_setting("RESULT_CACHE_ALIAS")
+    return caches[alias] if alias else None
+
+
+def load_ranking(key):
+    """Ranking مرتبة من كاش النتائج، أو None إن انتهت أو لم تُخزن."""
+    cache = get_results_cache()
+    stored = cache.get(RESULTS_KEY + key) if cache is not None else None
+    if stored is None:
+        return None
+    return Ranking(*stored, presorted=True, key=key)
+
+
+def cached_ranking(analysis, user_prefs, constraints=(), explain=False):
+    """
+    مثل score_catalog لكن من كاش النتائج عند تطابق التفضيلات والقيود ونسخة الكتالوج. النتيجة
+    المخزنة مرتبة بالكامل، فهي أيضًا لقطة الترقيم لكل المستخدمين بنفس المدخلات (pagination.py).
+    explain يتجاوز القراءة من الكاش: أعداد المراحل تُحسب مع التقييم فقط.
+    """
+    cache = get_results_cache()
+    if cache is None:
+        return score_catalog(analysis, user_prefs, constraints, explain)
+
+    with stage("cache"):
+        key = f"{catalog_version()}.{preferences_key(analysis, user_prefs, constraints)}"
+        ranking = None if explain else load_ranking(key)
+    if ranking is not None:
+        return ranking
+
+    ranking = score_catalog(analysis, user_prefs, constraints, explain)
+    with stage("snapshot"):
+        ranking = ranking.snapshot()
+        ranking.key = key
+        cache.set(
+            RESULTS_KEY + key,
+            (ranking.ids, ranking.scores, ranking.matched, ranking.max_score),
+            glasses_setting("RESULT_CACHE_TTL"),
+        )
+    return ranking
@@ -0,0 +1,221 @@
+# glasses/scoring.py
+"""
+تقييم الكتالوج بعمليات NumPy بدل محرك experta (SmartRecommenderKBS في glasses/kbs.py):
+الكتالوج أعمدة (رموز فئات للشكل/المقاس/النبرة/الجنس/المادة، الأوزان، قناع بتات للأغراض)،
+وكل قاعدة match_* تُحسب لكل النظارات بعملية واحدة.
+
+نفس النقاط (POINTS_MAP) ونفس نصوص الأسباب وترتيبها (حسب salience القواعد) التي يعطيها experta؛
+glasses/tests.py يتحقق من التطابق. experta يبقى المرجع: أي قاعدة جديدة تُضاف هناك وهنا معًا.
+"""
+import numpy as np
+
+from .kbs import POINTS_MAP
+
+
+# بنفس ترتيب salience في SmartRecommenderKBS (ترتيب الأسباب في القائمة)
+RULES = (
+    ("shape", "Matches Face Shape Analysis"),
+    ("size", "Matches Face Size Analysis"),
+    ("tone", "Matches Skin Tone Analysis"),
+    ("purpose", "Matches User's Purpose"),
+    ("gender", "Matches User's Gender"),
+    ("material_pref", "Matches User's Material Preference"),
+    ("weight_pref", "Matches User's Lightweight Preference"),
+)
+RULE_POINTS = np.array([POINTS_MAP[key] for key, _ in RULES], dtype=np.int64)
+RULE_REASONS = tuple(f"{reason} (+{POINTS_MAP[key]})" for key, reason in RULES)
+
+LIGHTWEIGHT_MAX = 18     # match_weight: weight <= 18 (الوزن المقرّب لعدد صحيح كما في GlassesFact)
+BITS = 64
+
+CATEGORICAL = ("shape", "size", "tone", "gender", "material", "color")
+# أعمدة إضافية للفلترة (ليست في GlassesFact): القيمة الافتراضية للصف الذي لا يحملها
+NUMERIC = {
+    "weight_value": (np.float64, np.nan),   # Glasses.weight كما هو (NaN = فارغ)
+    "price": (np.float64, np.nan),
+    "store_id": (np.int64, -1),
+}
+
+
+class CatalogArrays:
+    """
+    الكتالوج كأعمدة. المدخلات بنفس حقول GlassesFact:
+    frame_id, shape, material, size, gender, tone, color, weight (int)، style_tags (أسماء الأغراض)،
+    واختياريًا weight_value و price و store_id.
+
+    لا تُعدّل بعد إنشائها: updated() تعيد نسخة جديدة، فالقراءة من عدة خيوط لا تحتاج قفلًا.
+    """
+
+    def __init__(self, facts=()):
+        facts = list(facts)
+        self.ids = np.array([f["frame_id"] for f in facts], dtype=np.int64)
+        self.weight = np.array([f["weight"] for f in facts], dtype=np.int64)
+        self.numeric = {
+            name: np.array([_or_default(f.get(name), default) for f in facts], dtype=dtype)
+            for name, (dtype, default) in NUMERIC.items()
+        }
+        # كل عمود فئات: (قائمة الفئات، فئة → رمز، رمز كل صف)
+        self.columns = {}
+        for name in CATEGORICAL:
+            categories, lookup = [], {}
+            codes = np.array([_code(categories, lookup, f.get(name)) for f in facts], dtype=np.int32)
+            self.columns[name] = (categories, lookup, codes)
+
+        # الأغراض: بت لكل اسم، بكلمات uint64
+        self.purpose_bits = {}
+        for f in facts:
+            for tag in f.get("style_tags") or ():
+                self.purpose_bits.setdefault(tag, len(self.purpose_bits))
+        self.purposes = np.zeros((len(facts), _words(len(self.purpose_bits))), dtype=np.uint64)
+        for row, f in enumerate(facts):
+            self._set_purposes(row, f.get("style_tags"))
+        self.rows = {frame_id: row for row, frame_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ------------------------------
+    # تحديث تدريجي (نسخة جديدة)
+    # ------------------------------
+    def updated(self, facts=(), removed_ids=()):
+        """
+        نسخة فيها facts مضافة أو مستبدلة (بنفس الموضع إن كانت موجودة، وإلا في النهاية)
+        ومحذوف منها removed_ids. الكلفة نسخ الأعمدة مرة واحدة، بدون إعادة بناء الكتالوج.
+        """
+        removed = set(removed_ids)
+        facts = [f for f in facts if f["frame_id"] not in removed]
+        new_facts = [f for f in facts if f["frame_id"] not in self.rows]
+        n, m = len(self), len(new_facts)
+
+        new = object.__new__(type(self))
+        new.ids = np.concatenate([self.ids, np.zeros(m, dtype=np.int64)])
+        new.weight = np.concatenate([self.weight, np.zeros(m, dtype=np.int64)])
+        new.numeric = {
+            name: np.concatenate([self.numeric[name], np.full(m, NUMERIC[name][1], dtype=NUMERIC[name][0])])
+            for name in NUMERIC
+        }
+        new.columns = {
+            name: (list(categories), dict(lookup), np.concatenate([codes, np.zeros(m, dtype=np.int32)]))
+            for name, (categories, lookup, codes) in self.columns.items()
+        }
+        new.purpose_bits = dict(self.purpose_bits)
+        new.purposes = np.concatenate([self.purposes, np.zeros((m, self.purposes.shape[1]), dtype=np.uint64)])
+
+        positions = {f["frame_id"]: self.rows.get(f["frame_id"]) for f in facts}
+        for i, f in enumerate(new_facts):
+            positions[f["frame_id"]] = n + i
+        for f in facts:
+            new._set_row(positions[f["frame_id"]], f)
+
+        if removed:
+            keep = ~np.isin(new.ids, np.fromiter(removed, dtype=np.int64, count=len(removed)))
+            new.ids, new.weight, new.purposes = new.ids[keep], new.weight[keep], new.purposes[keep]
+            new.numeric = {name: values[keep] for name, values in new.numeric.items()}
+            new.columns = {name: (c, l, codes[keep]) for name, (c, l, codes) in new.columns.items()}
+        new.rows = {frame_id: row for row, frame_id in enumerate(new.ids.tolist())}
+        return new
+
+    def subset(self, rows):
+        """نسخة فيها الصفوف rows فقط (بنفس ترتيبها)، لتقييم المرشحين بعد الفلترة."""
+        new = object.__new__(type(self))
+        new.ids, new.weight, new.purposes = self.ids[rows], self.weight[rows], self.purposes[rows]
+        new.numeric = {name: values[rows] for name, values in self.numeric.items()}
+        # قوائم الفئات وبتات الأغراض لا تُعدّل إلا في updated() التي تنسخها، فتُشارك هنا
+        new.columns = {name: (c, l, codes[rows]) for name, (c, l, codes) in self.columns.items()}
+        new.purpose_bits = self.purpose_bits
+        new.rows = {frame_id: row for row, frame_id in enumerate(new.ids.tolist())}
+        return new
+
+    def _set_row(self, row, fact):
+        self.ids[row] = fact["frame_id"]
+        self.weight[row] = fact["weight"]
+        for name, (dtype, default) in NUMERIC.items():
+            self.numeric[name][row] = _or_default(fact.get(name), default)
+        for name in CATEGORICAL:
+            categories, lookup, codes = self.columns[name]
+            codes[row] = _code(categories, lookup, fact.get(name))
+        for tag in fact.get("style_tags") or ():
+            self.purpose_bits.setdefault(tag, len(self.purpose_bits))
+        words = _words(len(self.purpose_bits))
+        if words > self.purposes.shape[1]:
+            self.purposes = np.pad(self.purposes, ((0, 0), (0, words - self.purposes.shape[1])))
+        self.purposes[row] = 0
+        self._set_purposes(row, fact.get("style_tags"))
+
+    def _set_purposes(self, row, tags):
+        for tag in tags or ():
+            bit = self.purpose_bits[tag]
+            self.purposes[row, bit // BITS] |= np.uint64(1) << np.uint64(bit % BITS)
+
+    # ------------------------------
+    # مطابقة
+    # ------------------------------
+    def category_match(self, name, predicate):
+        """(N,) منطقي: الشرط يُقيّم مرة لكل فئة ثم يُنشر على الصفوف برموزها."""
+        categories, _, codes = self.columns[name]
+        return np.fromiter((predicate(c) for c in categories), dtype=bool, count=len(categories))[codes]
+
+    def purpose_mask(self, names, ignore_case=False):
+        mask = np.zeros(self.purposes.shape[1], dtype=np.uint64)
+        if ignore_case:
+            wanted = {str(name).lower() for name in names}
+            bits = [bit for tag, bit in self.purpose_bits.items() if tag.lower() in wanted]
+        else:
+            bits = [self.purpose_bits[name] for name in names if name in self.purpose_bits]
+        for bit in bits:
+            mask[bit // BITS] |= np.uint64(1) << np.uint64(bit % BITS)
+        return mask
+
+    def matches(self, analysis, user_prefs):
+        """(N, len(RULES)) منطقي: هل تنطبق كل قاعدة على كل نظارة."""
+        n = len(self)
+        matched = np.zeros((n, len(RULES)), dtype=bool)
+        if not n:
+            return matched
+
+        shapes = set(analysis.get("recommended_shapes") or ())
+        matched[:, 0] = self.category_match("shape", lambda c: c in shapes)
+        matched[:, 1] = self.category_match("size", lambda c: c == analysis.get("recommended_size"))
+        matched[:, 2] = self.category_match("tone", lambda c: c == analysis.get("recommended_tone"))
+
+        for pref in user_prefs:
+            category, value = pref["category"], pref["value"]
+            if category == "purpose":
+                # match_purpose يقارن بدون حالة الأحرف
+                mask = self.purpose_mask(value, ignore_case=True)
+                matched[:, 3] |= (self.purposes & mask).any(axis=1)
+            elif category == "gender":
+                wanted = str(value).lower()
+                matched[:, 4] |= self.category_match("gender", lambda c: c.lower() == wanted)
+            elif category == "material_pref":
+                wanted = str(value).lower()
+                matched[:, 5] |= self.category_match("material", lambda c: wanted in c.lower())
+            elif category == "weight_pref" and value == "lightweight":
+                matched[:, 6] |= self.weight <= LIGHTWEIGHT_MAX
+        return matched
+
+    def score(self, analysis, user_prefs):
+        """يعيد (نقاط كل نظارة (N,)، مصفوفة القواعد المنطبقة)."""
+        matched = self.matches(analysis, user_prefs)
+        return matched @ RULE_POINTS, matched
+
+
+def _or_default(value, default):
+    return default if value is None else value
+
+
+def _code(categories, lookup, value):
+    value = "" if value is None else str(value)
+    code = lookup.get(value)
+    if code is None:
+        code = lookup[value] = len(categories)
+        categories.append(value)
+    return code
+
+
+def _words(n_bits):
+    return max(1, -(-n_bits // BITS))
+
+
+def reasons(matched_row):
+    return [RULE_REASONS[i] for i in np.flatnonzero(matched_row)]
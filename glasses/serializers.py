@@ -1,11 +1,57 @@
 from rest_framework import serializers
 from users.models import Favorite   # 👈 موديل المفضلة
 from .models import Glasses, GlassesImage, Purpose, GlassesPurpose
-from rembg import remove
 from PIL import Image
 import io
+import threading
 from django.core.files.base import ContentFile
 
+
+# ------------------------------
+# إزالة خلفية صور النظارات (rembg)
+# rembg ثقيلة جدًا عند الاستيراد (onnxruntime + numba + scipy)، فتُحمّل عند أول صورة فقط،
+# وجلسة النموذج تُنشأ مرة واحدة بدل تحميل النموذج مع كل remove()
+# ------------------------------
+_rembg_session = None
+_rembg_lock = threading.Lock()
+
+
+def get_rembg_session():
+    global _rembg_session
+    if _rembg_session is None:
+        with _rembg_lock:
+            if _rembg_session is None:
+                from rembg import new_session
+                _rembg_session = new_session("u2net")   # افتراضي remove() في rembg المثبتة (2.0.67)
+    return _rembg_session
+
+
+def remove_background(img):
+    """صورة مرفوعة → ContentFile بصيغة PNG شفافة الخلفية."""
+    from rembg import remove
+
+    output_img = remove(Image.open(img), session=get_rembg_session()).convert("RGBA")
+    img_io = io.BytesIO()
+    output_img.save(img_io, format="PNG")
+    return ContentFile(img_io.getvalue(), name=f"{img.name.split('.')[0]}.png")
+
+
+def favorite_ids(context):
+    """
+    أرقام نظارات المستخدم المفضلة باستعلام واحد لكل serializer بدل استعلام لكل نظارة
+    (many=True: كل العناصر تشارك context الجذر فتُحفظ المجموعة فيه).
+    """
+    request = context.get("request", None)
+    if not (request and request.user.is_authenticated):
+        return frozenset()
+    ids = context.get("_favorite_ids")
+    if ids is None:
+        ids = context["_favorite_ids"] = frozenset(
+            Favorite.objects.filter(user=request.user, is_favorite=True).values_list("glasses_id", flat=True)
+        )
+    return ids
+
+
 class GlassesImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = GlassesImage
@@ -33,12 +79,7 @@ class GlassesSerializer(serializers.ModelSerializer):
         fields = '__all__'   # أو حدد الحقول إذا حابب
 
     def get_favorite(self, obj):
-        request = self.context.get('request', None)
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(
-                user=request.user, glasses=obj, is_favorite=True
-            ).exists()
-        return False
+        return obj.id in favorite_ids(self.context)
 
 
 class GlassesDetailSerializer(serializers.ModelSerializer):
@@ -68,12 +109,7 @@ class GlassesDetailSerializer(serializers.ModelSerializer):
         ]
 
     def get_favorite(self, obj):
-        request = self.context.get("request", None)
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(
-                user=request.user, glasses=obj, is_favorite=True
-            ).exists()
-        return False
+        return obj.id in favorite_ids(self.context)
 
 class GlassesUpdateSerializer(serializers.ModelSerializer):
     purposes = serializers.ListField(
@@ -126,24 +162,14 @@ class GlassesUpdateSerializer(serializers.ModelSerializer):
                 to_add = new_images[len(old_images):]
                 for img in to_add:
                     # 🔹 تحويل الصورة إلى PNG مع إزالة الخلفية
-                    input_img = Image.open(img)
-                    output_img = remove(input_img).convert("RGBA")
-
-                    img_io = io.BytesIO()
-                    output_img.save(img_io, format="PNG")
-                    img_content = ContentFile(img_io.getvalue(), name=f"{img.name.split('.')[0]}.png")
+                    img_content = remove_background(img)
 
                     GlassesImage.objects.create(glasses=instance, image=img_content)
 
             # تحديث القديمة
             for i, img in enumerate(new_images[:len(old_images)]):
                 # 🔹 تحويل الصورة إلى PNG مع إزالة الخلفية
-                input_img = Image.open(img)
-                output_img = remove(input_img).convert("RGBA")
-
-                img_io = io.BytesIO()
-                output_img.save(img_io, format="PNG")
-                img_content = ContentFile(img_io.getvalue(), name=f"{img.name.split('.')[0]}.png")
+                img_content = remove_background(img)
 
                 old_images[i].image.save(img_content.name, img_content, save=True)
 
@@ -184,12 +210,7 @@ class GlassesRecommendationSerializer(serializers.ModelSerializer):
         ]
 
     def get_favorite(self, obj):
-        request = self.context.get("request", None)
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(
-                user=request.user, glasses=obj, is_favorite=True
-            ).exists()
-        return False
+        return obj.id in favorite_ids(self.context)
     
 class GlassesCreateSerializer(serializers.ModelSerializer):
     purposes = serializers.ListField(
@@ -234,12 +255,7 @@ class GlassesCreateSerializer(serializers.ModelSerializer):
 
         # 🔹 معالجة الصور
         for img in images_data:
-            input_img = Image.open(img)
-            output_img = remove(input_img).convert("RGBA")
-
-            img_io = io.BytesIO()
-            output_img.save(img_io, format="PNG")
-            img_content = ContentFile(img_io.getvalue(), name=f"{img.name.split('.')[0]}.png")
+            img_content = remove_background(img)
 
             GlassesImage.objects.create(glasses=glasses, image=img_content)
 
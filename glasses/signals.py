@@ -0,0 +1,68 @@
+# glasses/signals.py
+"""
+تحديث فهرس الكتالوج (glasses/index.py) بعد نجاح كل transaction تغيّر النظارات أو أغراضها،
+وجدول RecommendationBucket (glasses/buckets.py) بعد تغيير النظارات نفسها.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .buckets import refresh_buckets
+from .conf import glasses_setting
+from .index import catalog_index
+from .models import Glasses, GlassesPurpose, Purpose
+
+
+def _refresh_after_commit(ids):
+    transaction.on_commit(partial(catalog_index.refresh, ids))
+
+
+@receiver(pre_save, sender=Glasses)
+@receiver(pre_delete, sender=Glasses)
+def glasses_changing(sender, instance, **kwargs):
+    # قيم الصف قبل التغيير: refresh_buckets تقفل الصفوف التي تختلف فيها البتات فقط
+    if glasses_setting("RECOMMENDATION_BUCKETS"):
+        instance._bucket_previous = (
+            None if instance._state.adding
+            else Glasses.objects.filter(pk=instance.pk).values("shape", "size", "tone").first()
+        )
+
+
+@receiver(post_save, sender=Glasses)
+@receiver(post_delete, sender=Glasses)
+def glasses_changed(sender, instance, **kwargs):
+    _refresh_after_commit([instance.pk])
+    if glasses_setting("RECOMMENDATION_BUCKETS"):
+        # بدون قيم سابقة (الإعداد فُعّل بين الإشارتين) تُقفل كل الصفوف
+        previous = {instance.pk: instance._bucket_previous} if hasattr(instance, "_bucket_previous") else None
+        transaction.on_commit(partial(refresh_buckets, [instance.pk], previous))
+
+
+@receiver(post_save, sender=GlassesPurpose)
+@receiver(post_delete, sender=GlassesPurpose)
+def glasses_purpose_changed(sender, instance, **kwargs):
+    _refresh_after_commit([instance.glasses_id])
+
+
+@receiver(m2m_changed, sender=Glasses.purposes.through)
+def glasses_purposes_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _refresh_after_commit([instance.pk])
+    elif pk_set:
+        # من جهة Purpose: pk_set أرقام النظارات
+        _refresh_after_commit(pk_set)
+    else:
+        # purpose.glasses.clear(): النظارات المتأثرة غير معروفة هنا
+        transaction.on_commit(catalog_index.invalidate)
+
+
+@receiver(post_save, sender=Purpose)
+@receiver(post_delete, sender=Purpose)
+def purpose_changed(sender, instance, created=False, **kwargs):
+    # غرض جديد لا يغيّر أي نظارة بعد؛ تغيير الاسم أو الحذف يمس كل نظاراته
+    if not created:
+        transaction.on_commit(catalog_index.invalidate)
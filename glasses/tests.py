@@ -1,3 +1,952 @@
-from django.test import TestCase
+import itertools
+import random
+import re
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+import cv2
+import numpy as np
+
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from face.fuzzy import classifier, shape_features
+from face.models import FaceAnalysis
+from face.pipeline import MEASUREMENT_KEYS, FaceAnalysisError
+from face.views import find_saved_analysis
+from .buckets import affected_buckets, bucket_ranking, bucket_shapes, compute_buckets, rebuild_buckets
+from .index import catalog_index, load_facts
+from .kbs import SmartRecommenderKBS, GlassesFact, AnalysisResult, UserPreference, RecommendationScore
+from .models import Glasses, GlassesPurpose, Purpose, RecommendationBucket
+from .recommend import Ranking, analysis_from_payload, preferences_key, score_catalog, user_preferences
+from stores.models import Store
+from users.models import CustomUser, Favorite
+from .scoring import CATEGORICAL, NUMERIC, CatalogArrays, reasons
+
+
+class VectorizedScoringTests(SimpleTestCase):
+    """CatalogArrays تعطي نفس نقاط وأسباب SmartRecommenderKBS (experta) لكل نظارة."""
+
+    PURPOSES = ("Reading", "reading", "Sports", "Fashion", "Driving", "Office")
+    WEIGHTS = (999, 0, 12, 17, 18, 19, 25)
+
+    @classmethod
+    def catalog(cls, n, seed):
+        rng = random.Random(seed)
+        return [
+            dict(
+                frame_id=i + 1,
+                shape=rng.choice(Glasses.Shape.values),
+                material=rng.choice(Glasses.Material.values),
+                size=rng.choice(Glasses.Size.values),
+                gender=rng.choice(Glasses.Gender.values),
+                tone=rng.choice(Glasses.Tone.values),
+                color=rng.choice(Glasses.GeneralColor.values),
+                weight=rng.choice(cls.WEIGHTS),
+                style_tags=rng.sample(cls.PURPOSES, rng.randint(0, 3)),
+            )
+            for i in range(n)
+        ]
+
+    @classmethod
+    def requests(cls):
+        analyses = [
+            {"recommended_shapes": ["Oval", "Round", "Cat-Eye"], "recommended_size": "Large", "recommended_tone": "Light"},
+            {"recommended_shapes": ["Rectangle"], "recommended_size": "Small", "recommended_tone": "Dark"},
+            {"recommended_shapes": [], "recommended_size": "N/A", "recommended_tone": "N/A"},
+        ]
+        prefs = [
+            [],
+            [{"category": "gender", "value": "male"}],
+            [{"category": "purpose", "value": ["READING", "Sports"]}, {"category": "weight_pref", "value": "lightweight"}],
+            [{"category": "material_pref", "value": "steel"}, {"category": "material_pref", "value": "Metal"}],
+            [{"category": "gender", "value": "Unisex"}, {"category": "purpose", "value": ["Gaming"]},
+             {"category": "material_pref", "value": "ti"}, {"category": "weight_pref", "value": "lightweight"}],
+        ]
+        return itertools.product(analyses, prefs)
+
+    @staticmethod
+    def experta_scores(facts, analysis, user_prefs):
+        engine = SmartRecommenderKBS()
+        engine.reset()
+        engine.declare(AnalysisResult(**analysis))
+        for pref in user_prefs:
+            engine.declare(UserPreference(**pref))
+        for fact in facts:
+            engine.declare(GlassesFact(**fact))
+        engine.run()
+        return {
+            fact["frame_id"]: (fact["score"], list(fact["reasons"]))
+            for fact in engine.facts.values()
+            if isinstance(fact, RecommendationScore)
+        }
+
+    def test_matches_experta(self):
+        facts = self.catalog(40, seed=7)
+        catalog = CatalogArrays(facts)
+        for analysis, user_prefs in self.requests():
+            expected = self.experta_scores(facts, analysis, user_prefs)
+            scores, matched = catalog.score(analysis, user_prefs)
+            actual = {
+                int(frame_id): (int(score), reasons(row))
+                for frame_id, score, row in zip(catalog.ids, scores, matched)
+            }
+            self.assertEqual(actual, expected, msg=(analysis, user_prefs))
+
+    def test_many_purposes_span_bitmask_words(self):
+        facts = self.catalog(6, seed=3)
+        for i, fact in enumerate(facts):
+            fact["style_tags"] = [f"Purpose {i * 30 + k}" for k in range(30)]
+        catalog = CatalogArrays(facts)
+        self.assertEqual(catalog.purposes.shape[1], 3)
+        for wanted in ("purpose 0", "Purpose 95", "Purpose 179", "Purpose 500"):
+            user_prefs = [{"category": "purpose", "value": [wanted]}]
+            analysis = {"recommended_shapes": [], "recommended_size": "N/A", "recommended_tone": "N/A"}
+            expected = self.experta_scores(facts, analysis, user_prefs)
+            scores, _ = catalog.score(analysis, user_prefs)
+            self.assertEqual(dict(zip(catalog.ids.tolist(), scores.tolist())),
+                             {k: v[0] for k, v in expected.items()}, msg=wanted)
+
+    def test_empty_catalog(self):
+        scores, matched = CatalogArrays([]).score({"recommended_shapes": ["Oval"]}, [])
+        self.assertEqual((scores.shape, matched.shape), ((0,), (0, 7)))
+
+
+class RankingTests(SimpleTestCase):
+    """top-k بـ argpartition يعطي نفس ترتيب الترتيب الكامل (النقاط تنازليًا ثم id) لكل شريحة."""
+
+    def test_slices_match_full_sort(self):
+        rng = np.random.default_rng(5)
+        for n in (0, 1, 7, 500):
+            scores = rng.choice([0, 10, 25, 45, 70], size=n)
+            ids = rng.permutation(n * 3)[:n] + 1
+            ranking = Ranking(ids, scores, None, 70)
+            order = np.lexsort((ids, -scores))
+            expected = order[scores[order] > 0]
+            snapshot = ranking.snapshot()
+            self.assertEqual(len(ranking), len(expected))
+            for start, stop in ((0, 1), (0, 10), (3, 17), (0, n), (n - 5, n + 5), (n + 1, n + 9)):
+                start = max(start, 0)
+                self.assertEqual(ranking.rows(start, stop).tolist(), expected[start:stop].tolist(), msg=(n, start, stop))
+                self.assertEqual(snapshot.ids[snapshot.rows(start, stop)].tolist(), ids[expected[start:stop]].tolist())
+            for position in range(len(expected)):
+                self.assertEqual(ranking.seek(*ranking.key_at(position)), position + 1)
+
+
+def catalog_rows(catalog):
+    """الأعمدة مفكوكة لكل نظارة (للمقارنة بغض النظر عن رموز الفئات وترتيب البتات)."""
+    bits = {bit: name for name, bit in catalog.purpose_bits.items()}
+    rows = {}
+    for row, frame_id in enumerate(catalog.ids.tolist()):
+        values = [catalog.columns[name][0][catalog.columns[name][2][row]] for name in CATEGORICAL]
+        values += [None if np.isnan(v) else round(v, 6) for v in (float(catalog.numeric[name][row]) for name in NUMERIC)]
+        tags = {bits[b] for b in bits if int(catalog.purposes[row, b // 64]) >> (b % 64) & 1}
+        rows[frame_id] = (*values, int(catalog.weight[row]), frozenset(tags))
+    return rows
+
+
+class CatalogIndexTests(TestCase):
+    """التحديث التدريجي من الإشارات يعطي نفس الفهرس الذي يعطيه البناء الكامل."""
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+        self.reading, self.sports = Purpose.objects.create(name="Reading"), Purpose.objects.create(name="Sports")
+        self.first = self.create(shape="Oval", weight=15)
+        self.create(shape="Round", weight=None)
+        catalog_index.catalog()
+
+    @staticmethod
+    def create(**fields):
+        values = dict(shape="Oval", material="Metal", size="Medium", gender="Unisex", tone="Dark", color="Black")
+        return Glasses.objects.create(**{**values, **fields})
+
+    def assertIndexMatchesDatabase(self):
+        self.assertEqual(catalog_rows(catalog_index.catalog()), catalog_rows(CatalogArrays(load_facts())))
+
+    def test_signals_update_index_incrementally(self):
+        steps = [
+            lambda: self.create(shape="Aviator", color="Gold", price=120),
+            lambda: self.first.purposes.set([self.reading, self.sports]),
+            lambda: GlassesPurpose.objects.create(glasses=self.create(material="Titanium"), purpose=self.sports),
+            lambda: Glasses.objects.filter(pk=self.first.pk).get().save(),
+            lambda: self.first.purposes.remove(self.sports),
+            lambda: self.sports.glasses.add(self.first),
+            lambda: self.first.delete(),
+        ]
+        for step in steps:
+            version = catalog_index.version
+            with self.captureOnCommitCallbacks(execute=True):
+                step()
+            self.assertGreater(catalog_index.version, version)
+            self.assertIndexMatchesDatabase()
+
+    def test_rolled_back_changes_do_not_reach_index(self):
+        before = catalog_rows(catalog_index.catalog())
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.create(shape="Aviator")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(catalog_rows(catalog_index.catalog()), before)
+
+    def test_purpose_rename_rebuilds(self):
+        self.first.purposes.add(self.reading)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reading.name = "Office"
+            self.reading.save()
+        self.assertIndexMatchesDatabase()
+        self.assertIn("Office", catalog_index.catalog().purpose_bits)
+
+
+class SmartRecommendQueryCountTests(TestCase):
+    """تحميل الكتالوج وقراءة النتائج بعدد ثابت من الاستعلامات مهما كبر الكتالوج."""
+
+    LARGE = 10_000
+    REQUEST = {
+        "shapes": ["Oval", "Round"], "size": "Medium", "tone": "Dark",
+        "gender": "Male", "purposes": ["Reading"], "materials": ["Metal"], "weight_preference": True,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("customer@example.com", "pw", name="C", role="customer")
+        cls.purposes = [Purpose.objects.create(name=name) for name in ("Reading", "Sports")]
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_glasses(self, n):
+        # bulk_create لا يرسل إشارات: الفهرس يُبطل يدويًا
+        rng = random.Random(n)
+        glasses = Glasses.objects.bulk_create([
+            Glasses(shape=rng.choice(Glasses.Shape.values), material=rng.choice(Glasses.Material.values),
+                    size=rng.choice(Glasses.Size.values), gender=rng.choice(Glasses.Gender.values),
+                    tone=rng.choice(Glasses.Tone.values), color="Black", weight=rng.choice([None, 12, 30]))
+            for _ in range(n)
+        ])
+        ids = Glasses.objects.order_by("-id").values_list("id", flat=True)[:n]
+        GlassesPurpose.objects.bulk_create([
+            GlassesPurpose(glasses_id=gid, purpose=self.purposes[gid % 2]) for gid in ids
+        ])
+        Favorite.objects.bulk_create([Favorite(user=self.user, glasses_id=gid) for gid in ids[:20]])
+        catalog_index.invalidate()
+        return glasses
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/glasses/smart-recommend/", self.REQUEST, format="json")
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return len(queries), response.json()
+
+    def test_constant_queries_at_10k_rows(self):
+        self.add_glasses(50)
+        small, _ = self.count_queries()
+        self.add_glasses(self.LARGE - 50)
+        large, data = self.count_queries()
+        # بناء الفهرس (2) + النظارات + prefetch الأغراض والصور + المفضلة
+        self.assertEqual(large, small)
+        self.assertLessEqual(large, 6)
+        self.assertGreater(data["count"], 100)
+        favorites = set(Favorite.objects.filter(user=self.user).values_list("glasses_id", flat=True))
+        returned = {item["id"] for item in data["results"]}
+        self.assertEqual({item["id"] for item in data["results"] if item["favorite"]}, favorites & returned)
+
+        # الفهرس جاهز: لا استعلامات لتحميل الكتالوج
+        warm, _ = self.count_queries()
+        self.assertEqual(warm, large - 2)
+
+    @override_settings(GLASSES_RECOMMENDER={"CATALOG_INDEX": False})
+    def test_constant_queries_without_index(self):
+        self.add_glasses(50)
+        small, _ = self.count_queries()
+        self.add_glasses(self.LARGE - 50)
+        large, _ = self.count_queries()
+        self.assertEqual(large, small)
+
+
+def create_catalog(n, seed=1):
+    reading = Purpose.objects.create(name="Reading")
+    rng = random.Random(seed)
+    for _ in range(n):
+        g = Glasses.objects.create(
+            shape=rng.choice(Glasses.Shape.values), material=rng.choice(Glasses.Material.values),
+            size=rng.choice(Glasses.Size.values), gender=rng.choice(Glasses.Gender.values),
+            tone=rng.choice(Glasses.Tone.values), color="Black", weight=rng.choice([None, 12, 30]),
+        )
+        if rng.random() < 0.5:
+            GlassesPurpose.objects.create(glasses=g, purpose=reading)
+
+
+class RecommendationCursorTests(TestCase):
+    """ترقيم بمؤشر: كل الصفحات = الترتيب الكامل (النقاط ثم id)، والصفحات التالية من اللقطة."""
+
+    REQUEST = SmartRecommendQueryCountTests.REQUEST
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("customer@example.com", "pw", name="C", role="customer")
+        create_catalog(300)
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected_order(self):
+        catalog = CatalogArrays(load_facts())
+        scores, _ = catalog.score(
+            {"recommended_shapes": self.REQUEST["shapes"], "recommended_size": self.REQUEST["size"],
+             "recommended_tone": self.REQUEST["tone"]},
+            [{"category": "gender", "value": "Male"}, {"category": "purpose", "value": ["Reading"]},
+             {"category": "weight_pref", "value": "lightweight"}, {"category": "material_pref", "value": "Metal"}],
+        )
+        order = np.lexsort((catalog.ids, -scores))
+        return [(int(scores[i]), int(catalog.ids[i])) for i in order if scores[i] > 0]
+
+    def post(self, url):
+        response = self.client.post(url, self.REQUEST, format="json")
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json()
+
+    def walk(self, url):
+        pages = []
+        while url:
+            data = self.post(url)
+            pages.append(data)
+            url = data["next"]
+        return pages
+
+    def test_pages_cover_ranking_in_order(self):
+        expected = self.expected_order()
+        pages = self.walk("/api/glasses/smart-recommend/?page_size=40")
+        self.assertGreater(len(pages), 2)
+        self.assertEqual(
+            [(item["score"], item["id"]) for page in pages for item in page["results"]], expected
+        )
+        self.assertTrue(all(page["count"] == len(expected) for page in pages))
+        self.assertIsNone(pages[0]["previous"])
+        self.assertEqual(self.post(pages[2]["previous"])["results"], pages[1]["results"])
+
+    def test_later_pages_come_from_snapshot(self):
+        first = self.post("/api/glasses/smart-recommend/?page_size=40")
+        expected = self.post(first["next"])["results"]
+
+        # تغيير في الكتالوج لا يغيّر صفحات تصفح بدأ قبله
+        with self.captureOnCommitCallbacks(execute=True):
+            Glasses.objects.filter(id__in=[item["id"] for item in first["results"]]).update(weight=99)
+            catalog_index.invalidate()
+        self.assertEqual(self.post(first["next"])["results"], expected)
+
+    def test_expired_snapshot_resumes_after_last_item(self):
+        expected = self.expected_order()
+        first = self.post("/api/glasses/smart-recommend/?page_size=40")
+        caches["default"].clear()
+        rest = self.walk(first["next"])
+        self.assertEqual(
+            [(item["score"], item["id"]) for page in [first] + rest for item in page["results"]], expected
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in ("nope", "e30=", "W10="):
+            response = self.client.post(f"/api/glasses/smart-recommend/?cursor={cursor}", self.REQUEST, format="json")
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_face_shape_paginated_by_id(self):
+        pages = []
+        url = "/api/glasses/recommend/face-shape/?page_size=25"
+        while url:
+            response = self.client.post(url, {"face_shape": "Round"}, format="json")
+            self.assertEqual(response.status_code, 200, response.content[:500])
+            pages.append(response.json())
+            url = pages[-1]["next"]
+        shapes = pages[0]["recommended_shapes"]
+        expected = list(Glasses.objects.filter(shape__in=shapes).order_by("id").values_list("id", flat=True))
+        self.assertEqual([item["id"] for page in pages for item in page["results"]], expected)
+        self.assertEqual(pages[0]["count"], len(expected))
+
+
+class SmartFilterTests(TestCase):
+    """smart-filter: مقارنة الفئات بدون حالة الأحرف (كما في MySQL) وصفحات بمؤشر بدل كل الكتالوج."""
+
+    URL = "/api/glasses/filter/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("filter@example.com", "pw", name="F", role="customer")
+        create_catalog(300, seed=3)
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected(self, **wanted):
+        return [
+            g.id for g in Glasses.objects.order_by("id")
+            if all(getattr(g, field).lower() in {v.lower() for v in values} for field, values in wanted.items())
+        ]
+
+    def walk(self, url, data=None):
+        pages = []
+        while url:
+            response = self.client.post(url, data, format="json") if data is not None else self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content[:500])
+            pages.append(response.json())
+            url, data = pages[-1]["next"], None
+        return pages
+
+    def test_mixed_case_matches_like_mysql(self):
+        expected = self.expected(shape=["Round", "Oval"], size=["Medium"], gender=["Male", "Unisex"])
+        self.assertGreater(len(expected), 0)
+        for shapes, size in ((["Round", "Oval"], "Medium"), (["round", "OVAL"], "medium")):
+            with self.subTest(shapes=shapes):
+                pages = self.walk(self.URL, {"shapes": shapes, "size": size, "gender": "Male"})
+                self.assertEqual([item["id"] for page in pages for item in page["results"]], expected)
+        colors = self.walk(self.URL, {"colors": ["black"]})
+        self.assertEqual(colors[0]["count"], Glasses.objects.count())
+
+    def test_pages_hydrate_only_the_page(self):
+        expected = list(Glasses.objects.order_by("id").values_list("id", flat=True))
+        first = self.client.post(self.URL + "?page_size=40", {}, format="json")
+        self.assertEqual(first.status_code, 200)
+        first = first.json()
+        self.assertEqual(first["count"], len(expected))
+        self.assertEqual(len(first["results"]), 40)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first["next"])
+        in_lists = [re.search(r'"glasses_glasses"."id" IN \(([^)]*)\)', q["sql"]) for q in queries]
+        sizes = [len(m.group(1).split(",")) for m in in_lists if m]
+        self.assertEqual(sizes, [40])
+
+        pages = [first] + self.walk(first["next"])
+        self.assertEqual([item["id"] for page in pages for item in page["results"]], expected)
+
+    def test_expired_snapshot_refilters_from_link(self):
+        expected = self.expected(shape=["Round"], tone=["Dark"])
+        first = self.client.post(self.URL + "?page_size=3", {"shapes": ["ROUND"], "tone": "dark"}, format="json").json()
+        self.assertGreater(first["count"], 6)
+        caches["default"].clear()
+        pages = [first] + self.walk(first["next"])
+        self.assertEqual([item["id"] for page in pages for item in page["results"]], expected)
+
+
+class ResultCacheTests(TestCase):
+    """نتائج smart-recommend من كاش مشترك بحسب التفضيلات الموحدة ونسخة الكتالوج."""
+
+    REQUEST = SmartRecommendQueryCountTests.REQUEST
+    EQUIVALENT = {
+        "shapes": ["Round", "Oval", "Round"], "size": "Medium", "tone": "Dark",
+        "gender": "male", "purposes": ["READING"], "materials": ["metal"], "weight_preference": "yes",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user("alice@example.com", "pw", name="A", role="customer")
+        cls.bob = CustomUser.objects.create_user("bob@example.com", "pw", name="B", role="customer")
+        create_catalog(200, seed=2)
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+
+    def post(self, user, data):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post("/api/glasses/smart-recommend/", data, format="json")
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return len(queries), response.json()
+
+    def test_preferences_key_is_canonical(self):
+        analysis = {"recommended_shapes": ["Oval", "Round"], "recommended_size": "Medium", "recommended_tone": "Dark"}
+        prefs = [{"category": "gender", "value": "Male"}, {"category": "purpose", "value": ["Reading", "Sports"]},
+                 {"category": "material_pref", "value": "Metal"}]
+        same = [{"category": "material_pref", "value": "metal"}, {"category": "purpose", "value": ["sports", "READING"]},
+                {"category": "gender", "value": "male"}]
+        key = preferences_key(analysis, prefs)
+        self.assertEqual(key, preferences_key(dict(analysis, recommended_shapes=["Round", "Oval"]), same))
+        self.assertNotEqual(key, preferences_key(analysis, prefs + [{"category": "material_pref", "value": "Steel"}]))
+        self.assertNotEqual(key, preferences_key(dict(analysis, recommended_size="Large"), prefs))
+
+    @override_settings(GLASSES_RECOMMENDER={"CATALOG_INDEX": False})
+    def test_equivalent_request_hits_cache_with_own_favorites(self):
+        ids = list(Glasses.objects.values_list("id", flat=True))
+        Favorite.objects.bulk_create([Favorite(user=self.bob, glasses_id=gid) for gid in ids[::3]])
+
+        miss, first = self.post(self.alice, self.REQUEST)
+        hit, second = self.post(self.bob, self.EQUIVALENT)
+        # بدون فهرس: الإصابة لا تقرأ الكتالوج (استعلامان أقل)
+        self.assertEqual(hit, miss - 2)
+        strip = lambda data: [{k: v for k, v in item.items() if k != "favorite"} for item in data["results"]]
+        self.assertEqual(strip(second), strip(first))
+        self.assertFalse(any(item["favorite"] for item in first["results"]))
+        favorites = set(ids[::3])
+        self.assertEqual([item["favorite"] for item in second["results"]],
+                         [item["id"] in favorites for item in second["results"]])
+
+    def test_catalog_change_bumps_version(self):
+        _, before = self.post(self.alice, self.REQUEST)
+        last = Glasses.objects.get(id=before["results"][-1]["id"])
+        with self.captureOnCommitCallbacks(execute=True):
+            last.shape, last.size, last.tone, last.gender = "Oval", "Medium", "Dark", "Male"
+            last.material, last.weight = "Metal", 12
+            last.save()
+            GlassesPurpose.objects.get_or_create(glasses=last, purpose=Purpose.objects.get(name="Reading"))
+        _, after = self.post(self.alice, self.REQUEST)
+        self.assertEqual(after["results"][0]["score"], after["max_possible_score"])
+        self.assertIn(last.id, [item["id"] for item in after["results"] if item["score"] == after["max_possible_score"]])
+
+
+class RecommendationBucketTests(TestCase):
+    """كل صف في RecommendationBucket = score_catalog بدون تفضيلات، ويبقى كذلك بعد التحديث التدريجي."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog(300, seed=3)
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+
+    def assertTableMatchesCatalog(self):
+        expected = compute_buckets(CatalogArrays(load_facts()))
+        rows = RecommendationBucket.objects.all()
+        self.assertEqual(len(rows), len(expected))
+        for bucket in rows:
+            ids, rules = expected[(bucket.face_shape, bucket.size, bucket.tone)]
+            self.assertEqual(bytes(bucket.glasses_ids), ids.tobytes(), str(bucket))
+            self.assertEqual(bytes(bucket.rules), rules.tobytes(), str(bucket))
+
+    def test_buckets_match_scoring(self):
+        self.assertFalse(RecommendationBucket.objects.exists())
+        for face_shape, size, tone in itertools.product(("Round", "Heart", "Unknown"), ("Small", None), ("Light", None)):
+            recommended = {"Round": ["Square", "Rectangle", "Cat-Eye", "Wayfarer", "Clubmaster"],
+                           "Heart": ["Oval", "Round", "Cat-Eye", "Browline", "Rimless"]}.get(face_shape, [])
+            expected = score_catalog(
+                {"recommended_shapes": recommended, "recommended_size": size or "N/A", "recommended_tone": tone or "N/A"}, []
+            )
+            ranking = bucket_ranking(face_shape, size, tone)
+            self.assertEqual(len(ranking), len(expected))
+            rows, expected_rows = ranking.rows(0, len(ranking)), expected.rows(0, len(expected))
+            self.assertEqual(ranking.ids[rows].tolist(), expected.ids[expected_rows].tolist())
+            self.assertEqual(ranking.scores[rows].tolist(), expected.scores[expected_rows].tolist())
+            self.assertTrue((ranking.matched[rows] == expected.matched[expected_rows]).all())
+            self.assertEqual(ranking.max_score, expected.max_score)
+        # أول قراءة بنت الجدول كله
+        self.assertEqual(RecommendationBucket.objects.count(), 8 * 5 * 4)
+
+    def test_incremental_refresh(self):
+        rebuild_buckets()
+        glasses = list(Glasses.objects.order_by("id")[:3])
+        with self.captureOnCommitCallbacks(execute=True):
+            glasses[0].shape, glasses[0].size, glasses[0].tone = "Oval", "Large", "Dark"
+            glasses[0].save()
+            glasses[1].delete()
+            Glasses.objects.create(shape="Round", material="Metal", size="Small", gender="Male",
+                                   tone="Light", color="Black")
+        self.assertTableMatchesCatalog()
+
+        # لا تغيير في الشكل/المقاس/النبرة: لا يُكتب أي صف
+        stamp = RecommendationBucket.objects.order_by("-updated_at").values_list("updated_at", flat=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            glasses[2].price = 99
+            glasses[2].save()
+        self.assertFalse(RecommendationBucket.objects.filter(updated_at__gt=stamp).exists())
+        self.assertTableMatchesCatalog()
+
+    def test_refresh_locks_only_affected_buckets(self):
+        rebuild_buckets()
+        shapes = bucket_shapes()
+        rng = random.Random(7)
+        for glasses in Glasses.objects.order_by("id")[:12]:
+            before = compute_buckets(CatalogArrays(load_facts()))
+            old = {"shape": glasses.shape, "size": glasses.size, "tone": glasses.tone}
+            field = rng.choice(("shape", "size", "tone"))
+            choices = {"shape": Glasses.Shape.values, "size": Glasses.Size.values, "tone": Glasses.Tone.values}[field]
+            setattr(glasses, field, rng.choice([v for v in choices if v != old[field]]))
+            with self.captureOnCommitCallbacks(execute=True):
+                glasses.save()
+            after = compute_buckets(CatalogArrays(load_facts()))
+            changed = {key for key in before if before[key][0].tobytes() != after[key][0].tobytes()
+                       or before[key][1].tobytes() != after[key][1].tobytes()}
+            new = {"shape": glasses.shape, "size": glasses.size, "tone": glasses.tone}
+            affected = affected_buckets(old, new, shapes)
+            self.assertLessEqual(changed, affected, (old, new))
+            self.assertLess(len(affected), RecommendationBucket.objects.count())
+            if field == "size":
+                # كل الأشكال والنبرات، للمقاسين القديم والجديد فقط
+                self.assertEqual(affected, {(f, z, t) for f, z, t in before if z in (old["size"], new["size"])})
+            self.assertTableMatchesCatalog()
+
+        # حذف وإضافة: الصفوف التي كانت/صارت فيها النظارة فقط
+        glasses = Glasses.objects.order_by("id").first()
+        row = {"shape": glasses.shape, "size": glasses.size, "tone": glasses.tone}
+        self.assertEqual(affected_buckets(row, None, shapes), affected_buckets(None, row, shapes))
+        with self.captureOnCommitCallbacks(execute=True):
+            glasses.delete()
+        self.assertTableMatchesCatalog()
+
+        # تغيير لا يمس الشكل/المقاس/النبرة: لا قراءة ولا قفل للجدول
+        glasses = Glasses.objects.order_by("id").first()
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                glasses.price = 42
+                glasses.save()
+        self.assertFalse([q for q in queries if RecommendationBucket._meta.db_table in q["sql"]])
+
+
+class HardConstraintTests(TestCase):
+    """القيود الصارمة = ترتيب بدون قيود مع حذف ما لا يحققها، بالفهرس وبالاستعلام."""
+
+    REQUEST = {"shapes": ["Oval", "Round"], "size": "Medium", "tone": "Dark",
+               "gender": "Male", "materials": ["steel", "Metal"], "weight_preference": True}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("customer@example.com", "pw", name="C", role="customer")
+        owners = [CustomUser.objects.create_user(f"owner{i}@example.com", "pw", name="O", role="store_owner")
+                  for i in range(2)]
+        cls.stores = [Store.objects.create(owner=o, store_name=f"Store {i}", phone=f"09{i:08d}")
+                      for i, o in enumerate(owners)]
+        create_catalog(300, seed=4)
+        rng = random.Random(4)
+        for g in Glasses.objects.all():
+            g.weight = rng.choice([None, 0, 12, 18.4, 18.5, 18.6, 30])
+            g.store = rng.choice(cls.stores + [None])
+            g.save()
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, **extra):
+        response = self.client.post("/api/glasses/smart-recommend/?page_size=100",
+                                    {**self.REQUEST, **extra}, format="json")
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        # الصفحة الأولى (فيها explain) + ids كل الصفحات
+        first = data = response.json()
+        results = [item["id"] for item in data["results"]]
+        while data["next"]:
+            data = self.client.post(data["next"], {**self.REQUEST, **extra}, format="json").json()
+            results += [item["id"] for item in data["results"]]
+        return first, results
+
+    def expected(self, unconstrained, predicate):
+        glasses = Glasses.objects.in_bulk(unconstrained)
+        return [i for i in unconstrained if predicate(glasses[i])]
+
+    def test_constraints_prune_before_scoring(self):
+        stores = [self.stores[0].id]
+        predicates = {
+            "gender": lambda g: g.gender in ("Male", "Unisex"),
+            "lightweight": lambda g: bool(g.weight) and round(g.weight) <= 18,
+            "material": lambda g: "steel" in g.material.lower() or "metal" in g.material.lower(),
+            "store": lambda g: g.store_id in stores,
+        }
+        _, unconstrained = self.post()
+        for index in (True, False):
+            with self.subTest(index=index), override_settings(GLASSES_RECOMMENDER={"CATALOG_INDEX": index}):
+                for modes in (["gender"], ["lightweight"], ["material"], ["store"],
+                              ["store", "material", "lightweight", "gender"]):
+                    data, results = self.post(hard_constraints=modes, store_ids=stores, explain=True)
+                    expected = self.expected(unconstrained, lambda g: all(predicates[m](g) for m in modes))
+                    self.assertTrue(expected, modes)
+                    self.assertEqual(results, expected, modes)
+                    stages = data["explain"]
+                    self.assertEqual([s["stage"] for s in stages],
+                                     ["catalog"] + [m for m in ("gender", "lightweight", "material", "store") if m in modes]
+                                     + ["scoring"])
+                    self.assertEqual(stages[0]["remaining"], Glasses.objects.count())
+                    for before, after in zip(stages, stages[1:]):
+                        self.assertEqual(before["remaining"] - after["pruned"], after["remaining"])
+                    self.assertEqual(stages[-1]["remaining"], data["count"])
+
+    def test_sql_prefilter_loads_only_survivors(self):
+        with override_settings(GLASSES_RECOMMENDER={"CATALOG_INDEX": False, "RESULT_CACHE_ALIAS": None}):
+            with CaptureQueriesContext(connection) as queries:
+                self.post(hard_constraints=["store"], store_ids=[self.stores[1].id])
+        load = [q["sql"] for q in queries if '"glasses_glasses"."weight"' in q["sql"] and "store_id" in q["sql"]]
+        self.assertTrue(load and all("IN" in sql for sql in load), load)
+
+    def test_invalid_constraints(self):
+        for extra in ({"hard_constraints": ["price"]},
+                      {"hard_constraints": ["gender"], "gender": ""},
+                      {"hard_constraints": ["store"]},
+                      {"hard_constraints": ["store"], "store_ids": ["x"]},
+                      {"hard_constraints": ["material"], "materials": []}):
+            response = self.client.post("/api/glasses/smart-recommend/", {**self.REQUEST, **extra}, format="json")
+            self.assertEqual(response.status_code, 400, extra)
+
+
+def synthetic_landmarks(seed):
+    """ملامح (478, 3) معيارية كما يرسلها العميل (القزحيتان بقطر غير صفري)."""
+    rng = np.random.default_rng(seed)
+    landmarks = rng.uniform(0.3, 0.7, size=(478, 3))
+    landmarks[:, 2] = 0.0
+    return landmarks
+
+
+@override_settings(FACE_ANALYSIS={"CACHE_ALIAS": None})
+class AnalysisIdTests(TestCase):
+    """analysis_id من analyze-face يعطي في smart-recommend نفس ترتيب shapes/size/tone الصريحة."""
+
+    ANALYZE = "/api/face/analyze-face/"
+    SMART = "/api/glasses/smart-recommend/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user("alice@example.com", "pw", name="A", role="customer")
+        cls.bob = CustomUser.objects.create_user("bob@example.com", "pw", name="B", role="customer")
+        create_catalog(200, seed=5)
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def analyze(self, client, seed=1):
+        data = {"landmarks": synthetic_landmarks(seed).tolist(), "image_width": 640, "image_height": 480}
+        response = client.post(self.ANALYZE, data, format="json")
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json()
+
+    def analyze_image(self, client, seed=1):
+        ok, png = cv2.imencode(".png", np.full((480, 640, 3), 128, np.uint8))
+        upload = SimpleUploadedFile("face.png", png.tobytes(), "image/png")
+        with mock.patch("face.pipeline.detect_landmarks", return_value=synthetic_landmarks(seed)):
+            response = client.post(self.ANALYZE, {"image": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json()
+
+    def test_authenticated_analysis_is_saved(self):
+        client = self.client_for(self.alice)
+        for payload, source in ((self.analyze(client), FaceAnalysis.Source.LANDMARKS),
+                                (self.analyze_image(client, seed=2), FaceAnalysis.Source.IMAGE)):
+            record = FaceAnalysis.objects.get(pk=payload["analysis_id"])
+            self.assertEqual((record.user, record.source), (self.alice, source))
+            self.assertEqual((record.face_shape, record.skin_tone), (payload["face_shape"], payload["skin_tone"]))
+            self.assertEqual(record.recommended_shape, payload["recommended_shape"])
+            # القياسات محفوظة كلها: التصنيف من الصف وحده يعيد نفس الشكل
+            measurements = [getattr(record, k) for k in MEASUREMENT_KEYS]
+            self.assertEqual(measurements, [payload[k] for k in MEASUREMENT_KEYS])
+            face_shapes, _ = classifier.classify(shape_features(*measurements))
+            self.assertEqual(face_shapes[0], payload["face_shape"])
+
+            self.assertEqual(find_saved_analysis(FaceAnalysis.from_payload(self.alice, payload, source)), record)
+            other = FaceAnalysis.from_payload(self.alice, {**payload, "jaw_width_cm": payload["jaw_width_cm"] + 0.5}, source)
+            self.assertIsNone(find_saved_analysis(other))
+
+    def test_same_ranking_as_explicit_input(self):
+        client = self.client_for(self.alice)
+        payload = self.analyze(client)
+        prefs = {"gender": "Male", "purposes": ["Reading"], "weight_preference": True}
+        explicit = {
+            "shapes": payload["recommended_shape"],
+            "size": payload["recommended_size"] or "N/A",
+            "tone": payload["recommended_tone"] or "N/A",
+        }
+        for extra in ({}, prefs):
+            by_id = client.post(self.SMART, {"analysis_id": payload["analysis_id"], **extra}, format="json")
+            by_input = client.post(self.SMART, {**explicit, **extra}, format="json")
+            self.assertEqual(by_id.status_code, 200, by_id.content[:500])
+            self.assertEqual(by_input.status_code, 200, by_input.content[:500])
+            by_id, by_input = by_id.json(), by_input.json()
+            self.assertGreater(by_id["count"], 0)
+            self.assertEqual(by_id["count"], by_input["count"])
+            self.assertEqual(by_id["max_possible_score"], by_input["max_possible_score"])
+            self.assertEqual(
+                [(item["id"], item["score"]) for item in by_id["results"]],
+                [(item["id"], item["score"]) for item in by_input["results"]],
+            )
+
+    def test_other_users_or_unknown_id(self):
+        payload = self.analyze(self.client_for(self.alice))
+        bob = self.client_for(self.bob)
+        for analysis_id in (payload["analysis_id"], payload["analysis_id"] + 1000):
+            response = bob.post(self.SMART, {"analysis_id": analysis_id}, format="json")
+            self.assertEqual(response.status_code, 404, analysis_id)
+        response = bob.post(self.SMART, {"analysis_id": "abc"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("analysis_id", response.json())
+
+    def test_anonymous_persists_nothing(self):
+        client = self.client_for()
+        self.assertNotIn("analysis_id", self.analyze(client))
+        self.assertNotIn("analysis_id", self.analyze_image(client))
+        self.assertFalse(FaceAnalysis.objects.exists())
+
+
+class AnalyzeAndRecommendTests(TestCase):
+    """analyze-and-recommend: الصفحة الأولى + analysis_id ومؤشر، والصفحات التالية بـ GET أو من smart-recommend."""
+
+    URL = "/api/glasses/analyze-and-recommend/"
+    PREFS = {"gender": "Male", "purposes": ["Reading", "Sports"], "materials": ["Metal"], "weight_preference": True}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("customer@example.com", "pw", name="C", role="customer")
+        cls.other = CustomUser.objects.create_user("other@example.com", "pw", name="O", role="customer")
+        create_catalog(300, seed=6)
+
+    def setUp(self):
+        catalog_index.invalidate()
+        self.addCleanup(catalog_index.invalidate)
+        caches["default"].clear()
+        caches["face-analysis"].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, seed=1):
+        ok, png = cv2.imencode(".png", np.full((480, 640, 3), 100 + seed, np.uint8))
+        return SimpleUploadedFile("face.png", png.tobytes(), "image/png")
+
+    def post(self, data=None, seed=1, query="?page_size=40", detect=None):
+        detect = detect or {"return_value": synthetic_landmarks(seed)}
+        with mock.patch("face.pipeline.detect_landmarks", **detect) as detect_landmarks:
+            response = self.client.post(self.URL + query, {"image": self.upload(seed), **(data or {})}, format="multipart")
+        self.detect_calls = detect_landmarks.call_count
+        return response
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json()
+
+    def walk(self, first):
+        pages = [first]
+        while pages[-1]["next"]:
+            pages.append(self.get(pages[-1]["next"]))
+        return pages
+
+    @staticmethod
+    def expected_order(payload, prefs):
+        ranking = score_catalog(analysis_from_payload(payload), user_preferences(prefs))
+        rows = ranking.rows(0, len(ranking))
+        return list(zip(ranking.scores[rows].astype(int).tolist(), ranking.ids[rows].tolist()))
+
+    def test_payload_and_results(self):
+        for prefs in ({}, self.PREFS):
+            with self.subTest(prefs=bool(prefs)):
+                response = self.post(prefs)
+                self.assertEqual(response.status_code, 200, response.content[:500])
+                data = response.json()
+                analysis = data["analysis"]
+                self.assertEqual(data["analysis_id"], analysis["analysis_id"])
+                self.assertTrue(FaceAnalysis.objects.filter(pk=data["analysis_id"], user=self.user).exists())
+                self.assertIn("face_shape", analysis)
+                expected = self.expected_order(analysis, prefs)
+                self.assertEqual(data["count"], len(expected))
+                self.assertEqual([(item["score"], item["id"]) for item in data["results"]], expected[:40])
+                self.assertIsNotNone(data["cursor"])
+                self.assertIsNone(data["previous"])
+                query = parse_qs(urlsplit(data["next"]).query)
+                self.assertEqual(query["analysis_id"], [str(data["analysis_id"])])
+                self.assertEqual(query["cursor"], [data["cursor"]])
+                self.assertEqual(query.get("purposes"), prefs.get("purposes"))
+
+    def test_get_pages_cover_ranking(self):
+        for prefs in ({}, self.PREFS):
+            with self.subTest(prefs=bool(prefs)):
+                first = self.post(prefs).json()
+                pages = self.walk(first)
+                self.assertGreater(len(pages), 2)
+                self.assertEqual(
+                    [(item["score"], item["id"]) for page in pages for item in page["results"]],
+                    self.expected_order(first["analysis"], prefs),
+                )
+                self.assertTrue(all(page["analysis_id"] == first["analysis_id"] for page in pages))
+                self.assertEqual(self.get(pages[2]["previous"])["results"], pages[1]["results"])
+                self.assertIsNone(pages[-1]["cursor"])
+
+    def test_expired_snapshot_resumes_from_saved_analysis(self):
+        for prefs in ({}, self.PREFS):
+            with self.subTest(prefs=bool(prefs)):
+                first = self.post(prefs).json()
+                caches["default"].clear()
+                pages = self.walk(first)
+                self.assertEqual(
+                    [(item["score"], item["id"]) for page in pages for item in page["results"]],
+                    self.expected_order(first["analysis"], prefs),
+                )
+
+    def test_cursor_only_get(self):
+        first = self.post().json()
+        second = self.get(first["next"])
+        self.assertEqual(self.get(f"{self.URL}?page_size=40&cursor={first['cursor']}")["results"], second["results"])
+        # بعد انتهاء اللقطة يلزم analysis_id لإعادة التقييم
+        caches["default"].clear()
+        response = self.client.get(f"{self.URL}?page_size=40&cursor={first['cursor']}")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("analysis_id", response.json())
+
+    def test_cursor_continues_in_smart_recommend(self):
+        first = self.post().json()
+        second = self.get(first["next"])
+        response = self.client.post(
+            f"/api/glasses/smart-recommend/?page_size=40&cursor={first['cursor']}",
+            {"analysis_id": first["analysis_id"]}, format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        self.assertEqual(response.json()["results"], second["results"])
+
+    def test_repost_does_not_duplicate_analysis(self):
+        first = self.post()
+        self.assertEqual((first["X-Face-Cache"], self.detect_calls), ("MISS", 1))
+        again = self.post()
+        self.assertEqual((again["X-Face-Cache"], self.detect_calls), ("HIT", 0))
+        self.assertEqual(again.json()["analysis_id"], first.json()["analysis_id"])
+        self.assertEqual(again.json()["results"], first.json()["results"])
+        self.assertEqual(FaceAnalysis.objects.count(), 1)
+        # نفس الصورة من مستخدم آخر: صف خاص به
+        self.client.force_authenticate(self.other)
+        other = self.post().json()
+        self.assertNotEqual(other["analysis_id"], first.json()["analysis_id"])
+        self.assertEqual(FaceAnalysis.objects.filter(user=self.other).count(), 1)
+
+    def test_errors(self):
+        response = self.client.post(self.URL, {}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post(detect={"side_effect": FaceAnalysisError("No face detected", "no_face")})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["code"], "no_face")
+        bad = self.client.post(self.URL, {"image": SimpleUploadedFile("x.png", b"nope", "image/png")}, format="multipart")
+        self.assertEqual((bad.status_code, bad.json()["code"]), (400, "invalid_image"))
+        self.assertFalse(FaceAnalysis.objects.exists())
+
+        first = self.post().json()
+        self.assertEqual(self.client.get(self.URL).status_code, 400)
+        self.assertEqual(self.client.get(f"{self.URL}?cursor=nope&analysis_id={first['analysis_id']}").status_code, 404)
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(first["next"]).status_code, 404)
+        anonymous = APIClient()
+        self.assertIn(anonymous.get(first["next"]).status_code, (401, 403))
+
+    def test_timings(self):
+        with override_settings(FACE_ANALYSIS={"SERVER_TIMING": True}):
+            post = self.post(self.PREFS)
+            get = self.client.get(post.json()["next"])
+        stages = lambda response: {part.split(";")[0] for part in response["Server-Timing"].split(", ")}
+        # facemesh داخل detect_landmarks (مستبدلة هنا)
+        self.assertLessEqual({"decode", "skin_tone", "geometry", "scoring", "serialize", "total"}, stages(post))
+        self.assertLessEqual({"snapshot", "serialize", "total"}, stages(get))
+        self.assertNotIn("decode", stages(get))
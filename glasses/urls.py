@@ -24,4 +24,5 @@ urlpatterns = [
     path("<int:glasses_id>/update/", UpdateGlassesView.as_view(), name="update-glasses"),
     path("<int:glasses_id>/delete/", DeleteGlassesView.as_view(), name="delete-glasses"),
     path('smart-recommend/', SmartRecommendEndpoint.as_view(), name='smart_recommend'),
+    path('analyze-and-recommend/', AnalyzeAndRecommendView.as_view(), name='analyze-and-recommend'),
 ]
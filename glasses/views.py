@@ -3,14 +3,24 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
 from .serializers import GlassesSerializer, GlassesDetailSerializer, GlassesUpdateSerializer, GlassesRecommendationSerializer, GlassesCreateSerializer
 from rest_framework.generics import ListAPIView, RetrieveAPIView
-from django.db.models import Q, Count
 from typing import List, Tuple, Optional
 from django.db import transaction
 from glasses.models import Glasses, Purpose, GlassesPurpose, GlassesImage
 import json
-from rest_framework.exceptions import PermissionDenied
-from face.kbs_engine import GlassesRecommender
+import numpy as np
+from rest_framework.exceptions import APIException, PermissionDenied, ValidationError
+from django.shortcuts import get_object_or_404
+from face.kbs_engine import glasses_recommender
+from face.models import FaceAnalysis
 from rest_framework import generics, permissions, status
+from face.cache import cached_analysis, CACHE_HEADER
+from face.pipeline import analyze_image, FaceAnalysisError
+from face.timing import StageTimer, report, stage
+from face.views import save_analyses
+from .buckets import bucket_ranking
+from .index import get_catalog, hydrate
+from .pagination import RankingCursorPagination
+from .recommend import Ranking
 
 
 WEIGHT_RANGES = {
@@ -19,6 +29,22 @@ WEIGHT_RANGES = {
 }
 
 
+def get_user_analysis(request, data=None):
+    """
+    FaceAnalysis المحفوظة من analysis_id في الطلب (لنفس المستخدم فقط)، أو None إن لم تُرسل.
+    data: مصدر المعاملات (request.data افتراضيًا؛ query_params لطلبات GET).
+    يرفع ValidationError / Http404 فيعيد DRF الخطأ المناسب.
+    """
+    analysis_id = (request.data if data is None else data).get("analysis_id")
+    if analysis_id in (None, ""):
+        return None
+    try:
+        analysis_id = int(analysis_id)
+    except (TypeError, ValueError):
+        raise ValidationError({"analysis_id": "analysis_id must be an integer"})
+    return get_object_or_404(FaceAnalysis, pk=analysis_id, user=request.user)
+
+
 class Upload3DModelView(APIView):
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [permissions.IsAuthenticated]  # 🔒 لازم توكن
@@ -94,11 +120,15 @@ class GlassesDetailView(RetrieveAPIView):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
 
-        similar_glasses = Glasses.objects.filter(
-            shape=instance.shape,
-            gender=instance.gender,
-            size=instance.size
-        ).exclude(id=instance.id)[:5]
+        # من فهرس الكتالوج بدل مسح الجدول: أول 5 بنفس الشكل والجنس والمقاس
+        catalog = get_catalog()
+        mask = (
+            catalog.category_match("shape", lambda c: c == instance.shape)
+            & catalog.category_match("gender", lambda c: c == instance.gender)
+            & catalog.category_match("size", lambda c: c == instance.size)
+            & (catalog.ids != instance.id)
+        )
+        similar_glasses = hydrate(catalog.ids[mask][:5])
 
         similar_serializer = GlassesSerializer(similar_glasses, many=True, context={"request": request})
 
@@ -133,9 +163,14 @@ class GlassesByMaterialFormDataView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class SmartFilterPagination(RankingCursorPagination):
+    page_size = 100
+
+
 class GlassesSmartFilterView(APIView):
     parser_classes = (JSONParser, FormParser, MultiPartParser)
     permission_classes = [permissions.IsAuthenticated]  # 🔒 لازم توكن
+    pagination_class = SmartFilterPagination
 
     def _qgetlist(self, obj, key: str) -> List[str]:
         if hasattr(obj, "getlist"):
@@ -174,9 +209,16 @@ class GlassesSmartFilterView(APIView):
         return out
 
     def _extract_str(self, request, key: str) -> str:
-        v = request.data.get(key, "")
+        # روابط next/previous تحمل الفلاتر في query string
+        v = request.data.get(key, request.query_params.get(key, ""))
         return v.strip() if isinstance(v, str) else ""
 
+    @staticmethod
+    def _any_of(values):
+        # نفس مقارنة MySQL (collation بدون حالة الأحرف) التي كانت تجريها فلاتر __in
+        wanted = {str(v).lower() for v in values}
+        return lambda c: c.lower() in wanted
+
     def _gender_values(self, g: str):
         if not g: return None
         g = g.strip()
@@ -203,34 +245,59 @@ class GlassesSmartFilterView(APIView):
         purpose_names = self._extract_list(request, "purposes")
         purpose_ids   = [int(x) for x in self._extract_list(request, "purpose_ids") if str(x).isdigit()]
 
-        qs = Glasses.objects.all()
-        g_vals = self._gender_values(gender)
-        if g_vals:
-            qs = qs.filter(gender__in=g_vals)
-        if shapes:
-            qs = qs.filter(shape__in=shapes)
-        if size:
-            qs = qs.filter(size__iexact=size)
-        if tone:
-            qs = qs.filter(tone__iexact=tone)
-        if colors:
-            qs = qs.filter(color__in=colors)
-        w_range = self._weight_range(weight_pref)
-        if w_range:
-            lo, hi = w_range
-            if lo is not None: qs = qs.filter(weight__gt=lo)
-            if hi is not None: qs = qs.filter(weight__lte=hi)
-        if weight_pref not in ("", "Doesn't matter") and materials:
-            qs = qs.filter(material__in=materials)
-        if purpose_names and not purpose_ids:
-            purpose_ids = list(Purpose.objects.filter(name__in=purpose_names).values_list("id", flat=True))
-        if purpose_ids:
-            qs = (qs.filter(purposes__in=purpose_ids)
-                    .annotate(purpose_match_count=Count("purposes", filter=Q(purposes__in=purpose_ids), distinct=True))
-                    .filter(purpose_match_count=len(set(purpose_ids))))
-
-        data = GlassesSerializer(qs, many=True, context={"request": request}).data
-        return Response({"count": len(data), "results": data}, status=status.HTTP_200_OK)
+        def rank():
+            # الفلترة على فهرس الكتالوج (بدون SQL)؛ كل المطابقين بنفس الدرجة فالترتيب حسب id
+            catalog = get_catalog()
+            mask = np.ones(len(catalog), dtype=bool)
+            g_vals = self._gender_values(gender)
+            if g_vals:
+                mask &= catalog.category_match("gender", self._any_of(g_vals))
+            if shapes:
+                mask &= catalog.category_match("shape", self._any_of(shapes))
+            if size:
+                mask &= catalog.category_match("size", self._any_of([size]))
+            if tone:
+                mask &= catalog.category_match("tone", self._any_of([tone]))
+            if colors:
+                mask &= catalog.category_match("color", self._any_of(colors))
+            w_range = self._weight_range(weight_pref)
+            if w_range:
+                lo, hi = w_range
+                weight = catalog.numeric["weight_value"]     # NaN (فارغ) لا يحقق أي مقارنة، كـ NULL
+                if lo is not None: mask &= weight > lo
+                if hi is not None: mask &= weight <= hi
+            if weight_pref not in ("", "Doesn't matter") and materials:
+                mask &= catalog.category_match("material", self._any_of(materials))
+            ids = purpose_ids
+            if purpose_names and not ids:
+                ids = list(Purpose.objects.filter(name__in=purpose_names).values_list("id", flat=True))
+            if ids:
+                # كل الأغراض المطلوبة يجب أن تكون موجودة ومرتبطة بالنظارة
+                names = list(Purpose.objects.filter(id__in=ids).values_list("name", flat=True))
+                if len(names) < len(set(ids)) or any(n not in catalog.purpose_bits for n in names):
+                    mask[:] = False
+                else:
+                    required = catalog.purpose_mask(names)
+                    mask &= ((catalog.purposes & required) == required).all(axis=1)
+            matched = np.sort(catalog.ids[mask])
+            return Ranking(matched, np.ones(len(matched), dtype=np.int64), None, 0, presorted=True)
+
+        # الصفحة فقط تُقرأ من القاعدة وتُسلسل (لا قائمة IN بحجم الكتالوج)؛ الفلاتر في روابط
+        # next/previous فيعاد الفلترة بـ GET إن انتهت اللقطة
+        link_params = {key: value for key, value in (
+            ("gender", gender), ("shapes", shapes), ("size", size), ("tone", tone), ("colors", colors),
+            ("weight_preference", weight_pref), ("materials", materials),
+            ("purposes", purpose_names), ("purpose_ids", purpose_ids),
+        ) if value}
+        paginator = self.pagination_class(link_params)
+        page = paginator.paginate_ranking(request, rank, scope="smart-filter")
+        data = GlassesSerializer(page, many=True, context={"request": request}).data
+        return Response({
+            "count": paginator.count,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "results": data,
+        }, status=status.HTTP_200_OK)
 
     def get(self, request, *args, **kwargs):
         return self.post(request, *args, **kwargs)
@@ -268,15 +335,20 @@ class MyStoreGlassesView(ListAPIView):
 
 class RecommendGlassesByFaceShapeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RankingCursorPagination
 
     def post(self, request):
-        face_shape = request.data.get("face_shape")
+        # analysis_id: شكل الوجه من تحليل محفوظ بدل إرساله من العميل
+        analysis = get_user_analysis(request)
+        face_shape = analysis.face_shape if analysis else request.data.get("face_shape")
         if not face_shape:
             return Response({"error": "face_shape is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 🧠 شغل الـ Expert System فقط بالـ face_shape
-        engine = GlassesRecommender()
-        rec = engine.run_engine(face_shape=face_shape)
+        # 🧠 شغل الـ Expert System (النسخة المترجمة) فقط بالـ face_shape
+        try:
+            rec = glasses_recommender.run_engine(face_shape=face_shape)
+        except ValueError:
+            return Response({"error": "face_shape must be a string"}, status=status.HTTP_400_BAD_REQUEST)
 
 
         recommended_shapes = rec.get("recommended_shape", [])
@@ -286,14 +358,17 @@ class RecommendGlassesByFaceShapeView(APIView):
                 "results": []
             }, status=status.HTTP_200_OK)
 
-        # 🕶️ استعلام النظارات المناسبة
-        qs = Glasses.objects.filter(shape__in=recommended_shapes)
-        serializer = GlassesSerializer(qs, many=True, context={"request": request})
+        # 🕶️ النظارات المناسبة: صف واحد من جدول الترتيب المحسوب مسبقًا (كلها بنفس الدرجة فالترتيب حسب id)
+        paginator = self.pagination_class()
+        page = paginator.paginate_ranking(request, lambda: bucket_ranking(face_shape), scope="face-shape")
+        serializer = GlassesSerializer(page, many=True, context={"request": request})
 
         return Response({
             "face_shape": face_shape,
             "recommended_shapes": recommended_shapes,
-            "count": qs.count(),
+            "count": paginator.count,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
             "results": serializer.data
         }, status=status.HTTP_200_OK)
 
@@ -350,69 +425,143 @@ class DeleteGlassesView(generics.DestroyAPIView):
     
 # glasses/views.py
 from .serializers import GlassesSerializer
-from .kbs import SmartRecommenderKBS, GlassesFact, AnalysisResult, UserPreference, RecommendationScore, compute_max_possible_score
+from .recommend import (
+    analysis_from_payload, analysis_from_request, cached_ranking, hard_constraints, preference_params, user_preferences,
+)
 
 class IsCustomer(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.role == "customer"
     
+class SmartRecommendPagination(RankingCursorPagination):
+    # الصفحة الأولى بنفس حجم النتيجة قبل الترقيم (أعلى 100)
+    page_size = 100
+
+
 class SmartRecommendEndpoint(APIView):
     permission_classes = [IsCustomer]
+    pagination_class = SmartRecommendPagination
 
     def post(self, request):
+        # analysis_id: shapes/size/tone من تحليل محفوظ، بدون إعادة رفع الصورة
+        saved_analysis = get_user_analysis(request)
+        # hard_constraints: gender/lightweight/material/store تستبعد قبل التقييم
+        constraints = hard_constraints(request.data)
+        explain = str(request.data.get("explain", request.query_params.get("explain", ""))).lower() in ("1", "true", "yes")
         try:
             user_input = request.data
-            analysis = {
-                "recommended_shapes": user_input.get("shapes", []),
-                "recommended_size": user_input.get("size","N/A"),
-                "recommended_tone": user_input.get("tone","N/A"),
-            }
-            user_prefs = []
-            if user_input.get("gender"):
-                user_prefs.append({"category":"gender","value":user_input["gender"]})
-            if user_input.get("purposes"):
-                user_prefs.append({"category":"purpose","value":user_input["purposes"]})
-            if user_input.get("weight_preference"):
-                user_prefs.append({"category":"weight_pref","value":"lightweight"})
-            for m in user_input.get("materials",[]):
-                user_prefs.append({"category":"material_pref","value":m})
-
-            max_score = compute_max_possible_score(user_prefs)
-
-            # ORM query
-            glasses_qs = Glasses.objects.select_related("store").prefetch_related("purposes","images")
-
-            # Run engine
-            engine = SmartRecommenderKBS()
-            engine.reset()
-            engine.declare(AnalysisResult(**analysis))
-            for pref in user_prefs: engine.declare(UserPreference(**pref))
-            for g in glasses_qs:
-                tags = list(g.purposes.values_list("name", flat=True))
-                weight_val = int(round(float(g.weight))) if g.weight else 999
-                engine.declare(GlassesFact(
-                    frame_id=g.id, shape=g.shape, material=g.material,
-                    size=g.size, gender=g.gender, tone=g.tone,
-                    color=g.color, weight=weight_val, style_tags=tags
-                ))
-            engine.run()
-
-            # Collect
-            enriched = []
-            for fact in engine.facts.values():
-                if isinstance(fact, RecommendationScore) and fact['score'] > 0:
-                    g = glasses_qs.get(id=fact['frame_id'])
-                    g.score = fact['score']
-                    g.match_percentage = round((fact['score']/max_score)*100,1) if max_score else 0
-                    g.reasons = list(fact['reasons'])
-                    enriched.append(g)
-
-            enriched.sort(key=lambda x: x.score, reverse=True)
-            serializer = GlassesRecommendationSerializer(enriched[:100], many=True, context={"request": request})
-            return Response({
-                "max_possible_score": max_score,
-                "count": len(enriched),
+            analysis = analysis_from_request(saved_analysis.recommendation_input() if saved_analysis else user_input)
+            # الترتيب من كاش النتائج (نفس التفضيلات والقيود ونسخة الكتالوج) أو بالتقييم؛ الصفحات
+            # التالية من نفس النتيجة المخزنة. "favorite" يُضاف عند التسلسل لكل مستخدم
+            paginator = self.pagination_class()
+            page = paginator.paginate_ranking(
+                request,
+                lambda: cached_ranking(analysis, user_preferences(user_input), constraints, explain),
+                scope="smart-recommend",
+            )
+            serializer = GlassesRecommendationSerializer(page, many=True, context={"request": request})
+            data = {
+                "max_possible_score": paginator.ranking.max_score,
+                "count": paginator.count,
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
                 "results": serializer.data
-            })
+            }
+            if explain:
+                # المستبعدون في كل مرحلة (None في الصفحات التالية: تُقرأ من اللقطة بدون تقييم)
+                data["explain"] = paginator.ranking.stages
+            return Response(data)
+        except APIException:
+            raise
         except Exception as e:
             return Response({"detail":f"Internal error: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AnalyzeAndRecommendPagination(RankingCursorPagination):
+    page_size = 20
+
+
+def analysis_ranking(face_shape, analysis, user_prefs):
+    """ترتيب analyze-and-recommend: بدون تفضيلات من صف RecommendationBucket، وإلا كما في smart-recommend."""
+    if user_prefs:
+        return cached_ranking(analysis, user_prefs)
+    # الترتيب محسوب مسبقًا لمخرجات التحليل (قراءة صف واحد)
+    return bucket_ranking(face_shape, analysis["recommended_size"], analysis["recommended_tone"])
+
+
+class AnalyzeAndRecommendView(APIView):
+    """
+    analyze-face ثم smart-recommend في طلب واحد: نتيجة خط الوجه تمر مباشرة لتقييم الكتالوج
+    داخل نفس العملية. أزمنة المراحل (decode, facemesh, ..., catalog, scoring, serialize)
+    في هيستوغرام /api/face/metrics/ وفي Server-Timing عند تفعيله.
+
+    POST يعيد الصفحة الأولى مع analysis_id ومؤشر (cursor). الصفحات التالية بدون إعادة رفع
+    الصورة: GET على نفس النقطة برابط next (?cursor=...&analysis_id=... + التفضيلات)، أو
+    smart-recommend/?cursor=... مع {"analysis_id": ...}. اللقطة مشتركة بين النقطتين.
+    """
+    permission_classes = [IsCustomer]
+    pagination_class = AnalyzeAndRecommendPagination
+    # نفس لقطات smart-recommend: مؤشر هذه النقطة يُقرأ هناك أيضًا
+    snapshot_scope = "smart-recommend"
+
+    def post(self, request):
+        file = request.FILES.get("image")
+        if not file:
+            return Response({"error": "No image uploaded"}, status=status.HTTP_400_BAD_REQUEST)
+
+        timer = StageTimer()
+        with timer.activate():
+            try:
+                payload, hit = cached_analysis(file.read(), analyze_image)
+            except FaceAnalysisError as e:
+                response = Response({"error": e.message, "code": e.code}, status=e.status_code)
+                return report(timer, response, "analyze-and-recommend")
+            # إصابة الكاش = نفس الصورة مرة أخرى: analysis_id المحفوظ سابقًا بدل صف مكرر
+            [payload] = save_analyses(request, [payload], reuse=hit)
+
+            params = preference_params(request.data)
+            analysis = analysis_from_payload(payload)
+            data = self.paginate(
+                request, payload.get("analysis_id"), params,
+                lambda: analysis_ranking(payload["face_shape"], analysis, user_preferences(params)),
+            )
+
+        response = Response({"analysis": payload, **data}, status=status.HTTP_200_OK)
+        response[CACHE_HEADER] = "HIT" if hit else "MISS"
+        return report(timer, response, "analyze-and-recommend")
+
+    def get(self, request):
+        timer = StageTimer()
+        with timer.activate():
+            # المؤشر وحده يكفي ما دامت اللقطة موجودة؛ التحليل المحفوظ والتفضيلات لإعادة التقييم بعدها
+            saved = get_user_analysis(request, request.query_params)
+            params = preference_params(request.query_params)
+
+            def rank():
+                if saved is None:
+                    raise ValidationError({"analysis_id": "analysis_id is required without a valid cursor"})
+                analysis = analysis_from_request(saved.recommendation_input())
+                return analysis_ranking(saved.face_shape, analysis, user_preferences(params))
+
+            data = self.paginate(request, saved.id if saved else None, params, rank)
+        return report(timer, Response(data, status=status.HTTP_200_OK), "analyze-and-recommend")
+
+    def paginate(self, request, analysis_id, params, rank):
+        """
+        params: حقول التفضيلات كما وصلت؛ تدخل روابط next/previous مع analysis_id فيكفي GET
+        لإعادة التقييم إن انتهت اللقطة. rank لا تُستدعى إن وُجدت لقطة المؤشر.
+        """
+        link_params = {**params, "analysis_id": analysis_id} if analysis_id else params
+        paginator = self.pagination_class(link_params)
+        page = paginator.paginate_ranking(request, rank, scope=self.snapshot_scope)
+        with stage("serialize"):
+            results = GlassesRecommendationSerializer(page, many=True, context={"request": request}).data
+        return {
+            "analysis_id": analysis_id,
+            "max_possible_score": paginator.ranking.max_score,
+            "count": paginator.count,
+            "cursor": paginator.get_next_cursor(),
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "results": results,
+        }